@@ -1,3 +1,9 @@
 
+from .continuum import ContinuumModel
+from .masks import SpectralMask
 from .snt import normalize_spectra
-from .snt_interfaces import normalize_sBART_object
+from .bootstrap import bootstrap_continuum
+from .snt_interfaces import normalize_sBART_frames, normalize_sBART_object
+from .store import OrderStore
+from .snt_async import anormalize_batch, anormalize_spectra
+from .utils.logs import configure_logging
@@ -1,9 +1,10 @@
 import math
-from collections import deque
+import time
 
 import numpy as np
 
-from SNT import penalty, smooth
+from SNT import penalty
+from SNT.utils.exceptions import BudgetExceeded
 
 
 def angle(Cx, Cy, Px, Py, r):
@@ -13,10 +14,43 @@ def angle(Cx, Cy, Px, Py, r):
         return -math.asin((Cy - Py) / r) + math.pi
 
 
+def scaled_coordinates(max_index, ys, xs, min_lambda, max_lambda, min_flux, max_flux, w_stretch):
+    # wavelengths and normalized flux (see smooth.normalize) of the maxima, computed once, as plain floats
+    q = (max_lambda - min_lambda) / (max_flux - min_flux)
+    max_x = [float(xs[index]) for index in max_index]
+    max_y = (np.asarray(ys)[np.asarray(max_index, dtype=int)] * q * (1 / w_stretch)).tolist()
+    return max_x, max_y
+
+
+def closest_distance(Px, Py, Pidx, max_x, max_y):
+    # distance from P to the closest maxima on its right (ignoring duplicates of P), inf if there is none
+    closest = math.inf
+    for i in range(Pidx + 1, len(max_x)):
+        Nx = max_x[i]
+        if Nx - Px >= closest:  # points further away can't be closer
+            break
+        d = math.hypot(Px - Nx, Py - max_y[i])
+        if d != 0:
+            closest = min(closest, d)
+    return closest
+
+
 def anchors(
-    max_index, ys, xs, p_ys, p_xs, min_lambda, r_min, r_max, nu, use_pmap, global_stretch
+    max_index,
+    ys,
+    xs,
+    p_ys,
+    p_xs,
+    min_lambda,
+    r_min,
+    r_max,
+    nu,
+    use_pmap,
+    global_stretch,
+    max_iterations=None,
+    deadline=None,
 ):  # Calculates the anchor points in the alpha hull
-    w_stretch = global_stretch
+    # max_iterations (number of anchors) and deadline (time.monotonic value) limit the search, raising BudgetExceeded
     max_lambda = max(xs)
     min_flux = min(ys)
     max_flux = max(ys)
@@ -24,65 +58,135 @@ def anchors(
         math.sqrt(pow(max_lambda, 2) + pow(max_flux, 2)) * global_stretch
     )  # <--adjusted to reflect stretching
 
-    P = np.array(
-        [xs[max_index[0]], smooth.normalize(ys[max_index[0]], min_lambda, max_lambda, min_flux, max_flux, w_stretch)]
-    )
+    # All the geometry is done with scalars, over the (pre-scaled) coordinates of the maxima
+    max_x, max_y = scaled_coordinates(max_index, ys, xs, min_lambda, max_lambda, min_flux, max_flux, global_stretch)
+    Px, Py = max_x[0], max_y[0]
     Pidx = 0  # index in the max_index array of current anchor
     l = len(max_index)  # total number of points
-    anchors_x = []  # list of anchor points
-    anchors_y = []  # list of values
-    anchors_index = []  # index of anchor points in original arrays
-
-    anchors_x.append(xs[max_index[0]])
-    anchors_y.append(ys[max_index[0]])
-    anchors_index.append(max_index[0])
+    anchors_x = [xs[max_index[0]]]  # list of anchor points
+    anchors_y = [ys[max_index[0]]]  # list of values
+    anchors_index = [max_index[0]]  # index of anchor points in original arrays
 
     if use_pmap:  # noqa: SIM108
-        r = penalty.r_map(
-            xs[max_index[0]], p_ys, p_xs, min_lambda, r_min, r_max, nu
-        )  # radius adjusted acording to penalty map
+        r = penalty.r_map(Px, p_ys, p_xs, min_lambda, r_min, r_max, nu)  # radius adjusted acording to penalty map
     else:
         r = r_min
+    iterations = 0
     while True:
-        M = deque()  # list of index of candidate points
-        A = []  # list of angles and index of candidate points
+        iterations += 1
+        if max_iterations is not None and iterations > max_iterations:
+            msg = f"Alpha shape search exceeded {max_iterations} iterations"
+            raise BudgetExceeded(msg)
+        if deadline is not None and time.monotonic() > deadline:
+            msg = "Alpha shape search exceeded its time budget"
+            raise BudgetExceeded(msg)
+
+        M = []  # list of index of candidate points
+
+        # Instead of scanning the maxima for every (failed) radius, grow the radius until the closest maxima fits
+        # inside the circle. Gives the same radius (and stopping point) as the scans, without the empty scans
+        closest = closest_distance(Px, Py, Pidx, max_x, max_y)
+        if math.isinf(closest):  # no maxima left
+            return anchors_x, anchors_y, anchors_index
+        while not closest < 2 * r:
+            r = 1.5 * r
+            if Px + (2 * r) > furthest_point:
+                return anchors_x, anchors_y, anchors_index
+
         while not M:
             for i in range(Pidx + 1, l):  # test all points to the right of P
-                Nx = xs[max_index[i]]
-                Ny = smooth.normalize(ys[max_index[i]], min_lambda, max_lambda, min_flux, max_flux, w_stretch)
-                if Nx > P[0] + (2 * r):  # if x>Px+(2*r) further points are outside
+                Nx = max_x[i]
+                if Nx > Px + (2 * r):  # if x>Px+(2*r) further points are outside
                     break
-                d = np.linalg.norm(P - np.array([Nx, Ny]))
-                if d < 2 * r and (P[0] != Nx or P[1] != Ny):  # second condition to avoid duplicate points
+                Ny = max_y[i]
+                dx = Px - Nx
+                dy = Py - Ny
+                d = math.sqrt(dx * dx + dy * dy)
+                if d < 2 * r and (Px != Nx or Py != Ny):  # second condition to avoid duplicate points
                     M.append(i)  # save index of those inside the circ
             r = 1.5 * r
-            if P[0] + (2 * r) > furthest_point:  # stop searching for points and return anchors list
+            if Px + (2 * r) > furthest_point:  # stop searching for points and return anchors list
                 return anchors_x, anchors_y, anchors_index
         r = r / 1.5
-        while M:  # for all points in M, compute the angle
-            Nidx = M.popleft()
-            delta = np.array(
-                [
-                    xs[max_index[Nidx]] - P[0],
-                    smooth.normalize(ys[max_index[Nidx]], min_lambda, max_lambda, min_flux, max_flux, w_stretch) - P[1],
-                ]
-            )
-            delta_norm = math.sqrt((delta[0] ** 2) + (delta[1] ** 2))
-            delta_inv = np.array([-delta[1], delta[0]])
+
+        min_idx = None
+        min_angle = None
+        for Nidx in M:  # for all points in M, compute the angle (of the circle through P and N) and keep the min
+            dx = max_x[Nidx] - Px
+            dy = max_y[Nidx] - Py
+            delta_norm = math.sqrt((dx**2) + (dy**2))
             h = math.sqrt((r**2) - ((delta_norm**2) / 4))
-            C = P + (0.5 * delta) + ((h / delta_norm) * delta_inv)
-            A.append([Nidx, angle(C[0], C[1], P[0], P[1], r)])  # save index and angle in A
+            Cx = Px + (0.5 * dx) + ((h / delta_norm) * -dy)
+            Cy = Py + (0.5 * dy) + ((h / delta_norm) * dx)
+            Nangle = angle(Cx, Cy, Px, Py, r)
+            if min_idx is None or Nangle < min_angle:
+                min_idx, min_angle = Nidx, Nangle
 
-        min_val = min(A, key=lambda v: v[1])  # select the min angle
-        min_idx = min_val[0]
         # print(P[0], P[1], max_pos[min_idx], max_heights[min_idx], "radius", r)
-        P[0] = xs[max_index[min_idx]]  # update P to be the newly selected point
-        P[1] = smooth.normalize(ys[max_index[min_idx]], min_lambda, max_lambda, min_flux, max_flux, w_stretch)
+        Px, Py = max_x[min_idx], max_y[min_idx]  # update P to be the newly selected point
         Pidx = min_idx
         if use_pmap:  # update radius
-            r = penalty.r_map(P[0], p_ys, p_xs, min_lambda, r_min, r_max, nu)
+            r = penalty.r_map(Px, p_ys, p_xs, min_lambda, r_min, r_max, nu)
         else:
             r = r_min
-        anchors_x.append(P[0])  # save point coordinates in anchors list
+        anchors_x.append(Px)  # save point coordinates in anchors list
         anchors_y.append(ys[max_index[min_idx]])
         anchors_index.append(max_index[min_idx])
+
+
+def coarse_to_fine_maxima(
+    max_index,
+    coarse_index,
+    ys,
+    xs,
+    p_ys,
+    p_xs,
+    min_lambda,
+    r_min,
+    r_max,
+    nu,
+    use_pmap,
+    global_stretch,
+    refine_distance,
+    max_iterations=None,
+    deadline=None,
+):  # Selects the maxima that are close to the anchors of a (coarse) alpha hull
+    """Reduce the candidate maxima to the ones close to the anchors found over a coarse set of points.
+
+    The alpha shape is first computed over the coarse points (e.g. the rolling maximum of the spectra) and only the
+    maxima that are within refine_distance (in wavelength) of one of the coarse anchors (and the first and last
+    maxima) are kept.
+
+    Returns:
+        np.ndarray: Indices of the maxima that should be used in the final search
+    """
+    _, _, coarse_anchors = anchors(
+        coarse_index, ys, xs, p_ys, p_xs, min_lambda, r_min, r_max, nu, use_pmap, global_stretch, max_iterations, deadline
+    )
+    xs = np.asarray(xs)
+    max_index = np.asarray(max_index)
+    anchors_x = xs[coarse_anchors]
+    max_x = xs[max_index]
+
+    # distance of each maxima to the closest coarse anchor
+    position = np.searchsorted(anchors_x, max_x)
+    left = anchors_x[np.clip(position - 1, 0, anchors_x.size - 1)]
+    right = anchors_x[np.clip(position, 0, anchors_x.size - 1)]
+    distance = np.minimum(np.abs(max_x - left), np.abs(max_x - right))
+    selected = distance <= refine_distance
+    # keep the edges, so that the continuum spans the same interval as the full search
+    selected[[0, -1]] = True
+    return max_index[selected]
+
+
+def envelope_excess(max_index, ys, xs, anchors_x, anchors_y) -> float:
+    """Largest relative height of the maxima above the (linear) continuum of the anchors.
+
+    The full search leaves no maxima above its continuum, so this is an estimate of how far the continuum of the
+    coarse-to-fine search is from the full one (it is a lower bound of the difference at the maxima).
+    """
+    max_index = np.asarray(max_index, dtype=int)
+    max_y = np.asarray(ys, dtype=np.float64)[max_index]
+    continuum = np.interp(np.asarray(xs)[max_index], anchors_x, anchors_y)
+    return float(np.max(max_y / continuum - 1, initial=0))
+
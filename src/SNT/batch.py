@@ -0,0 +1,192 @@
+"""Batched preprocessing of all spectral orders, operating on the (n_orders, n_pixels) block at once.
+
+Gives the same results as running :py:func:`SNT.snt.preprocess_row` (followed by the search of the maxima) over each
+order. The rows of the block are left-aligned: after each stage that removes pixels, the pixels that are kept are
+packed at the start of the row and the remaining entries are padding (NaN), with the length of each row tracked
+separately. The orders are grouped by their window sizes, which only differ in the adaptive mode.
+"""
+
+from __future__ import annotations
+
+import math
+from collections import defaultdict
+
+import numpy as np
+from scipy.ndimage import convolve1d
+from scipy.signal import find_peaks, savgol_coeffs, savgol_filter
+
+from SNT.utils.SNT_configs import SNTConfig
+
+SAVGOL_POLYORDER = 3
+
+
+def preprocess_orders(wavelengths, spectra, FWHM, config: SNTConfig) -> list[tuple | None]:  # noqa: N803
+    """Clean and smooth all orders and find their maxima.
+
+    Args:
+        wavelengths: 2D array with the wavelengths of each order
+        spectra: 2D array with the flux of each order
+        FWHM: FWHM, in km/s
+        config (SNTConfig): SNT configuration
+
+    Returns:
+        list[tuple | None]: For each order, the clipped wavelengths, the clipped (and smoothed) flux, the smallest
+        wavelength, the FWHM in Angstrom and the indices of the maxima. None for the orders that can't be processed in
+        the batch (e.g. without valid pixels), which have to go through the per-order path.
+
+    """
+    # imported here to avoid a circular import
+    from SNT.snt import order_windows
+
+    preprocessed = [None] * len(spectra)
+    if config.max_vicinity < 1:
+        # find_peaks raises an error, which is only reported in the per-order path
+        return preprocessed
+
+    wavelengths = np.asarray(wavelengths)[:, config.remove_n_first :]
+    flux = np.ma.masked_equal(np.asarray(spectra)[:, config.remove_n_first :], 0)
+    wavelengths = np.ma.array(wavelengths, mask=np.ma.getmaskarray(flux))
+    lengths = flux.count(axis=1)
+
+    groups = defaultdict(list)
+    for row, length in enumerate(lengths):
+        if length == 0:
+            continue
+        FWHM_WL, clip_window, savgol_window = order_windows(wavelengths[row].compressed(), FWHM, config.adaptive_windows)
+        groups[(clip_window, savgol_window)].append((row, FWHM_WL))
+
+    min_lambda = wavelengths.min(axis=1)
+    for (clip_window, savgol_window), members in groups.items():
+        rows = [row for row, _ in members]
+        valid = ~np.ma.getmaskarray(flux[rows])
+        group_flux = flux.data[rows]
+        group_wavelengths = wavelengths.data[rows]
+
+        for _ in range(2):
+            group_flux, group_wavelengths, valid = rolling_sigma_clip(group_flux, group_wavelengths, valid, clip_window)
+        group_flux = group_flux.astype(config.dtype, copy=False)
+        group_lengths = valid.sum(axis=1)
+
+        if config.usefilter:
+            group_flux = savgol_rows(group_flux, group_lengths, savgol_window)
+        maxima = find_maxima(group_flux, group_lengths, config.max_vicinity)
+
+        for (row, FWHM_WL), values, waves, length, max_index in zip(
+            members, group_flux, group_wavelengths, group_lengths, maxima
+        ):
+            if config.usefilter and length < savgol_window:
+                # savgol_filter raises an error, which is only reported in the per-order path
+                continue
+            preprocessed[row] = (waves[:length].tolist(), values[:length].copy(), min_lambda[row], FWHM_WL, max_index)
+    return preprocessed
+
+
+def _pack(values: np.ndarray, keep: np.ndarray) -> np.ndarray:
+    """Move the kept entries of each row to its start, preserving their order. The rest is NaN."""
+    order = np.argsort(~keep, axis=1, kind="stable")
+    packed = np.take_along_axis(values, order, axis=1)
+    packed[np.arange(values.shape[1]) >= keep.sum(axis=1, keepdims=True)] = np.nan
+    return packed
+
+
+def rolling_sigma_clip(flux: np.ndarray, wavelengths: np.ndarray, valid: np.ndarray, w_size: int):
+    """Batched version of :py:func:`SNT.smooth.rolling_sigma_clip`.
+
+    The windows are consecutive blocks of w_size valid pixels, with a shorter one at the end of each row.
+
+    Args:
+        flux (np.ndarray): 2D array with the flux of each order
+        wavelengths (np.ndarray): 2D array with the wavelengths of each order
+        valid (np.ndarray): Boolean array, True in the pixels that are used
+        w_size (int): Number of pixels in each window
+
+    Returns:
+        tuple: packed flux, wavelengths and valid pixels, after the clip
+
+    """
+    flux = _pack(flux, valid)
+    wavelengths = _pack(wavelengths, valid)
+    lengths = valid.sum(axis=1)
+    n_rows, n_pixels = flux.shape
+
+    n_windows = math.ceil(n_pixels / w_size)
+    padded = np.full((n_rows, n_windows * w_size), np.nan, dtype=flux.dtype)
+    padded[:, :n_pixels] = flux
+    windows = padded.reshape(n_rows, n_windows, w_size)
+    q75, q25 = np.percentile(windows, [75, 25], axis=2)
+    upper = q75 + 1.5 * (q75 - q25)
+
+    # the last window of each row is only partially filled
+    for row, length in enumerate(lengths):
+        window, remainder = divmod(length, w_size)
+        if remainder:
+            q75_row, q25_row = np.percentile(windows[row, window, :remainder], [75, 25])
+            upper[row, window] = q75_row + (1.5 * (q75_row - q25_row))
+
+    inside = np.arange(n_pixels) < lengths[:, np.newaxis]
+    keep = ~(windows > upper[..., np.newaxis]).reshape(n_rows, -1)[:, :n_pixels] & inside
+    return _pack(flux, keep), _pack(wavelengths, keep), np.arange(n_pixels) < keep.sum(axis=1, keepdims=True)
+
+
+def savgol_rows(flux: np.ndarray, lengths: np.ndarray, window: int) -> np.ndarray:
+    """Savgol filter (mode "interp") of each packed row, along axis 1.
+
+    The inner pixels come from one convolution of the full block, while the polynomial fits at the edges are done
+    for each row (on its last pixels, which are not aligned between rows).
+    """
+    smoothed = convolve1d(flux, savgol_coeffs(window, SAVGOL_POLYORDER), axis=1, mode="constant")
+    half = window // 2
+    for row, length in enumerate(lengths):
+        if length < window:
+            continue
+        smoothed[row, :half] = savgol_filter(flux[row, :window], window, SAVGOL_POLYORDER)[:half]
+        right_edge = savgol_filter(flux[row, length - window : length], window, SAVGOL_POLYORDER)
+        smoothed[row, length - half : length] = right_edge[window - half :]
+    return smoothed
+
+
+def find_maxima(flux: np.ndarray, lengths: np.ndarray, distance: int) -> list[np.ndarray]:
+    """Indices of the maxima of each packed row, the same as ``find_peaks(row, height=0, distance=distance)``.
+
+    The strict local maxima of the full block are found at once. The rows with flat maxima (or NaNs) fall back to
+    find_peaks, and only the maxima that are closer than distance to another one go through the (sequential)
+    selection by height.
+    """
+    inner = flux[:, 1:-1]
+    candidates = (flux[:, :-2] < inner) & (inner > flux[:, 2:]) & (inner >= 0)
+    inside = np.arange(flux.shape[1]) < lengths[:, np.newaxis]
+    irregular = ((flux[:, 1:] == flux[:, :-1]) & inside[:, 1:]).any(axis=1) | (np.isnan(flux) & inside).any(axis=1)
+
+    maxima = []
+    for row, length in enumerate(lengths):
+        if irregular[row] or length < 3:
+            maxima.append(find_peaks(flux[row, :length], height=0, distance=distance)[0])
+        else:
+            peaks = np.flatnonzero(candidates[row]) + 1
+            maxima.append(_select_by_distance(flux[row], peaks, distance))
+    return maxima
+
+
+def _select_by_distance(values: np.ndarray, peaks: np.ndarray, distance: int) -> np.ndarray:
+    distance = math.ceil(distance)
+    gaps = np.diff(peaks)
+    crowded = np.zeros(peaks.size, dtype=bool)
+    crowded[:-1] |= gaps < distance
+    crowded[1:] |= gaps < distance
+    if not crowded.any():
+        return peaks
+
+    # same as scipy: starting from the highest maxima, remove the neighbours that are too close
+    keep = np.ones(peaks.size, dtype=bool)
+    for index in np.argsort(values[peaks].astype(np.float64))[::-1]:
+        if not (keep[index] and crowded[index]):
+            continue
+        neighbour = index - 1
+        while neighbour >= 0 and peaks[index] - peaks[neighbour] < distance:
+            keep[neighbour] = False
+            neighbour -= 1
+        neighbour = index + 1
+        while neighbour < peaks.size and peaks[neighbour] - peaks[index] < distance:
+            keep[neighbour] = False
+            neighbour += 1
+    return peaks[keep]
@@ -0,0 +1,168 @@
+"""Uncertainty of the continuum, from a bootstrap over the flux of the maxima.
+
+Each order is cleaned and smoothed once, and its maxima and penalty map are also found once, as in a normal run. Only
+the flux of the maxima is perturbed (with the noise of the order) for each sample, which then goes through the alpha
+shape, the removal of the outliers and the interpolation. All samples of one order form a single work unit, so that
+the cost of each order is one preprocessing plus one anchor search per sample, and the orders are spread over the
+workers in the same way as in :py:func:`SNT.normalize_spectra`.
+"""
+
+from __future__ import annotations
+
+import warnings
+from typing import Any, Sequence
+
+import numpy as np
+from loguru import logger
+
+from SNT import pipeline
+from SNT.executors import SupportsSubmit
+from SNT.masks import SpectralMask, as_spectral_mask
+from SNT.snt import _run_units, evaluate_continuum, penalty_map, preprocess_row, select_anchors
+from SNT.utils.SNT_configs import build_SNT_config
+
+# Factor of the DER_SNR estimator (Stoehr et al. 2008), from the median absolute second difference to the noise
+DER_SNR_FACTOR = 1.482602 / np.sqrt(6)
+
+
+def bootstrap_continuum(
+    wavelengths,
+    spectra,
+    header,
+    user_config: dict[str, Any] | None = None,
+    FWHM_KW: str | None = None,
+    FWHM_override: float | None = None,  # noqa: N803
+    n_samples: int = 100,
+    percentiles: Sequence[float] = (16, 50, 84),
+    flux_errors=None,
+    seed: int | None = None,
+    executor: SupportsSubmit | None = None,
+    mask: SpectralMask | np.ndarray | list[tuple[float, float]] | None = None,
+) -> np.ndarray:
+    """Percentiles of the continuum of each pixel, from n_samples perturbations of the flux of the maxima.
+
+    Args:
+        wavelengths: 2D array with the wavelengths of each order
+        spectra: 2D array with the flux of each order
+        header: Header of the frame, from which the FWHM is read
+        user_config (dict[str, Any] | None, optional): Values that will override the default configuration.
+            Defaults to None.
+        FWHM_KW (str | None, optional): Header keyword of the FWHM. Defaults to None, using the ESO one.
+        FWHM_override (float | None, optional): FWHM, in km/s, used instead of the header value. Defaults to None.
+        n_samples (int, optional): Number of bootstrap samples. Defaults to 100.
+        percentiles (Sequence[float], optional): Percentiles of the continuum that are returned. Defaults to
+            (16, 50, 84).
+        flux_errors (optional): Uncertainty of the flux, with the same shape as the spectra. Defaults to None,
+            estimating the (white) noise of each order from its flux, with DER_SNR.
+        seed (int | None, optional): Seed of the random perturbations. The samples of each order don't depend on the
+            executor or on the number of workers. Defaults to None.
+        executor (SupportsSubmit | None, optional): Executor used to run the orders. If None, the orders run as
+            configured by parallel_orders and Ncores. Defaults to None.
+        mask (SpectralMask | np.ndarray | list[tuple[float, float]] | None, optional): Regions that are ignored, as
+            in normalize_spectra. Defaults to None.
+
+    Returns:
+        np.ndarray: Array with shape (n_percentiles, n_orders, n_pixels). The orders that could not be normalized are
+        NaN
+
+    """
+    config = build_SNT_config(user_configs=user_config)
+    wavelengths = np.atleast_2d(np.asarray(wavelengths, dtype=np.float64))
+    spectra = np.atleast_2d(np.asarray(spectra, dtype=config.dtype))
+    if mask is not None:
+        spectra = as_spectral_mask(mask).apply(wavelengths, spectra)
+    if flux_errors is None:
+        flux_errors = [None] * len(spectra)
+    else:
+        flux_errors = np.atleast_2d(np.asarray(flux_errors, dtype=np.float64))
+
+    if FWHM_KW is None:
+        FWHM_KW = "HIERARCH ESO QC CCF FWHM"
+    FWHM = header[FWHM_KW] if FWHM_override is None else FWHM_override
+
+    config_values = config.as_dict()
+    seeds = np.random.SeedSequence(seed).spawn(len(spectra))
+    units = [
+        (wave, flux, FWHM, config_values, errors, n_samples, tuple(percentiles), order_seed)
+        for wave, flux, errors, order_seed in zip(wavelengths, spectra, flux_errors, seeds)
+    ]
+    results, errors, _ = _run_units(units, config, executor, fn=bootstrap_work_unit)
+
+    continuum = np.full((len(percentiles), *spectra.shape), np.nan)
+    for index, result in enumerate(results):
+        if index in errors:
+            logger.warning(f"Failed to bootstrap order {index}: {errors[index]!r}")
+            continue
+        continuum[:, index] = result
+    return continuum
+
+
+def bootstrap_work_unit(
+    wavelengths,
+    spectra,
+    FWHM,  # noqa: N803
+    config: dict[str, Any],
+    flux_errors,
+    n_samples: int,
+    percentiles: tuple[float, ...],
+    seed: np.random.SeedSequence | int | None = None,
+) -> np.ndarray:
+    """Percentiles of the continuum of one order, from a self-contained work unit.
+
+    Args:
+        wavelengths: Wavelengths of the order
+        spectra: Flux of the order
+        FWHM: FWHM, in km/s
+        config (dict[str, Any]): Plain dictionary with the values of all configurable parameters
+        flux_errors: Uncertainty of the flux of the order. If None, it is estimated from the flux
+        n_samples (int): Number of bootstrap samples
+        percentiles (tuple[float, ...]): Percentiles of the continuum
+        seed (np.random.SeedSequence | int | None, optional): Seed of the perturbations. Defaults to None.
+
+    Returns:
+        np.ndarray: Array with shape (n_percentiles, n_pixels)
+
+    """
+    config = build_SNT_config(config)
+    rng = np.random.default_rng(seed)
+
+    wavelengths_clip, spectra_clip, min_lambda, FWHM_WL = preprocess_row(wavelengths, spectra, FWHM, config)
+    s1_index, s1, _, step_y, step_x = penalty_map(spectra_clip, wavelengths_clip, FWHM_WL, config)
+    max_index = pipeline.run_stage("maxima", {"flux": spectra_clip}, config)["max_index"]
+
+    if flux_errors is None:
+        noise = der_snr_noise(spectra[spectra != 0])
+    else:
+        # the clipped wavelengths are a subset of the order's ones
+        noise = np.asarray(flux_errors)[np.searchsorted(wavelengths, np.asarray(wavelengths_clip)[max_index])]
+
+    anchors_x, anchors_y = [], []
+    perturbed = spectra_clip.copy()
+    for _ in range(n_samples):
+        perturbed[max_index] = spectra_clip[max_index] + noise * rng.standard_normal(max_index.size)
+        sample_x, sample_y, _ = select_anchors(
+            max_index, perturbed, wavelengths_clip, min_lambda, FWHM_WL, s1_index, s1, step_y, step_x, config
+        )
+        anchors_x.append(sample_x)
+        anchors_y.append(sample_y)
+
+    samples = np.empty((n_samples, wavelengths.size))
+    for index, (sample_x, sample_y) in enumerate(zip(anchors_x, anchors_y)):
+        samples[index] = evaluate_continuum(wavelengths, sample_x, sample_y, config)
+    continuum = np.empty((len(percentiles), wavelengths.size))
+    # nanpercentile goes through each pixel, so it is only used for the ones that are outside of the anchors of some
+    # samples (e.g. at the edges, with linear interpolation)
+    has_nan = np.isnan(samples).any(axis=0)
+    continuum[:, ~has_nan] = np.percentile(samples[:, ~has_nan], percentiles, axis=0)
+    with warnings.catch_warnings():
+        warnings.filterwarnings("ignore", message="All-NaN slice", category=RuntimeWarning)
+        continuum[:, has_nan] = np.nanpercentile(samples[:, has_nan], percentiles, axis=0)
+    return continuum
+
+
+def der_snr_noise(flux) -> float:
+    """Noise of the flux, from the median of its second differences (DER_SNR), which ignores the smooth signal."""
+    flux = np.asarray(flux, dtype=np.float64)
+    if flux.size < 5:
+        return 0.0
+    return float(DER_SNR_FACTOR * np.median(np.abs(2 * flux[2:-2] - flux[:-4] - flux[4:])))
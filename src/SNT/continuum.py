@@ -0,0 +1,65 @@
+"""Lightweight continuum models, that store the anchors of each order instead of the dense continuum."""
+
+from __future__ import annotations
+
+import json
+from pathlib import Path
+from typing import Any, Iterable
+
+import numpy as np
+
+from SNT import interpolators
+
+
+class ContinuumModel:
+    """Continuum of one spectral order, described by its anchors and interpolation type.
+
+    The continuum is only evaluated when the model is called, on any wavelength grid::
+
+        continuum = model(wavelengths)
+
+    """
+
+    def __init__(self, anchors_x: Iterable[float], anchors_y: Iterable[float], interp_type: str = "linear"):
+        self.anchors_x = np.asarray(anchors_x, dtype=np.float64)
+        self.anchors_y = np.asarray(anchors_y, dtype=np.float64)
+        self.interp_type = interp_type
+
+    def __call__(self, wavelengths) -> np.ndarray:
+        """Evaluate the continuum on the given wavelengths."""
+        return interpolators.evaluate(self.anchors_x, self.anchors_y, np.asarray(wavelengths), self.interp_type)
+
+    @property
+    def wavelength_range(self) -> tuple[float, float]:
+        """Wavelength interval covered by the anchors, NaN for an order without anchors (i.e. that failed)."""
+        if self.anchors_x.size == 0:
+            return np.nan, np.nan
+        return float(self.anchors_x[0]), float(self.anchors_x[-1])
+
+    def to_dict(self) -> dict[str, Any]:
+        """Serializable description of the model."""
+        return {
+            "anchors_x": self.anchors_x.tolist(),
+            "anchors_y": self.anchors_y.tolist(),
+            "interp": self.interp_type,
+        }
+
+    @classmethod
+    def from_dict(cls, description: dict[str, Any]) -> ContinuumModel:
+        """Build a model from the output of to_dict."""
+        return cls(description["anchors_x"], description["anchors_y"], description["interp"])
+
+    def __repr__(self) -> str:
+        return f"ContinuumModel({self.anchors_x.size} anchors; {self.interp_type})"
+
+
+def save_models(path: str | Path, models: list[ContinuumModel]) -> None:
+    """Store the continuum models (one per order) as a json file."""
+    with open(path, mode="w") as file:
+        json.dump(fp=file, obj=[model.to_dict() for model in models])
+
+
+def load_models(path: str | Path) -> list[ContinuumModel]:
+    """Load the continuum models stored with save_models."""
+    with open(path) as file:
+        return [ContinuumModel.from_dict(description) for description in json.load(file)]
@@ -0,0 +1,571 @@
+"""Executors used to dispatch the normalization of the spectral orders.
+
+Any object that follows the :py:class:`concurrent.futures.Executor` interface (i.e. provides a ``submit`` method that
+returns a :py:class:`concurrent.futures.Future`) can be used to run the orders. This module also ships a reference
+executor, :py:class:`FileQueueExecutor`, that exchanges the work units through a (shared) folder. Workers can be
+started locally, or in other machines that have access to the same filesystem with::
+
+    python -m SNT.worker <queue_dir>
+
+"""
+
+from __future__ import annotations
+
+import concurrent.futures
+import itertools
+import math
+import multiprocessing
+import os
+import pickle
+import signal
+import threading
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, CancelledError, Executor, Future, InvalidStateError, wait
+from pathlib import Path
+from typing import Any, Callable, Protocol
+
+from loguru import logger
+
+from SNT.utils.logs import forward_worker_logs, init_worker_logging, worker_log_level
+
+_STOP_FILE = "STOP"
+# Time, in seconds, between the updates of the tasks that a worker is running, which show that it is still alive
+HEARTBEAT_INTERVAL = 2.0
+
+# Rough time (in seconds) to start one worker of a process pool, which is much larger when the worker has to import
+# SNT from scratch (i.e. without fork)
+WORKER_STARTUP_TIME = {"fork": 0.02}
+DEFAULT_WORKER_STARTUP_TIME = 0.5
+
+
+class SupportsSubmit(Protocol):
+    """Minimal interface that an executor must provide to run the spectral orders.
+
+    The order_timeout is only applied to executors that mark their futures as running when the task starts.
+    """
+
+    def submit(self, fn: Callable[..., Any], /, *args: Any, **kwargs: Any) -> Future: ...
+
+
+class ProcessPool(Executor):
+    """Executor backed by a multiprocessing Pool.
+
+    Unlike the ProcessPoolExecutor, the workers can be terminated, even if they are stuck in a task. Each worker
+    reports when it starts a task, which marks its future as running, and a running task can be stopped (see
+    :py:meth:`abort`). The records that the workers log are sent to this process, through a queue, and logged here
+    (see :py:mod:`SNT.utils.logs`).
+    """
+
+    def __init__(self, n_workers: int, *, forward_logs: bool = True) -> None:
+        self._log_queue = None
+        if forward_logs:
+            self._log_queue = multiprocessing.Queue()
+            self._log_thread = forward_worker_logs(self._log_queue)
+
+        # futures of the unfinished tasks and the processes that are running them, indexed by the task
+        self._futures: dict[int, Future] = {}
+        self._task_workers: dict[int, int] = {}
+        self._task_ids = itertools.count()
+        # the tasks of the killed workers never finish, so the pool can't be closed gracefully after an abort
+        self._aborted = False
+        self._lock = threading.Lock()
+        self._started_queue = multiprocessing.SimpleQueue()
+        self._started_thread = threading.Thread(target=self._track_started_tasks, daemon=True)
+        self._started_thread.start()
+
+        self._pool = multiprocessing.Pool(
+            n_workers, _init_pool_worker, (self._started_queue, self._log_queue, worker_log_level())
+        )
+
+    def submit(self, fn: Callable[..., Any], /, *args: Any, **kwargs: Any) -> Future:
+        future = Future()
+        with self._lock:
+            task_id = next(self._task_ids)
+            self._futures[task_id] = future
+
+        def finish_task() -> None:
+            with self._lock:
+                self._futures.pop(task_id, None)
+                self._task_workers.pop(task_id, None)
+
+        def set_result(result: Any) -> None:
+            finish_task()
+            try:
+                future.set_result(result)
+            except InvalidStateError:
+                # The future was cancelled by the caller
+                pass
+
+        def set_exception(exception: BaseException) -> None:
+            finish_task()
+            try:
+                future.set_exception(exception)
+            except InvalidStateError:
+                pass
+
+        self._pool.apply_async(
+            _run_task, (task_id, fn, args, kwargs), callback=set_result, error_callback=set_exception
+        )
+        return future
+
+    def abort(self, future: Future) -> None:
+        """Give up on the task of a future, even if a worker is already running it.
+
+        A task that did not start yet is cancelled. The worker of a running task is killed, and the pool replaces it by
+        a new one, so that a stuck task doesn't hold its worker.
+        """
+        if future.cancel():
+            return
+        with self._lock:
+            task_id = next((task_id for task_id, other in self._futures.items() if other is future), None)
+            if task_id is None:
+                # the task is already finished
+                return
+            self._futures.pop(task_id)
+            pid = self._task_workers.pop(task_id)
+            self._aborted = True
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+    def _track_started_tasks(self) -> None:
+        while (item := self._started_queue.get()) is not None:
+            task_id, pid = item
+            with self._lock:
+                future = self._futures.get(task_id)
+                if future is None:
+                    # the task is already finished
+                    continue
+                if future.set_running_or_notify_cancel():
+                    self._task_workers[task_id] = pid
+                else:
+                    # cancelled while waiting in the pool, the result will be ignored
+                    self._futures.pop(task_id)
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False) -> None:  # noqa: FBT001, FBT002
+        if cancel_futures:
+            self._cancel_futures()
+            self._pool.terminate()
+        elif self._aborted:
+            if wait:
+                with self._lock:
+                    futures = list(self._futures.values())
+                concurrent.futures.wait(futures)
+            self._cancel_futures()
+            self._pool.terminate()
+        else:
+            self._pool.close()
+        if wait:
+            self._pool.join()
+        self._stop_tracking(wait=wait)
+
+    def terminate(self) -> None:
+        """Stop the workers, without waiting for the running tasks.
+
+        The tasks that did not start are cancelled, and the futures of the running ones raise a CancelledError.
+        """
+        self._cancel_futures()
+        self._pool.terminate()
+        self._pool.join()
+        self._stop_tracking(wait=True)
+
+    def _cancel_futures(self) -> None:
+        # the pool drops its tasks when it is terminated, so their callbacks never fire
+        with self._lock:
+            futures = list(self._futures.values())
+            self._futures.clear()
+            self._task_workers.clear()
+        # outside of the lock, the done callbacks of the futures may submit other tasks
+        for future in futures:
+            if not future.cancel():
+                try:
+                    future.set_exception(CancelledError("The ProcessPool was terminated"))
+                except InvalidStateError:
+                    # finished in the meantime
+                    pass
+
+    def _stop_tracking(self, *, wait: bool) -> None:
+        if self._started_queue is not None:
+            self._started_queue.put(None)
+            if wait:
+                self._started_thread.join()
+            self._started_queue = None
+
+        if self._log_queue is not None:
+            # the records that were already sent are logged before the sentinel
+            self._log_queue.put(None)
+            if wait:
+                self._log_thread.join()
+            self._log_queue = None
+
+
+# Queue through which the worker of a ProcessPool reports the tasks that it starts
+_started_queue = None
+
+
+def _init_pool_worker(started_queue, log_queue, log_level: str | int) -> None:
+    global _started_queue
+    _started_queue = started_queue
+    if log_queue is not None:
+        init_worker_logging(log_queue, log_level)
+
+
+def _run_task(task_id: int, fn: Callable[..., Any], args: tuple, kwargs: dict[str, Any]) -> Any:
+    _started_queue.put((task_id, os.getpid()))
+    return fn(*args, **kwargs)
+
+
+def available_cores() -> int:
+    """Number of cores that the current process is allowed to run on."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def pool_size(n_cores: int | str) -> int:
+    """Number of workers for the configured Ncores, which can be "auto" (all available cores)."""
+    return available_cores() if n_cores == "auto" else n_cores
+
+
+def choose_workers(serial_time: float, n_units: int, max_workers: int, startup_time: float | None = None) -> int:
+    """Number of processes that minimizes the (estimated) time needed to run a group of units.
+
+    With w workers, the units take about ``startup_time * w + serial_time / w``, which has its minimum at
+    ``sqrt(serial_time / startup_time)`` workers. There is no point in having more workers than units or cores.
+
+    Args:
+        serial_time (float): Estimated time, in seconds, to run all units in a single process
+        n_units (int): Number of units
+        max_workers (int): Max. number of workers
+        startup_time (float | None, optional): Time, in seconds, to start each worker. Defaults to None, using the
+            value for the current start method of multiprocessing.
+
+    Returns:
+        int: Number of workers, 1 if the units should run serially (i.e. a pool would not pay off)
+
+    """
+    if startup_time is None:
+        startup_time = WORKER_STARTUP_TIME.get(multiprocessing.get_start_method(), DEFAULT_WORKER_STARTUP_TIME)
+
+    n_workers = min(max_workers, n_units, math.floor(math.sqrt(serial_time / startup_time)))
+    if n_workers < 2 or startup_time * n_workers + serial_time / n_workers >= serial_time:
+        return 1
+    return n_workers
+
+
+def dispatch(
+    executor: SupportsSubmit,
+    fn: Callable[..., Any],
+    units: list[tuple],
+    max_in_flight: int | None = None,
+    timeout: float | None = None,
+    poll_interval: float = 0.05,
+    costs: list[float] | None = None,
+) -> tuple[list[Any], dict[int, BaseException]]:
+    """Run fn over all work units, isolating the failures of each unit.
+
+    Args:
+        executor (SupportsSubmit): Executor that runs the units
+        fn (Callable[..., Any]): Function that is called with the arguments of each unit
+        units (list[tuple]): Arguments of each unit
+        max_in_flight (int | None, optional): Max. number of units submitted to the executor at any time. Defaults
+            to None, submitting all of them at once.
+        timeout (float | None, optional): Time, in seconds, after which a running unit is considered to have failed.
+            The clock of each unit starts once the executor marks its future as running (as the executors of
+            concurrent.futures and SNT do), so that the time spent waiting for a free worker is not counted. If the
+            executor has an ``abort(future)`` method, it is used to stop the units that timed out (e.g. killing the
+            stuck worker), otherwise they are cancelled. Defaults to None.
+        poll_interval (float, optional): Time, in seconds, between checks of the timeouts. Defaults to 0.05.
+        costs (list[float] | None, optional): Estimated cost of each unit. If given, the most expensive units are
+            submitted first, so that the cheap ones fill the gaps at the end of the run. Defaults to None, submitting
+            the units in their original order.
+
+    Returns:
+        tuple[list[Any], dict[int, BaseException]]: Result of each unit (None if it failed) and the exceptions of
+        the failed units, indexed by their position in the units list
+
+    """
+    max_in_flight = len(units) if max_in_flight is None else max_in_flight
+    if costs is None:
+        submission_order = list(range(len(units)))
+    else:
+        submission_order = sorted(range(len(units)), key=lambda index: costs[index], reverse=True)
+    results = [None] * len(units)
+    errors = {}
+    pending = {}
+    next_unit = 0
+
+    while next_unit < len(units) or pending:
+        while next_unit < len(units) and len(pending) < max_in_flight:
+            index = submission_order[next_unit]
+            # the start time is only set once the unit is running
+            pending[executor.submit(fn, *units[index])] = (index, None)
+            next_unit += 1
+
+        done, _ = wait(pending, timeout=poll_interval if timeout else None, return_when=FIRST_COMPLETED)
+        for future in done:
+            index, _ = pending.pop(future)
+            try:
+                results[index] = future.result()
+            except Exception as e:  # noqa: BLE001
+                errors[index] = e
+
+        if timeout:
+            now = time.monotonic()
+            for future, (index, started) in list(pending.items()):
+                if started is None:
+                    if future.running():
+                        pending[future] = (index, now)
+                elif now - started > timeout:
+                    abort = getattr(executor, "abort", None)
+                    if abort is None:
+                        future.cancel()
+                    else:
+                        abort(future)
+                    pending.pop(future)
+                    errors[index] = TimeoutError(f"Task did not finish within {timeout} seconds")
+
+    return results, errors
+
+
+def _write_atomic(path: Path, payload: Any) -> None:
+    """Pickle the payload to a temporary file and move it into place, so that readers never see partial files."""
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, mode="wb") as file:
+        pickle.dump(payload, file)
+    os.replace(tmp_path, path)
+
+
+def run_worker(
+    queue_dir: str | Path, poll_interval: float = 0.05, heartbeat_interval: float = HEARTBEAT_INTERVAL
+) -> None:
+    """Process tasks from a queue folder until the STOP file is created.
+
+    Tasks are claimed by (atomically) moving them from the "pending" into the "running" folder, which ensures that
+    each task is only picked by one worker, even if they live in different machines. While the task runs, its file is
+    touched every heartbeat_interval seconds, so that the executor can tell it apart from the tasks of crashed workers.
+
+    Args:
+        queue_dir (str | Path): Folder that holds the queue
+        poll_interval (float, optional): Time, in seconds, between checks for new tasks. Defaults to 0.05.
+        heartbeat_interval (float, optional): Time, in seconds, between the updates of the running task. Defaults to
+            HEARTBEAT_INTERVAL.
+
+    """
+    queue_dir = Path(queue_dir)
+    pending, running, done = (queue_dir / name for name in ("pending", "running", "done"))
+
+    while not (queue_dir / _STOP_FILE).exists():
+        for task_path in sorted(pending.glob("*.task")):
+            claimed_path = running / task_path.name
+            try:
+                os.rename(task_path, claimed_path)
+                # the rename keeps the time of the submission, which could already be past the lease
+                os.utime(claimed_path)
+                with open(claimed_path, mode="rb") as file:
+                    fn, args, kwargs = pickle.load(file)
+            except FileNotFoundError:
+                # Another worker got here first, or the task was cancelled or requeued
+                continue
+
+            stop_heartbeat = threading.Event()
+            heartbeat = threading.Thread(
+                target=_heartbeat, args=(claimed_path, heartbeat_interval, stop_heartbeat), daemon=True
+            )
+            heartbeat.start()
+            try:
+                result = (True, fn(*args, **kwargs))
+            except Exception as e:  # noqa: BLE001
+                result = (False, e)
+            finally:
+                stop_heartbeat.set()
+                heartbeat.join()
+
+            try:
+                _write_atomic(done / f"{task_path.stem}.result", result)
+            except (pickle.PicklingError, TypeError, AttributeError):
+                # The exception (or result) can't be sent back as it is
+                _write_atomic(done / f"{task_path.stem}.result", (False, RuntimeError(repr(result[1]))))
+            claimed_path.unlink(missing_ok=True)
+            break
+        else:
+            time.sleep(poll_interval)
+
+
+def _heartbeat(path: Path, interval: float, stop: threading.Event) -> None:
+    while not stop.wait(interval):
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            # the task was requeued by the executor
+            return
+
+
+class FileQueueExecutor(Executor):
+    """Reference executor that distributes tasks through a folder-based queue.
+
+    The queue folder holds three sub-folders:
+
+    - pending: tasks waiting to be picked by a worker
+    - running: tasks that were claimed by a worker
+    - done: results waiting to be collected by the executor
+
+    Tasks and results are pickled, so the submitted functions must be importable by the workers. If the folder
+    lives in a shared filesystem, workers in other machines can be started with ``python -m SNT.worker
+    <queue_dir>``.
+
+    The futures are marked as running once a worker claims their task. The workers touch the tasks that they are
+    running every few seconds. A running task that was not touched for
+    lease_time seconds (e.g. because its worker crashed) is placed back in the pending folder, to be picked by another
+    worker.
+
+    """
+
+    def __init__(
+        self, queue_dir: str | Path, n_workers: int = 1, poll_interval: float = 0.05, lease_time: float = 30
+    ) -> None:
+        """Create the queue folders and start the local workers.
+
+        Args:
+            queue_dir (str | Path): Folder that will hold the queue
+            n_workers (int, optional): Number of local worker processes. Defaults to 1.
+            poll_interval (float, optional): Time, in seconds, between checks of the queue. Defaults to 0.05.
+            lease_time (float, optional): Time, in seconds, after which a running task that was not touched by its
+                worker is requeued. It must be well above the heartbeat interval of the workers. Defaults to 30.
+
+        """
+        self.queue_dir = Path(queue_dir)
+        self._poll_interval = poll_interval
+        self._lease_time = lease_time
+        for name in ("pending", "running", "done"):
+            (self.queue_dir / name).mkdir(parents=True, exist_ok=True)
+        (self.queue_dir / _STOP_FILE).unlink(missing_ok=True)
+
+        self._futures: dict[str, Future] = {}
+        # tasks that were given up while running, whose results are discarded
+        self._abandoned: set[str] = set()
+        self._lock = threading.Lock()
+        self._shutdown = False
+
+        self._workers = [
+            multiprocessing.Process(target=run_worker, args=(self.queue_dir, poll_interval), daemon=True)
+            for _ in range(n_workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+        self._collector = threading.Thread(target=self._collect_results, daemon=True)
+        self._collector.start()
+
+    def submit(self, fn: Callable[..., Any], /, *args: Any, **kwargs: Any) -> Future:
+        """Place a new task in the queue."""
+        with self._lock:
+            if self._shutdown:
+                msg = "Can't submit tasks after the executor was shut down"
+                raise RuntimeError(msg)
+            task_id = f"{time.time_ns()}_{uuid.uuid4().hex}"
+            future = Future()
+            self._futures[task_id] = future
+
+        _write_atomic(self.queue_dir / "pending" / f"{task_id}.task", (fn, args, kwargs))
+        return future
+
+    def abort(self, future: Future) -> None:
+        """Give up on the task of a future, even if a worker is already running it.
+
+        A pending task is removed from the queue (and its future cancelled). A running task can't be stopped, as its
+        worker may live in another machine, but its result is discarded.
+        """
+        with self._lock:
+            task_id = next((task_id for task_id, other in self._futures.items() if other is future), None)
+            if task_id is not None:
+                self._discard(task_id)
+        future.cancel()
+
+    def _discard(self, task_id: str) -> None:
+        # must be called with the lock held
+        self._futures.pop(task_id)
+        try:
+            (self.queue_dir / "pending" / f"{task_id}.task").unlink()
+        except FileNotFoundError:
+            self._abandoned.add(task_id)
+
+    def _collect_results(self) -> None:
+        done = self.queue_dir / "done"
+        while True:
+            with self._lock:
+                for task_id in [task_id for task_id, future in self._futures.items() if future.cancelled()]:
+                    self._discard(task_id)
+            self._check_running_tasks()
+
+            for result_path in done.glob("*.result"):
+                with self._lock:
+                    future = self._futures.pop(result_path.stem, None)
+                    abandoned = result_path.stem in self._abandoned
+                    self._abandoned.discard(result_path.stem)
+                if future is None:
+                    if not abandoned:
+                        logger.warning(f"Found result of unknown task: {result_path.name}")
+                    result_path.unlink(missing_ok=True)
+                    continue
+                with open(result_path, mode="rb") as file:
+                    success, value = pickle.load(file)
+                result_path.unlink()
+                if future.cancelled():
+                    continue
+                if success:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+
+            with self._lock:
+                if self._shutdown and not self._futures:
+                    return
+            time.sleep(self._poll_interval)
+
+    def _check_running_tasks(self) -> None:
+        """Mark the futures of the claimed tasks as running, and requeue the tasks whose workers stopped responding."""
+        now = time.time()
+        for task_path in (self.queue_dir / "running").glob("*.task"):
+            with self._lock:
+                future = self._futures.get(task_path.stem)
+                if future is not None and not future.running() and not future.done():
+                    future.set_running_or_notify_cancel()
+            try:
+                if now - task_path.stat().st_mtime < self._lease_time:
+                    continue
+                os.rename(task_path, self.queue_dir / "pending" / task_path.name)
+            except FileNotFoundError:
+                # the task finished in the meantime
+                continue
+            logger.warning(f"Requeued task {task_path.stem}, as its worker stopped responding")
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False) -> None:  # noqa: FBT001, FBT002
+        """Stop accepting new tasks and, once all results are in, stop the workers.
+
+        Args:
+            wait (bool, optional): Block until all tasks are completed. Defaults to True.
+            cancel_futures (bool, optional): Cancel the tasks that were not yet picked by a worker. Defaults to False.
+
+        """
+        with self._lock:
+            self._shutdown = True
+            if cancel_futures:
+                for task_id, future in list(self._futures.items()):
+                    try:
+                        (self.queue_dir / "pending" / f"{task_id}.task").unlink()
+                    except FileNotFoundError:
+                        continue
+                    future.cancel()
+                    self._futures.pop(task_id)
+
+        if wait:
+            self._collector.join()
+            (self.queue_dir / _STOP_FILE).touch()
+            for worker in self._workers:
+                if self._abandoned:
+                    # the worker may be stuck in a task that was given up
+                    worker.terminate()
+                worker.join()
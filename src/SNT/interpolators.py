@@ -1,9 +1,6 @@
-import math
-from collections import deque
-
 import numpy as np
-from scipy.signal import find_peaks
 from scipy import interpolate
+from scipy.linalg import solve_banded
 
 
 def interpolate_wrapper(xs, ys, interp_type):  # interpolate on x and y, acordding to type
@@ -13,5 +10,96 @@ def interpolate_wrapper(xs, ys, interp_type):  # interpolate on x and y, acorddi
         return interpolate.interp1d(
             xs, ys, kind="linear", axis=-1, copy=True, bounds_error=False, fill_value="nan", assume_sorted=False
         )
-    msg = f"Interpolation type of <{type}> not implemented"
+    msg = f"Interpolation type of <{interp_type}> not implemented"
     raise NotImplementedError(msg)
+
+
+def evaluate(xs, ys, wavelengths, interp_type):
+    """Evaluate the interpolation of the anchors (xs, ys) on the given wavelengths.
+
+    Gives the same result as calling the interpolate_wrapper output, without building interpolator objects. The
+    linear interpolation is NaN outside of the anchors, whereas the cubic spline is extrapolated.
+
+    Args:
+        xs: Wavelengths of the anchors, sorted
+        ys: Flux of the anchors
+        wavelengths: Wavelengths in which the interpolation is evaluated
+        interp_type: linear or cubic
+
+    Raises:
+        NotImplementedError: If the interpolation type is not one of the two
+
+    """
+    xs = np.asarray(xs, dtype=np.float64)
+    ys = np.asarray(ys, dtype=np.float64)
+    if xs.size == 0:
+        # e.g. orders that failed
+        return np.full(np.shape(wavelengths), np.nan)
+    if interp_type == "linear":
+        return np.interp(wavelengths, xs, ys, left=np.nan, right=np.nan)
+    if interp_type == "cubic":
+        return cubic_spline(xs, ys, wavelengths)
+    msg = f"Interpolation type of <{interp_type}> not implemented"
+    raise NotImplementedError(msg)
+
+
+def evaluate_orders(anchors_x, anchors_y, wavelengths, interp_type, out=None):
+    """Evaluate the continuum of all orders, from the (ragged) lists with the anchors of each order.
+
+    Args:
+        anchors_x: Wavelengths of the anchors, one entry per order
+        anchors_y: Flux of the anchors, one entry per order
+        wavelengths: 2D array with the wavelengths of each order
+        interp_type: linear or cubic
+        out (optional): Array in which the continuum is stored. Defaults to None, creating a new (float64) array.
+
+    Returns:
+        np.ndarray: 2D array with the continuum of each order
+
+    """
+    if out is None:
+        out = np.empty(np.shape(wavelengths))
+    for row, (xs, ys) in enumerate(zip(anchors_x, anchors_y)):
+        out[row] = evaluate(xs, ys, wavelengths[row], interp_type)
+    return out
+
+
+def cubic_spline(xs, ys, wavelengths):
+    """Evaluate the not-a-knot cubic spline through (xs, ys), the same as scipy's CubicSpline.
+
+    The second derivatives at the knots are found from a tridiagonal system, after eliminating the first and last
+    ones with the not-a-knot conditions. With less than four points, the spline is the polynomial through them.
+    """
+    n = xs.size
+    if n < 4:
+        coefficients = np.polyfit(xs - xs[0], ys, n - 1)
+        return np.polyval(coefficients, np.asarray(wavelengths) - xs[0])
+
+    h = np.diff(xs)
+    slope = np.diff(ys) / h
+
+    # banded matrix for the second derivatives of the inner knots
+    banded = np.zeros((3, n - 2))
+    banded[0, 1:] = h[1:-1]
+    banded[1] = 2 * (h[:-1] + h[1:])
+    banded[2, :-1] = h[1:-1]
+    banded[1, 0] += h[0] + h[0] ** 2 / h[1]
+    banded[0, 1] = h[1] - h[0] ** 2 / h[1]
+    banded[1, -1] += h[-1] + h[-1] ** 2 / h[-2]
+    banded[2, -2] = h[-2] - h[-1] ** 2 / h[-2]
+
+    second_derivative = np.empty(n)
+    second_derivative[1:-1] = solve_banded((1, 1), banded, 6 * np.diff(slope))
+    second_derivative[0] = second_derivative[1] * (1 + h[0] / h[1]) - second_derivative[2] * h[0] / h[1]
+    second_derivative[-1] = second_derivative[-2] * (1 + h[-1] / h[-2]) - second_derivative[-3] * h[-1] / h[-2]
+
+    index = np.clip(np.searchsorted(xs, wavelengths, side="right") - 1, 0, n - 2)
+    t = wavelengths - xs[index]
+    m_left = second_derivative[index]
+    m_right = second_derivative[index + 1]
+    return (
+        ys[index]
+        + t * (slope[index] - h[index] * (2 * m_left + m_right) / 6)
+        + t**2 * m_left / 2
+        + t**3 * (m_right - m_left) / (6 * h[index])
+    )
@@ -0,0 +1,111 @@
+"""Masks of the spectral regions (e.g. telluric lines or detector defects) that are excluded from the normalization."""
+
+from __future__ import annotations
+
+import hashlib
+from collections import OrderedDict
+from pathlib import Path
+from typing import Iterable
+
+import numpy as np
+
+
+class SpectralMask:
+    """Regions of the spectra that are removed before searching for the continuum.
+
+    The regions can be given as wavelength intervals (e.g. a telluric line list), which apply to any wavelength grid,
+    and/or as a boolean array with the bad pixels of each order. The mask is compiled into the pixels that are kept
+    for each wavelength grid, and the result is cached, so that frames from the same instrument reuse it::
+
+        mask = SpectralMask.from_file("tellurics.txt")
+        for wavelengths, spectra in frames:
+            normalize_spectra(wavelengths, spectra, ..., mask=mask)
+
+    """
+
+    def __init__(
+        self,
+        intervals: Iterable[tuple[float, float]] | None = None,
+        pixel_mask=None,
+        cache_size: int = 8,
+    ) -> None:
+        """Create the mask.
+
+        Args:
+            intervals (Iterable[tuple[float, float]] | None, optional): Wavelength intervals (start, end) that are
+                removed. Defaults to None.
+            pixel_mask (optional): Boolean array, with the same shape as the spectra, that is True in the bad pixels.
+                Defaults to None.
+            cache_size (int, optional): Number of compiled masks (i.e. wavelength grids) that are kept. Defaults to 8.
+
+        """
+        self.starts, self.ends = _merge_intervals([] if intervals is None else intervals)
+        self.pixel_mask = None if pixel_mask is None else np.atleast_2d(np.asarray(pixel_mask, dtype=bool))
+        self._cache_size = cache_size
+        self._compiled: OrderedDict[tuple, np.ndarray] = OrderedDict()
+
+    @classmethod
+    def from_file(cls, path: str | Path, **kwargs) -> SpectralMask:
+        """Load the intervals from a text file, with the start and end wavelengths of one interval per line."""
+        intervals = np.loadtxt(path, ndmin=2, usecols=(0, 1))
+        return cls(intervals=[tuple(row) for row in intervals], **kwargs)
+
+    def compile(self, wavelengths) -> np.ndarray:
+        """Boolean array, with the shape of the wavelengths, that is True in the pixels that are kept.
+
+        Args:
+            wavelengths: 2D array with the wavelengths of each order
+
+        """
+        wavelengths = np.atleast_2d(np.ascontiguousarray(wavelengths, dtype=np.float64))
+        key = (wavelengths.shape, hashlib.sha1(wavelengths.data).hexdigest())  # noqa: S324
+        if key in self._compiled:
+            self._compiled.move_to_end(key)
+            return self._compiled[key]
+
+        valid = np.ones(wavelengths.shape, dtype=bool)
+        if self.starts.size:
+            # index of the last interval that starts before each pixel
+            index = np.searchsorted(self.starts, wavelengths, side="right") - 1
+            valid &= ~((index >= 0) & (wavelengths <= self.ends[np.maximum(index, 0)]))
+        if self.pixel_mask is not None:
+            if self.pixel_mask.shape != wavelengths.shape:
+                msg = f"The pixel mask has shape {self.pixel_mask.shape}, but the spectra have {wavelengths.shape}"
+                raise ValueError(msg)
+            valid &= ~self.pixel_mask
+        valid.flags.writeable = False
+
+        self._compiled[key] = valid
+        if len(self._compiled) > self._cache_size:
+            self._compiled.popitem(last=False)
+        return valid
+
+    def apply(self, wavelengths, spectra) -> np.ndarray:
+        """Copy of the spectra, with the flux of the masked pixels set to zero (i.e. ignored by the normalization)."""
+        spectra = np.asarray(spectra)
+        return np.where(self.compile(wavelengths), spectra, 0).astype(spectra.dtype, copy=False)
+
+    def __repr__(self) -> str:
+        pixels = "no" if self.pixel_mask is None else "with"
+        return f"SpectralMask({self.starts.size} intervals, {pixels} pixel mask)"
+
+
+def as_spectral_mask(mask) -> SpectralMask:
+    """Build a SpectralMask from either a boolean array with the bad pixels or a list of wavelength intervals."""
+    if isinstance(mask, SpectralMask):
+        return mask
+    if np.asarray(mask).dtype == bool:
+        return SpectralMask(pixel_mask=mask)
+    return SpectralMask(intervals=mask)
+
+
+def _merge_intervals(intervals: Iterable[tuple[float, float]]) -> tuple[np.ndarray, np.ndarray]:
+    """Sorted starts and ends of the intervals, after merging the ones that overlap."""
+    starts, ends = [], []
+    for start, end in sorted((min(interval), max(interval)) for interval in intervals):
+        if starts and start <= ends[-1]:
+            ends[-1] = max(ends[-1], end)
+        else:
+            starts.append(start)
+            ends.append(end)
+    return np.asarray(starts, dtype=np.float64), np.asarray(ends, dtype=np.float64)
@@ -1,7 +1,9 @@
-from scipy import interpolate
 import math
 from scipy.signal import find_peaks
 import numpy as np
+
+from SNT import interpolators
+
 # class p_map:  # defines methods for computing the penalty map (to increase or decrease the radius in diferent zones)
 
 
@@ -20,49 +22,46 @@ def b_search(arr, x):
     return -1
 
 
-def rolling_max(ys, xs, w_size):
-    # adjust aprox continuum using rolling max (w_size=size of the window) and linear interpolation
-    x_cont = []
-    y_cont = []
+def rolling_max_indices(ys, xs, w_size):
+    # indices of the maximum flux inside each window (w_size=size of the window, in wavelength)
+    max_indices = []
     i = 0
     flag = 0
     end_inter = min(xs) + w_size
     while True:
         points_cont = []
         while xs[i] < end_inter:
-            points_cont.append((xs[i], ys[i]))
+            points_cont.append(i)
             i += 1
             if i == (len(xs) - 1):
                 flag = 1
                 break
         if len(points_cont) == 0:
-            # If there are gaps in the data, keep on increasing the
-            # window edge
-            end_inter += w_size
+            # If there are gaps in the data, move the window edge
+            # straight to the window that holds the next point
+            end_inter += w_size * (math.floor((xs[i] - end_inter) / w_size) + 1)
             continue
-        max_p = max(points_cont, key=lambda v: v[1])
-        x_cont.append(max_p[0])
-        y_cont.append(max_p[1])
+        max_indices.append(max(points_cont, key=lambda idx: ys[idx]))
         end_inter += w_size
         if flag == 1:
-            s1 = interpolate.interp1d(
-                x_cont,
-                y_cont,
-                kind="linear",
-                axis=-1,
-                copy=True,
-                bounds_error=False,
-                fill_value="nan",
-                assume_sorted=False,
-            )
-            return s1
+            return max_indices
+
+
+def rolling_max(ys, xs, w_size, max_indices=None):
+    # adjust aprox continuum using rolling max (w_size=size of the window), returns the points of the continuum
+    # max_indices can be given, if they were already computed with rolling_max_indices
+    if max_indices is None:
+        max_indices = rolling_max_indices(ys, xs, w_size)
+    x_cont = np.asarray([xs[idx] for idx in max_indices])
+    y_cont = np.asarray([ys[idx] for idx in max_indices])
+    return x_cont, y_cont
 
 
 def penalty(s1, s2, wavelengths):
-    # calculates the relative difference between continuums s1 and s2
+    # calculates the relative difference between continuums s1 and s2 (linear interpolation of the rolling max points)
     ps = []
-    s1_w = s1(wavelengths)
-    s2_w = s2(wavelengths)
+    s1_w = interpolators.evaluate(*s1, wavelengths, "linear")
+    s2_w = interpolators.evaluate(*s2, wavelengths, "linear")
 
     for s1w, s2w in zip(s1_w, s2_w):
         if math.isnan(s1w) or math.isnan(s2w) or s2w == 0:
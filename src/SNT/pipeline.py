@@ -0,0 +1,247 @@
+"""Registry of the stages that normalize one spectral order.
+
+Each stage has a fixed contract: it reads some named arrays (its inputs) from a dictionary with the data of the order
+and returns new or updated arrays (its outputs). For example, the smooth stage reads the flux and returns the smoothed
+flux. The stages run in this order::
+
+    clip -> sigma_clip -> smooth -> maxima -> penalty -> anchors -> outliers -> continuum
+
+A stage can have many implementations (backends), which are selected through the stage_backends configuration,
+e.g. ``{"smooth": "my_filter"}``. The default backends are registered by :py:mod:`SNT.snt`, and new ones with::
+
+    @register_backend("smooth", "my_filter")
+    def my_filter(data, config):
+        return {"flux": ...}
+
+The stages that only update their inputs (sigma_clip, smooth and outliers) can be skipped, through skip_stages. The
+outputs of the stages in cached_stages are kept in memory, indexed by the inputs and configuration values of the
+stage, so that they are reused by later runs (e.g. when only the alpha shape parameters change). As the cached
+arrays are shared, the backends must not modify their inputs.
+
+The backends are looked up in the process that runs each order, so the ones used with a process pool (or any other
+executor) must be registered when their module is imported.
+"""
+
+from __future__ import annotations
+
+import hashlib
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Callable
+
+import numpy as np
+
+from SNT.utils.exceptions import InvalidConfiguration
+from SNT.utils.parameter_validators import Constraint
+
+if TYPE_CHECKING:
+    from SNT.utils.SNT_configs import SNTConfig
+
+DEFAULT_BACKEND = "default"
+# Number of stage outputs that are kept in the cache (of each process)
+CACHE_SIZE = 128
+
+
+@dataclass
+class Stage:
+    """Contract of one stage: the data that it reads and returns, and the configuration values that it uses."""
+
+    name: str
+    inputs: tuple[str, ...]
+    outputs: tuple[str, ...]
+    params: tuple[str, ...] = ()
+    backends: dict[str, Callable[[dict[str, Any], SNTConfig], dict[str, Any]]] = field(default_factory=dict)
+
+    @property
+    def skippable(self) -> bool:
+        """Only the stages that update their inputs can be skipped, as the others would leave missing data."""
+        return set(self.outputs) <= set(self.inputs)
+
+
+STAGES = {
+    stage.name: stage
+    for stage in [
+        Stage(
+            "clip",
+            inputs=("wavelengths", "flux", "FWHM"),
+            outputs=("wavelengths", "flux", "min_lambda", "FWHM_WL", "clip_window", "savgol_window"),
+            params=("remove_n_first", "adaptive_windows"),
+        ),
+        Stage(
+            "sigma_clip",
+            inputs=("wavelengths", "flux", "clip_window"),
+            outputs=("wavelengths", "flux"),
+            params=("dtype",),
+        ),
+        Stage("smooth", inputs=("flux", "savgol_window"), outputs=("flux",), params=("usefilter",)),
+        Stage("maxima", inputs=("flux",), outputs=("max_index",), params=("max_vicinity",)),
+        Stage(
+            "penalty",
+            inputs=("wavelengths", "flux", "FWHM_WL"),
+            outputs=("s1_index", "s1", "ps", "step_y", "step_x"),
+            params=("radius_max",),
+        ),
+        Stage(
+            "anchors",
+            inputs=("max_index", "flux", "wavelengths", "min_lambda", "FWHM_WL", "s1_index", "s1", "step_y", "step_x"),
+            outputs=("anchors_x", "anchors_y", "anchors_idx", "fallback"),
+            params=(
+                "radius_min",
+                "radius_max",
+                "nu",
+                "use_RIC",
+                "stretching",
+                "coarse_anchor_search",
+                "coarse_refine_window",
+                "coarse_tolerance",
+                "max_anchor_iterations",
+                "order_time_budget",
+            ),
+        ),
+        Stage(
+            "outliers",
+            inputs=("anchors_x", "anchors_y", "anchors_idx", "flux", "fallback"),
+            outputs=("anchors_x", "anchors_y", "anchors_idx"),
+            params=("niter_peaks_remove", "use_denoise", "denoising_distance"),
+        ),
+        Stage(
+            "continuum",
+            inputs=("wavelengths", "anchors_x", "anchors_y"),
+            outputs=("continuum",),
+            params=("interp",),
+        ),
+    ]
+}
+STAGE_NAMES = tuple(STAGES)
+
+_cache: OrderedDict[tuple, dict[str, Any]] = OrderedDict()
+
+
+class RegisteredBackends(Constraint):
+    def __init__(self):
+        """Check that the value maps existing stages to backends that are registered for them.
+
+        The registry is read when the value is checked, so that the backends registered after the import of SNT are
+        also accepted.
+        """
+        super().__init__(const_text="Backends registered for the pipeline stages")
+
+    def _evaluate(self, param_name: str, value: Any) -> None:
+        try:
+            pairs = [(stage, backend) for stage, backend in (value.items() if isinstance(value, dict) else value)]
+        except (TypeError, ValueError) as e:
+            msg = f"Config ({param_name}) value ({value}) is not a mapping of stages to backends"
+            raise InvalidConfiguration(msg) from e
+
+        for stage, backend in pairs:
+            if stage not in STAGES:
+                msg = f"Config ({param_name}) has an unknown stage <{stage}>, the available ones are {STAGE_NAMES}"
+                raise InvalidConfiguration(msg)
+            if backend not in STAGES[stage].backends:
+                msg = (
+                    f"Config ({param_name}) has an unknown backend <{backend}> of the stage <{stage}>, the available "
+                    f"ones are {list(STAGES[stage].backends)}"
+                )
+                raise InvalidConfiguration(msg)
+
+
+def register_backend(stage: str, backend: str = DEFAULT_BACKEND) -> Callable:
+    """Decorator that registers a function as one implementation of a stage.
+
+    The function is called with the data of the order (a dictionary with, at least, the inputs of the stage) and the
+    configuration, and returns a dictionary with the outputs of the stage.
+
+    Args:
+        stage (str): Name of the stage
+        backend (str, optional): Name of the backend, used in the stage_backends configuration. Defaults to
+            "default".
+
+    Raises:
+        KeyError: If the stage does not exist
+
+    """
+    if stage not in STAGES:
+        msg = f"Unknown stage <{stage}>, the available ones are {STAGE_NAMES}"
+        raise KeyError(msg)
+
+    def decorator(fn: Callable) -> Callable:
+        STAGES[stage].backends[backend] = fn
+        return fn
+
+    return decorator
+
+
+def run_stage(name: str, data: dict[str, Any], config: SNTConfig) -> dict[str, Any]:
+    """Run one stage, with the backend selected in the configuration.
+
+    Args:
+        name (str): Name of the stage
+        data (dict[str, Any]): Data of the order, with (at least) the inputs of the stage
+        config (SNTConfig): SNT configuration
+
+    Returns:
+        dict[str, Any]: Outputs of the stage. A skipped stage returns its inputs, unchanged
+
+    Raises:
+        InvalidConfiguration: If the backend is not registered or the stage can't be skipped
+
+    """
+    stage = STAGES[name]
+    if name in config.skip_stages:
+        if not stage.skippable:
+            msg = f"The stage <{name}> can't be skipped"
+            raise InvalidConfiguration(msg)
+        return {key: data[key] for key in stage.outputs}
+
+    backend = dict(config.stage_backends).get(name, DEFAULT_BACKEND)
+    if backend not in stage.backends:
+        msg = f"Unknown backend <{backend}> of the stage <{name}>, the available ones are {list(stage.backends)}"
+        raise InvalidConfiguration(msg)
+
+    if name not in config.cached_stages:
+        return stage.backends[backend](data, config)
+
+    params = tuple(config[param] for param in stage.params)
+    key = (name, backend, params, *(_digest(data[input_name]) for input_name in stage.inputs))
+    if key in _cache:
+        _cache.move_to_end(key)
+        return _cache[key]
+    outputs = stage.backends[backend](data, config)
+    _cache[key] = outputs
+    if len(_cache) > CACHE_SIZE:
+        _cache.popitem(last=False)
+    return outputs
+
+
+def run_stages(names: tuple[str, ...], data: dict[str, Any], config: SNTConfig) -> dict[str, Any]:
+    """Run the stages in sequence, updating a copy of the data with the outputs of each one."""
+    data = dict(data)
+    for name in names:
+        data.update(run_stage(name, data, config))
+    return data
+
+
+def uses_default_backends(names: tuple[str, ...], config: SNTConfig) -> bool:
+    """Whether the stages run their default backends (i.e. they are not skipped or replaced by another backend)."""
+    backends = dict(config.stage_backends)
+    return all(backends.get(name, DEFAULT_BACKEND) == DEFAULT_BACKEND for name in names) and not any(
+        name in config.skip_stages for name in names
+    )
+
+
+def clear_cache() -> None:
+    """Remove all cached stage outputs."""
+    _cache.clear()
+
+
+def _digest(value: Any) -> tuple:
+    """Hashable fingerprint of one input of a stage."""
+    if isinstance(value, np.ndarray):
+        array = np.ascontiguousarray(value)
+        return (array.dtype.str, array.shape, hashlib.sha1(array.data).hexdigest())  # noqa: S324
+    if isinstance(value, (list, tuple)):
+        if value and isinstance(value[0], (np.ndarray, list, tuple)):
+            # e.g. the (x, y) pairs of the rolling maximum
+            return tuple(_digest(item) for item in value)
+        return _digest(np.asarray(value))
+    return (repr(value),)
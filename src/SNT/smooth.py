@@ -1,5 +1,6 @@
 import math
 import numpy as np
+from loguru import logger
 
 from SNT import smooth
 
@@ -57,12 +58,13 @@ def sigma_clip_iqr(
     lower = q25 - 1.5 * iqr
     for i in range(1, l - 1):  # for each pair keeps the one that maximises equidistance to neighbours
         if distance[i] < lower:
+            # the values are only formatted if the debug records are logged
             if distance[i - 1] < distance[i + 1]:
-                print("removed close points:", anchors_x[i])
+                logger.debug("Removed close anchor at {}", anchors_x[i])
                 anchors_x.pop(i)
                 anchors_y.pop(i)
             else:
-                print("removed close points", anchors_x[i])
+                logger.debug("Removed close anchor at {}", anchors_x[i + 1])
                 anchors_x.pop(i + 1)
                 anchors_y.pop(i + 1)
     return
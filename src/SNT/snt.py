@@ -1,18 +1,29 @@
 import json
-import multiprocessing
+import time
 from collections import defaultdict
-from functools import partial
 from pathlib import Path
-from typing import Any, Optional
+from typing import Any, Callable, Optional
 
 import numpy as np
 import scipy.constants as constant
 from loguru import logger
-from matplotlib import pyplot as plt
+from matplotlib.figure import Figure
+from numpy.lib.stride_tricks import sliding_window_view
 from scipy.signal import find_peaks, savgol_filter
 
-from SNT import alphashape, interpolators, penalty, smooth
-from SNT.utils.SNT_configs import construct_SNT_configs
+from SNT import alphashape, batch, interpolators, penalty, pipeline, smooth
+from SNT.continuum import ContinuumModel, save_models
+from SNT.executors import ProcessPool, SupportsSubmit, choose_workers, dispatch, pool_size
+from SNT.masks import SpectralMask, as_spectral_mask
+from SNT.store import OrderStore
+from SNT.utils.exceptions import BudgetExceeded
+from SNT.utils.resources import ResourceReport, Stopwatch, peak_rss
+from SNT.utils.SNT_configs import SNTConfig, build_SNT_config
+
+# Sampling, in pixels per FWHM, for which the fixed window sizes are used (when running with adaptive windows)
+REFERENCE_PIXELS_PER_FWHM = 10
+CLIP_WINDOW = 20
+SAVGOL_WINDOW = 11
 
 
 def normalize_spectra(
@@ -25,171 +36,818 @@ def normalize_spectra(
     FWHM_override: Optional[float] = None,  # noqa: N803
     store_to_disk: bool = True,
     fname: str | None = None,
+    executor: SupportsSubmit | None = None,
+    reference_anchors: dict[str, list] | str | Path | None = None,
+    doppler_shift: float = 0.0,
+    retry_config: dict[str, Any] | None = None,
+    return_byproducts: bool = False,
+    mask: SpectralMask | np.ndarray | list[tuple[float, float]] | None = None,
+    order_store: OrderStore | str | Path | None = None,
 ):
-    wavelengths = np.asarray(wavelengths)
-    spectra = np.asarray(spectra)
-    if spectra.ndim == 1:
-        wavelengths = wavelengths[np.newaxis, :]
-        spectra = spectra[np.newaxis, :]
-
-    if FWHM_KW is None:
-        # Default to ESO pipeline
-        FWHM_KW = "HIERARCH ESO QC CCF FWHM"
-
-    FWHM = header[FWHM_KW] if FWHM_override is None else FWHM_override  # FWHM in Km/s
-
-    # FWHM_WL=0.1 in case the spectre doesn't include information about FWHM
-
-    config = construct_SNT_configs(user_configs=user_config)
-
-    # ---------------------------------
-    logger.debug("Running...")
-    # -----------Smoothing------------------------------------------
-    continuum_values = np.zeros_like(wavelengths)
-
-    byproducts = defaultdict(list)
-    if config["parallel_orders"]:
-        ff = partial(normalize_row, FWHM=FWHM, config=config)
-        with multiprocessing.Pool(config["Ncores"]) as p:
-            out = p.starmap(ff, zip(wavelengths, spectra))
-        for index, entry in enumerate(out):
-            continuum_values[index] = entry[0]
-            for key, value in entry[1].items():
-                byproducts[key].append(value)
-            byproducts["order_index"].append(index)
-    else:
-        for row_index, row in enumerate(spectra):
-            cont, fit_metrics = normalize_row(wavelengths[row_index], row, FWHM, config=config)
-            for key, value in fit_metrics.items():
-                byproducts[key].append(value)
+    """Normalize a spectrum (S1D or S2D).
+
+    Args:
+        wavelengths: Wavelengths, either a 1D array or a 2D array (one row per order)
+        spectra: Flux, with the same shape as the wavelengths
+        header: Header of the observation, used to get the FWHM
+        output_path: Folder in which the SNT_data folder (with the data products) will be created
+        user_config (dict[str, Any] | None, optional): Values that will override the default configuration.
+            Defaults to None.
+        FWHM_KW (Optional[str], optional): Header keyword with the FWHM (in km/s). Defaults to the ESO CCF FWHM.
+        FWHM_override (Optional[float], optional): If given, FWHM (in km/s) used instead of the header value.
+            Defaults to None.
+        store_to_disk (bool, optional): Store the data products to disk. Defaults to True.
+        fname (str | None, optional): Name used for the data products. Defaults to None.
+        executor (SupportsSubmit | None, optional): Executor-compatible object used to run the orders.
+            Defaults to None.
+        reference_anchors (dict[str, list] | str | Path | None, optional): Anchors of a reference epoch of the same
+            star (either the dictionary or the path to the anchors file). If given, each order starts from these
+            anchors and is only normalized from scratch if its continuum changed. As the preprocessing then dominates
+            the run time, all orders are preprocessed at once (see batch_preprocessing). Defaults to None.
+        doppler_shift (float, optional): Velocity, in km/s, of this epoch with respect to the reference epoch.
+            Defaults to 0.0.
+        retry_config (dict[str, Any] | None, optional): Configuration values used to retry the orders that failed.
+            Defaults to None.
+        return_byproducts (bool, optional): Also return the byproducts of the fit (anchors, errors, ...), with one
+            entry per order, and the resource report of the frame (under the "resources" key). Defaults to False.
+        mask (SpectralMask | np.ndarray | list[tuple[float, float]] | None, optional): Regions that are ignored
+            when searching for the continuum, either a SpectralMask, a boolean array that is True in the bad pixels
+            or a list of wavelength intervals. The continuum is still evaluated over the full orders. Defaults to
+            None.
+        order_store (OrderStore | str | Path | None, optional): Store (or its path) in which the wavelengths,
+            continuum and anchors of each order are appended, instead of writing the continuum text file (or the
+            continuum models). Only used when storing to disk, with fname as the frame name. Defaults to None.
+
+    Returns:
+        np.ndarray | list[ContinuumModel]: Continuum, with the same shape as the (2D) wavelengths. If the
+            continuum_output is set to "model", a list with the continuum model of each order. If return_byproducts
+            is True, a tuple with the continuum and the dictionary of byproducts.
+
+    """
+    with logger.contextualize(frame=fname):
+        stopwatch = Stopwatch()
+        config = build_SNT_config(user_configs=user_config)
+
+        # Only the flux (and the continuum) follow the configured dtype, the wavelengths are kept in double precision
+        wavelengths = np.asarray(wavelengths, dtype=np.float64)
+        spectra = np.asarray(spectra, dtype=config.dtype)
+        if spectra.ndim == 1:
+            wavelengths = wavelengths[np.newaxis, :]
+            spectra = spectra[np.newaxis, :]
+        if mask is not None:
+            # the masked pixels are dropped, in the same way as the ones with zero flux
+            spectra = as_spectral_mask(mask).apply(wavelengths, spectra)
+
+        if FWHM_KW is None:
+            # Default to ESO pipeline
+            FWHM_KW = "HIERARCH ESO QC CCF FWHM"
+
+        FWHM = header[FWHM_KW] if FWHM_override is None else FWHM_override  # FWHM in Km/s
+
+        # FWHM_WL=0.1 in case the spectre doesn't include information about FWHM
+
+        # ---------------------------------
+        logger.debug("Running...")
+        # -----------Smoothing------------------------------------------
+
+        warm_start = None
+        if reference_anchors is not None:
+            if not isinstance(reference_anchors, dict):
+                reference_anchors = load_anchors(reference_anchors)
+            if len(reference_anchors["anchors_x"]) != spectra.shape[0]:
+                msg = "The reference anchors don't have the same number of orders as the spectra"
+                raise ValueError(msg)
+            warm_start = [
+                (reference_x, reference_y, doppler_shift)
+                for reference_x, reference_y in zip(reference_anchors["anchors_x"], reference_anchors["anchors_y"])
+            ]
+
+        orders_metrics = run_orders(
+            wavelengths,
+            spectra,
+            FWHM,
+            config=config,
+            executor=executor,
+            warm_start=warm_start,
+            retry_config=retry_config,
+            frame=fname,
+        )
+        byproducts = defaultdict(list)
+        metric_names = dict.fromkeys(key for fit_metrics in orders_metrics for key in fit_metrics)
+        for row_index, fit_metrics in enumerate(orders_metrics):
+            for key in metric_names:
+                byproducts[key].append(fit_metrics.get(key))
             byproducts["order_index"].append(row_index)
-            continuum_values[row_index] = cont
-    # export results to csv
-
-    if not isinstance(output_path, Path):
-        output_path = Path(output_path)
-    output_path /= "SNT_data"
-
-    if store_to_disk:
-        output_path.mkdir(exist_ok=True)
-
-        logger.info(f"Data storage folder set to {output_path}")
-        logger.info("Saving text files")
-
-        anchors = {}
-        for key in ["anchors_x", "anchors_y"]:
-            anchors[key] = byproducts[key]
-        with open(output_path / f"{fname}_anchors.csv", mode="w") as tow:
-            json.dump(fp=tow, obj=anchors)
-
-        array1 = wavelengths.T
-        array2 = continuum_values.T
-        merged_array = np.empty((array1.shape[0], array1.shape[1] + array2.shape[1]), dtype=array1.dtype)
-
-        merged_array[:, ::2] = array1
-        merged_array[:, 1::2] = array2
-
-        np.savetxt(fname=output_path / f"{fname}_continuum.txt", X=merged_array, delimiter=",", header="wave, flux")
-        if config["run_plot_generation"]:
-            logger.info("Generating plots")
-            fig, ax = plt.subplots(2, sharex=True)
-            # To account for the fact that everything will be a list of lists
-            for a, b in zip(byproducts["max_pos"], byproducts["max_ys"]):
-                ax[0].scatter(a, b, color="g", s=15)
-            for a, b in zip(byproducts["anchors_x"], byproducts["anchors_y"]):
-                ax[0].scatter(a, b, color="r", s=20)
-            for row_index in range(wavelengths.shape[0]):
-                ax[0].plot(wavelengths[row_index], spectra[row_index])
-                ax[0].plot(wavelengths[row_index], continuum_values[row_index], color="r")
-            ax[0].set_ylabel("flux")
-
-            for a, b in zip(byproducts["step_x"], byproducts["step_y"]):
-                ax[1].plot(a, b, color="black")
-            ax[1].set_xlabel("wavelengths")
-            ax[1].set_ylabel("RIC")
-            fig.savefig(output_path / f"{fname}_continuum_plot.png", dpi=600)
-            # ----------------------------------
+
+        failed_orders = [index for index, error in enumerate(byproducts["error"]) if error is not None]
+        if failed_orders:
+            logger.warning(f"Failed to normalize {len(failed_orders)} orders: {failed_orders}")
+
+        if config.continuum_output == "model":
+            models = [
+                ContinuumModel(anchors_x, anchors_y, config.interp)
+                for anchors_x, anchors_y in zip(byproducts["anchors_x"], byproducts["anchors_y"])
+            ]
+        else:
+            # The workers only return the anchors, the continuum of all orders is evaluated at once
+            continuum_values = np.zeros(wavelengths.shape, dtype=config.dtype)
+            evaluate_continua(wavelengths, byproducts["anchors_x"], byproducts["anchors_y"], config, out=continuum_values)
+        # export results to csv
+
+        if not isinstance(output_path, Path):
+            output_path = Path(output_path)
+        output_path /= "SNT_data"
+
+        artifacts = {}
+        if store_to_disk:
+            output_path.mkdir(exist_ok=True)
+
+            logger.info(f"Data storage folder set to {output_path}")
+            logger.info("Saving text files")
+
+            anchors = {}
+            for key in ["anchors_x", "anchors_y"]:
+                anchors[key] = byproducts[key]
+            artifacts["anchors"] = output_path / f"{fname}_anchors.csv"
+            with open(artifacts["anchors"], mode="w") as tow:
+                json.dump(fp=tow, obj=anchors)
+
+            if order_store is not None:
+                # the orders go to the (shared) store, instead of a file per frame
+                if not isinstance(order_store, OrderStore):
+                    order_store = OrderStore(order_store)
+                arrays = {"wavelengths": wavelengths, **anchors}
+                if config.continuum_output != "model":
+                    arrays["continuum"] = continuum_values
+                artifacts["order_store"] = order_store.append_frame(str(fname), arrays)
+            elif config.continuum_output == "model":
+                artifacts["continuum_models"] = output_path / f"{fname}_continuum_models.json"
+                save_models(artifacts["continuum_models"], models)
+            else:
+                artifacts["continuum"] = output_path / f"{fname}_continuum.txt"
+                write_continuum(artifacts["continuum"], wavelengths, continuum_values)
+            if config.run_plot_generation:
+                logger.info("Generating plots")
+                # not through pyplot, which is not thread-safe and keeps a reference to every figure
+                fig = Figure()
+                ax = fig.subplots(2, sharex=True)
+                # To account for the fact that everything will be a list of lists
+                for a, b in zip(byproducts["max_pos"], byproducts["max_ys"]):
+                    ax[0].scatter(a, b, color="g", s=15)
+                for a, b in zip(byproducts["anchors_x"], byproducts["anchors_y"]):
+                    ax[0].scatter(a, b, color="r", s=20)
+                for row_index in range(wavelengths.shape[0]):
+                    ax[0].plot(wavelengths[row_index], spectra[row_index])
+                    if config.continuum_output == "model":
+                        row_continuum = models[row_index](wavelengths[row_index])
+                    else:
+                        row_continuum = continuum_values[row_index]
+                    ax[0].plot(wavelengths[row_index], row_continuum, color="r")
+                ax[0].set_ylabel("flux")
+
+                for a, b in zip(byproducts["step_x"], byproducts["step_y"]):
+                    ax[1].plot(a, b, color="black")
+                ax[1].set_xlabel("wavelengths")
+                ax[1].set_ylabel("RIC")
+                artifacts["plot"] = output_path / f"{fname}_continuum_plot.png"
+                fig.savefig(artifacts["plot"], dpi=600)
+                # ----------------------------------
+        else:
+            logger.warning("Disabled disk storage of data products")
+
+        report = ResourceReport.from_byproducts(stopwatch, byproducts, artifacts)
+        logger.info(f"Resource usage:\n{report.summary()}")
+        byproducts["resources"] = report.as_dict()
+
+        output = models if config.continuum_output == "model" else continuum_values
+        if return_byproducts:
+            return output, dict(byproducts)
+        return output
+
+
+def write_continuum(path: Path, wavelengths, continuum_values, chunk_size: int = 4096) -> None:
+    """Store the continuum to a text file, with the wavelength and continuum of each order in interleaved columns.
+
+    The columns are merged in chunks of pixels, to avoid a (full) copy of the arrays.
+
+    Args:
+        path (Path): Path of the output file
+        wavelengths: 2D array with the wavelengths of each order
+        continuum_values: 2D array with the continuum of each order
+        chunk_size (int, optional): Number of pixels written at once. Defaults to 4096.
+
+    """
+    n_orders, n_pixels = wavelengths.shape
+    with open(path, mode="w") as file:
+        for start in range(0, n_pixels, chunk_size):
+            stop = min(start + chunk_size, n_pixels)
+            merged_array = np.empty((stop - start, 2 * n_orders), dtype=wavelengths.dtype)
+            merged_array[:, ::2] = wavelengths[:, start:stop].T
+            merged_array[:, 1::2] = continuum_values[:, start:stop].T
+            np.savetxt(file, X=merged_array, delimiter=",", header="wave, flux" if start == 0 else "")
+
+
+def run_orders(
+    wavelengths,
+    spectra,
+    FWHM,
+    config: SNTConfig,
+    executor: SupportsSubmit | None = None,
+    warm_start: list[tuple] | None = None,
+    retry_config: dict[str, Any] | None = None,
+    frame: str | None = None,
+):
+    """Normalize all spectral orders, either serially or through an executor.
+
+    When an executor is used, each order is sent as a self-contained work unit, i.e. the order arrays, the FWHM and
+    a plain dictionary with the configuration values, so that the workers don't need any SNT object.
+
+    The failure of one order (either an exception or a timeout) does not affect the others. The failed order has no
+    anchors (i.e. a NaN continuum) and the error is stored in its fit metrics. If retry_config is given, the failed
+    orders are run once more, with those values overriding the configuration. The timeout of each order only counts
+    the time since a worker started it, which the executor signals by marking its future as running (the orders of
+    executors that never do so are not timed out).
+
+    If parallel_orders is "auto", the most expensive order is run first, in this process (or, with an order_timeout,
+    in a worker of its own). Its run time, scaled by the estimated cost of the other orders, sets the number of
+    workers used for them, which is bounded by Ncores and the number of orders. Small frames, for which starting a
+    pool would take longer than it saves, are run serially. If the probe order times out, it fails like any other
+    order and the others are run with Ncores workers. The number of processes is stored in the fit metrics of each
+    order.
+
+    Args:
+        wavelengths: 2D array with the wavelengths of each order
+        spectra: 2D array with the flux of each order
+        FWHM: FWHM, in km/s
+        config (SNTConfig): SNT configuration
+        executor (SupportsSubmit | None, optional): Executor used to run the orders. If None, a process pool is
+            created when running in parallel mode. Defaults to None.
+        warm_start (list[tuple] | None, optional): For each order, the anchors (x and y) of the reference epoch and
+            the Doppler shift. If None, all orders are normalized from scratch. Defaults to None.
+        retry_config (dict[str, Any] | None, optional): Configuration values used to retry the failed orders.
+            Defaults to None.
+        frame (str | None, optional): Name of the frame, added (with the order) to the records that are logged
+            while fitting each order. Defaults to None.
+
+    Returns:
+        list[dict]: Fit metrics (including the anchors) of each order. The workers entry holds the number of
+        processes used to run the orders (None for an external executor)
+
+    """
+    if warm_start is None:
+        warm_start = [None] * len(spectra)
+
+    preprocessed = [None] * len(spectra)
+    # the batch replaces the (default) preprocessing and maxima stages of all orders. It is always used with the warm
+    # start, whose orders only re-measure the anchors after the preprocessing
+    batch_stages = (*PREPROCESSING_STAGES, "maxima")
+    use_batch = config.batch_preprocessing or any(reference is not None for reference in warm_start)
+    if use_batch and pipeline.uses_default_backends(batch_stages, config):
+        preprocessed = batch.preprocess_orders(wavelengths, spectra, FWHM, config)
+
+    config_values = config.as_dict()
+    units = [
+        (wave, flux, FWHM, config_values, reference, rows, {"frame": frame, "order": order})
+        for order, (wave, flux, reference, rows) in enumerate(zip(wavelengths, spectra, warm_start, preprocessed))
+    ]
+    orders_metrics, errors, n_workers = _run_units(units, config, executor)
+
+    if errors and retry_config:
+        logger.info(f"Retrying {len(errors)} failed orders")
+        retry_values = {**config_values, **retry_config}
+        retry_units = [(*units[index][:3], retry_values, units[index][4], None, units[index][6]) for index in errors]
+        retry_metrics, retry_errors, _ = _run_units(retry_units, build_SNT_config(retry_values), executor)
+
+        remaining_errors = {}
+        for position, index in enumerate(errors):
+            if position in retry_errors:
+                remaining_errors[index] = retry_errors[position]
+            else:
+                orders_metrics[index] = retry_metrics[position]
+                orders_metrics[index]["retried"] = True
+        errors = remaining_errors
+
+    for index, error in errors.items():
+        logger.warning(f"Failed to normalize order {index}: {error!r}")
+        orders_metrics[index] = failed_fit_metrics(error)
+
+    for fit_metrics in orders_metrics:
+        fit_metrics.setdefault("error", None)
+        fit_metrics.setdefault("retried", False)
+        fit_metrics["workers"] = n_workers
+    return orders_metrics
+
+
+def _run_units(
+    units: list[tuple], config: SNTConfig, executor: SupportsSubmit | None, fn: Callable | None = None
+) -> tuple[list, dict[int, BaseException], int | None]:
+    """Run fn (by default, normalize_work_unit) over the units of all orders, as configured.
+
+    Returns:
+        tuple: Result of each unit (None if it failed), the exceptions of the failed units (indexed by their position)
+        and the number of processes used (None for an external executor)
+
+    """
+    fn = normalize_work_unit if fn is None else fn
+    costs = [estimate_order_cost(unit[1]) for unit in units]
+    if executor is not None:
+        timeout = config.order_timeout or None
+        return (*dispatch(executor, fn, units, timeout=timeout, costs=costs), None)
+
+    if config.parallel_orders is False or not units:
+        return (*_run_serially(fn, units), 1)
+    if config.parallel_orders is True:
+        n_workers = pool_size(config.Ncores)
+        return (*_run_in_pool(fn, units, config, n_workers, costs), n_workers)
+
+    # The most expensive order is run first, and its time (scaled by the costs) sets the number of workers for the
+    # others. It would also be the last one to finish in the pool, as the orders are sent by their cost
+    probe = int(np.argmax(costs))
+    probe_results, probe_errors, probe_time = _run_probe(fn, units[probe], config)
+    others = [index for index in range(len(units)) if index != probe]
+    timed_out = isinstance(probe_errors.get(0), TimeoutError)
+    if timed_out:
+        # the probe says nothing about the cost of the other orders, which may also get stuck
+        n_workers = pool_size(config.Ncores)
+        logger.warning(f"Probe order timed out, running the other orders in {n_workers} processes")
     else:
-        logger.warning("Disabled disk storage of data products")
+        serial_time = probe_time * sum(costs[index] for index in others) / max(costs[probe], 1)
+        n_workers = choose_workers(serial_time, len(others), pool_size(config.Ncores))
+        logger.info(f"Probe order took {probe_time:.3f} s, running the other orders in {n_workers} processes")
 
-    return continuum_values
+    other_units = [units[index] for index in others]
+    if n_workers == 1 and not timed_out:
+        other_results, other_errors = _run_serially(fn, other_units)
+    else:
+        other_costs = [costs[index] for index in others]
+        other_results, other_errors = _run_in_pool(fn, other_units, config, n_workers, other_costs)
+
+    results = [None] * len(units)
+    errors = {}
+    groups = [([probe], probe_results, probe_errors), (others, other_results, other_errors)]
+    for group, group_results, group_errors in groups:
+        for position, index in enumerate(group):
+            results[index] = group_results[position]
+            if position in group_errors:
+                errors[index] = group_errors[position]
+    return results, errors, n_workers
+
+
+def _run_probe(fn: Callable, unit: tuple, config: SNTConfig):
+    """Run the probe order, returning its result, error (if any) and wall time.
+
+    Without an order_timeout, the probe runs in this process. Otherwise, it runs in a worker of its own, which is
+    stopped if the order times out (the start of the worker is not counted in the wall time).
+    """
+    if not config.order_timeout:
+        stopwatch = Stopwatch()
+        results, errors = _run_serially(fn, [unit])
+        return results, errors, stopwatch.wall_time
+
+    pool = ProcessPool(1)
+    try:
+        stopwatch = Stopwatch()
+        results, errors = dispatch(pool, fn, [unit], timeout=config.order_timeout)
+        return results, errors, stopwatch.wall_time
+    finally:
+        pool.terminate()
+
+
+def _run_serially(fn: Callable, units: list[tuple]):
+    results = [None] * len(units)
+    errors = {}
+    for index, unit in enumerate(units):
+        try:
+            results[index] = fn(*unit)
+        except Exception as e:  # noqa: BLE001
+            errors[index] = e
+    return results, errors
+
+
+def _run_in_pool(fn: Callable, units: list[tuple], config: SNTConfig, n_workers: int, costs: list[int]):
+    timeout = config.order_timeout or None
+    pool = ProcessPool(n_workers)
+    try:
+        # only keep n_workers orders in flight, which gives the idle workers the next order, instead of pre-assigning
+        # contiguous chunks of orders
+        return dispatch(pool, fn, units, max_in_flight=n_workers, timeout=timeout, costs=costs)
+    finally:
+        # also stops the workers that are stuck in an order
+        pool.terminate()
+
+
+def estimate_order_cost(spectra) -> int:
+    """Cheap estimate of the time needed to normalize one order.
+
+    The run time grows with the number of (non-zero) pixels, which sets the cost of the rolling windows, and with the
+    number of local maxima, which are the candidates for the rolling ball. Only the ranking of the orders matters.
+
+    Args:
+        spectra: Flux of the order
+
+    Returns:
+        int: Estimated cost, in arbitrary units
+
+    """
+    flux = np.asarray(spectra)
+    flux = flux[flux != 0]
+    n_maxima = np.count_nonzero((flux[1:-1] > flux[:-2]) & (flux[1:-1] >= flux[2:]))
+    return int(flux.size + n_maxima)
+
+
+def failed_fit_metrics(error: BaseException) -> dict[str, Any]:
+    """Fit metrics of an order that could not be normalized."""
+    return {
+        "anchors_x": [],
+        "anchors_y": [],
+        "max_pos": [],
+        "max_ys": [],
+        "step_y": [],
+        "step_x": [],
+        "ps": [],
+        "fallback": False,
+        "error": repr(error),
+    }
 
 
-def normalize_row(wavelengths, spectra, FWHM, config):
-    remove_n_first = config["remove_n_first"]
-    radius_min = config["radius_min"]
-    radius_max = config["radius_max"]
-    max_vicinity = config["max_vicinity"]
-    global_stretch = config["stretching"]
-    use_pmap = config["use_RIC"]
-    interp = config["interp"]
-    use_denoise = config["use_denoise"]
-    usefilter = config["usefilter"]
-    nu = config["nu"]
-    niter_peaks_remove = config["niter_peaks_remove"]
-    denoising_distance = config["denoising_distance"]
+def normalize_work_unit(
+    wavelengths,
+    spectra,
+    FWHM,
+    config: dict[str, Any],
+    warm_start: tuple | None = None,
+    preprocessed: tuple | None = None,
+    log_context: dict[str, Any] | None = None,
+):
+    """Find the anchors of one spectral order, from a self-contained work unit.
+
+    Args:
+        wavelengths: Wavelengths of the order
+        spectra: Flux of the order
+        FWHM: FWHM, in km/s
+        config (dict[str, Any]): Plain dictionary with the values of all configurable parameters
+        warm_start (tuple | None, optional): Anchors (x and y) of a reference epoch and the Doppler shift.
+            Defaults to None.
+        preprocessed (tuple | None, optional): Output of the batched preprocessing for this order. If given, the
+            order is not preprocessed again. Defaults to None.
+        log_context (dict[str, Any] | None, optional): Context (e.g. the frame and order) added to the records that
+            are logged while fitting the order. Defaults to None.
+
+    Returns:
+        dict: Fit metrics of the order, including the anchors and the resources used by the fit
+
+    """
+    stopwatch = Stopwatch()
+    config = build_SNT_config(config)
+    with logger.contextualize(**(log_context or {})):
+        fit_metrics = _fit_order(wavelengths, spectra, FWHM, config, warm_start, preprocessed)
+    fit_metrics["wall_time"] = stopwatch.wall_time
+    fit_metrics["cpu_time"] = stopwatch.cpu_time
+    fit_metrics["peak_rss"] = peak_rss()
+    return fit_metrics
+
+
+def _fit_order(
+    wavelengths, spectra, FWHM, config: SNTConfig, warm_start: tuple | None, preprocessed: tuple | None = None
+):
+    if preprocessed is None:
+        preprocessed = preprocess_row(wavelengths, spectra, FWHM, config)
+    if warm_start is None:
+        return fit_row(*preprocessed, config=config)
+    return _warm_start_fit(preprocessed, config, *warm_start)
 
-    wavelengths_clip = wavelengths[remove_n_first:]
-    spectra_clip = spectra[remove_n_first:]
 
-    inds = np.where(spectra_clip != 0)
-    wavelengths_clip = wavelengths_clip[inds]
-    spectra_clip = spectra_clip[inds]
-    min_lambda = np.min(wavelengths_clip)
-    FWHM_WL = min_lambda * (FWHM / (constant.c / 1000))  # FWHM in A
+def order_windows(wavelengths, FWHM, adaptive: bool = False) -> tuple[float, int, int]:
+    """Compute the FWHM (in Angstrom) and the window sizes used to process one order.
 
-    spectra_clip, wavelengths_clip = smooth.rolling_sigma_clip(spectra_clip, wavelengths_clip, 20)  # sigma clip twice
-    spectra_clip, wavelengths_clip = smooth.rolling_sigma_clip(spectra_clip, wavelengths_clip, 20)
+    By default, the FWHM is converted with the smallest wavelength of the order and the windows have fixed sizes.
+    In adaptive mode, the FWHM is converted at the center of the order and the sigma clip and savgol windows are
+    scaled with the number of pixels that sample one FWHM.
 
-    if usefilter:
-        spectra_clip = savgol_filter(spectra_clip, window_length=11, polyorder=3)
+    Args:
+        wavelengths: Wavelengths of the order (already clipped)
+        FWHM: FWHM, in km/s
+        adaptive (bool, optional): Scale the windows with the local dispersion. Defaults to False.
 
-    s1 = penalty.rolling_max(spectra_clip, wavelengths_clip, FWHM_WL * 40)
-    s2 = penalty.rolling_max(spectra_clip, wavelengths_clip, FWHM_WL * 40 * 10)
+    Returns:
+        tuple[float, int, int]: FWHM in Angstrom, sigma clip window and savgol window (in pixels)
 
-    ps = penalty.penalty(s1, s2, wavelengths_clip)
-    step = 1 if radius_max < 4 else radius_max / 4
-    step_y, step_x = penalty.step_transform(ps, wavelengths_clip, step)
+    """
+    if not adaptive:
+        return np.min(wavelengths) * (FWHM / (constant.c / 1000)), CLIP_WINDOW, SAVGOL_WINDOW
+
+    FWHM_WL = np.median(wavelengths) * (FWHM / (constant.c / 1000))
+    dispersion = np.median(np.diff(wavelengths))
+    scale = (FWHM_WL / dispersion) / REFERENCE_PIXELS_PER_FWHM
+
+    clip_window = max(5, round(CLIP_WINDOW * scale))
+    # savgol needs an odd window, larger than the polynomial order
+    savgol_window = max(5, round(SAVGOL_WINDOW * scale) | 1)
+    return FWHM_WL, clip_window, savgol_window
+
+
+PREPROCESSING_STAGES = ("clip", "sigma_clip", "smooth")
+FIT_STAGES = ("maxima", "penalty", "anchors", "outliers")
+
+
+def preprocess_row(wavelengths, spectra, FWHM, config: SNTConfig):
+    """Clean and smooth one spectral order, before the search for the continuum.
+
+    Removes the first (remove_n_first) and the zero-flux pixels, sigma clips the flux (twice) and, if configured,
+    applies a savgol filter, i.e. runs the preprocessing stages of the pipeline.
+
+    Returns:
+        tuple: clipped wavelengths, clipped (and smoothed) flux, smallest wavelength and FWHM in Angstrom
 
-    # ----------Alpha shape maxima selection---------------------
-
-    max_index, peaks = find_peaks(spectra_clip, height=0, threshold=None, distance=max_vicinity)
-    wavelengths_a = np.array(wavelengths_clip)
-    max_ys = peaks["peak_heights"]
-    max_pos = wavelengths_a[max_index]
-    anchors_x, anchors_y, anchors_idx = alphashape.anchors(
-        max_index,
-        spectra_clip,
-        wavelengths_clip,
-        step_y,
-        step_x,
-        min_lambda,
-        radius_min,
-        radius_max,
-        nu,
-        use_pmap,
-        global_stretch,
+    """
+    data = pipeline.run_stages(
+        PREPROCESSING_STAGES, {"wavelengths": wavelengths, "flux": spectra, "FWHM": FWHM}, config
     )
+    return data["wavelengths"], data["flux"], data["min_lambda"], data["FWHM_WL"]
 
-    # ------------Outlier removal--------------------------------
 
-    smooth.remove_peaks(anchors_y, anchors_x, anchors_idx, niter_peaks_remove)
-    smooth.remove_close(anchors_y, anchors_x)
+def normalize_row(wavelengths, spectra, FWHM, config: SNTConfig):
+    fit_metrics = fit_row(*preprocess_row(wavelengths, spectra, FWHM, config), config=config)
+    continuum = evaluate_continuum(wavelengths, fit_metrics["anchors_x"], fit_metrics["anchors_y"], config)
+    return continuum.astype(config.dtype, copy=False), fit_metrics
+
 
-    # --------------Interpolation--------------------------------
+def fit_row(wavelengths_clip, spectra_clip, min_lambda, FWHM_WL, max_index=None, *, config: SNTConfig):
+    """Find the anchors of one order, from the outputs of preprocess_row, i.e. run the fit stages of the pipeline.
 
-    if use_denoise:
-        smooth.denoise(anchors_y, anchors_idx, spectra_clip, denoising_distance)
+    The indices of the maxima (max_index) can be given, if they were already found by the batched preprocessing.
+    """
+    data = {"wavelengths": wavelengths_clip, "flux": spectra_clip, "min_lambda": min_lambda, "FWHM_WL": FWHM_WL}
+    stages = FIT_STAGES
+    if max_index is not None:
+        data["max_index"] = max_index
+        stages = FIT_STAGES[1:]
+    data = pipeline.run_stages(stages, data, config)
 
-    fx = interpolators.interpolate_wrapper(anchors_x, anchors_y, interp_type=interp)
+    max_index = data["max_index"]
     fit_metrics = {
-        "anchors_x": anchors_x,
-        "anchors_y": anchors_y,
-        "max_pos": max_pos.tolist(),
-        "max_ys": max_ys.tolist(),
+        "anchors_x": data["anchors_x"],
+        # plain floats, as float32 values can't be stored as json
+        "anchors_y": [float(value) for value in data["anchors_y"]],
+        "max_pos": np.asarray(wavelengths_clip)[max_index].tolist(),
+        "max_ys": spectra_clip[max_index].tolist(),
+        "step_y": data["step_y"],
+        "step_x": data["step_x"],
+        "ps": data["ps"],
+        "fallback": data["fallback"],
+    }
+
+    return fit_metrics
+
+
+def penalty_map(spectra_clip, wavelengths_clip, FWHM_WL, config: SNTConfig):
+    """Rolling maximum and (step transformed) penalty map of one order, from the outputs of preprocess_row.
+
+    Returns:
+        tuple: indices of the rolling maximum, rolling maximum (x and y), penalty and its step transform (y and x)
+
+    """
+    data = {"wavelengths": wavelengths_clip, "flux": spectra_clip, "FWHM_WL": FWHM_WL}
+    outputs = pipeline.run_stage("penalty", data, config)
+    return outputs["s1_index"], outputs["s1"], outputs["ps"], outputs["step_y"], outputs["step_x"]
+
+
+def select_anchors(
+    max_index, spectra_clip, wavelengths_clip, min_lambda, FWHM_WL, s1_index, s1, step_y, step_x, config: SNTConfig
+):
+    """Run the alpha shape over the maxima of one order and remove the outliers from the anchors.
+
+    If the search exceeds its budget, the rolling maximum (s1) is used instead.
+
+    Returns:
+        tuple: wavelengths and flux of the anchors, and whether the rolling maximum was used
+    """
+    data = {
+        "max_index": max_index,
+        "flux": spectra_clip,
+        "wavelengths": wavelengths_clip,
+        "min_lambda": min_lambda,
+        "FWHM_WL": FWHM_WL,
+        "s1_index": s1_index,
+        "s1": s1,
         "step_y": step_y,
         "step_x": step_x,
-        "ps": ps,
     }
+    data = pipeline.run_stages(("anchors", "outliers"), data, config)
+    return data["anchors_x"], data["anchors_y"], data["fallback"]
+
+
+def evaluate_continuum(wavelengths, anchors_x, anchors_y, config: SNTConfig):
+    """Continuum of one order, from its anchors, i.e. run the continuum stage of the pipeline."""
+    data = {"wavelengths": wavelengths, "anchors_x": anchors_x, "anchors_y": anchors_y}
+    return pipeline.run_stage("continuum", data, config)["continuum"]
+
+
+def evaluate_continua(wavelengths, anchors_x, anchors_y, config: SNTConfig, out=None):
+    """Continuum of all orders, from the (ragged) lists with the anchors of each order.
+
+    With the default backend of the continuum stage (and without caching it), all orders are evaluated at once, by
+    interpolators.evaluate_orders. Otherwise, the stage runs for each order.
+    """
+    if pipeline.uses_default_backends(("continuum",), config) and "continuum" not in config.cached_stages:
+        return interpolators.evaluate_orders(anchors_x, anchors_y, wavelengths, config.interp, out=out)
+
+    if out is None:
+        out = np.empty(np.shape(wavelengths))
+    for row, (xs, ys) in enumerate(zip(anchors_x, anchors_y)):
+        out[row] = evaluate_continuum(wavelengths[row], xs, ys, config)
+    return out
+
+
+# ----------Default backends of the pipeline stages---------------------
+
+
+@pipeline.register_backend("clip")
+def _clip_stage(data: dict[str, Any], config: SNTConfig) -> dict[str, Any]:
+    wavelengths_clip = data["wavelengths"][config.remove_n_first :]
+    spectra_clip = data["flux"][config.remove_n_first :]
+
+    inds = np.where(spectra_clip != 0)
+    wavelengths_clip = wavelengths_clip[inds]
+    spectra_clip = spectra_clip[inds]
+    FWHM_WL, clip_window, savgol_window = order_windows(wavelengths_clip, data["FWHM"], config.adaptive_windows)
+    return {
+        "wavelengths": wavelengths_clip,
+        "flux": spectra_clip,
+        "min_lambda": np.min(wavelengths_clip),
+        "FWHM_WL": FWHM_WL,
+        "clip_window": clip_window,
+        "savgol_window": savgol_window,
+    }
+
+
+@pipeline.register_backend("sigma_clip")
+def _sigma_clip_stage(data: dict[str, Any], config: SNTConfig) -> dict[str, Any]:
+    # sigma clip twice
+    spectra_clip, wavelengths_clip = smooth.rolling_sigma_clip(data["flux"], data["wavelengths"], data["clip_window"])
+    spectra_clip, wavelengths_clip = smooth.rolling_sigma_clip(spectra_clip, wavelengths_clip, data["clip_window"])
+    return {"wavelengths": wavelengths_clip, "flux": np.asarray(spectra_clip, dtype=config.dtype)}
+
+
+@pipeline.register_backend("smooth")
+def _smooth_stage(data: dict[str, Any], config: SNTConfig) -> dict[str, Any]:
+    if not config.usefilter:
+        return {"flux": data["flux"]}
+    return {"flux": savgol_filter(data["flux"], window_length=data["savgol_window"], polyorder=3)}
 
-    return fx(wavelengths), fit_metrics
+
+@pipeline.register_backend("maxima")
+def _maxima_stage(data: dict[str, Any], config: SNTConfig) -> dict[str, Any]:
+    max_index, _ = find_peaks(data["flux"], height=0, threshold=None, distance=config.max_vicinity)
+    return {"max_index": max_index}
+
+
+@pipeline.register_backend("penalty")
+def _penalty_stage(data: dict[str, Any], config: SNTConfig) -> dict[str, Any]:
+    spectra_clip, wavelengths_clip, FWHM_WL = data["flux"], data["wavelengths"], data["FWHM_WL"]
+    s1_index = penalty.rolling_max_indices(spectra_clip, wavelengths_clip, FWHM_WL * 40)
+    s1 = penalty.rolling_max(spectra_clip, wavelengths_clip, FWHM_WL * 40, max_indices=s1_index)
+    s2 = penalty.rolling_max(spectra_clip, wavelengths_clip, FWHM_WL * 40 * 10)
+
+    ps = penalty.penalty(s1, s2, wavelengths_clip)
+    step = 1 if config.radius_max < 4 else config.radius_max / 4
+    step_y, step_x = penalty.step_transform(ps, wavelengths_clip, step)
+    return {"s1_index": s1_index, "s1": s1, "ps": ps, "step_y": step_y, "step_x": step_x}
+
+
+@pipeline.register_backend("anchors")
+def _anchors_stage(data: dict[str, Any], config: SNTConfig) -> dict[str, Any]:
+    max_index = data["max_index"]
+    # arguments shared by the coarse and the full search
+    search_args = (
+        data["flux"],
+        data["wavelengths"],
+        data["step_y"],
+        data["step_x"],
+        data["min_lambda"],
+        config.radius_min,
+        config.radius_max,
+        config.nu,
+        config.use_RIC,
+        config.stretching,
+    )
+    budget = {
+        "max_iterations": config.max_anchor_iterations or None,
+        "deadline": time.monotonic() + config.order_time_budget if config.order_time_budget > 0 else None,
+    }
+
+    try:
+        anchors_x = None
+        if config.coarse_anchor_search:
+            # the maxima of the rolling max are a decimated envelope of the spectra
+            refined_index = alphashape.coarse_to_fine_maxima(
+                max_index,
+                data["s1_index"],
+                *search_args,
+                refine_distance=config.coarse_refine_window * data["FWHM_WL"],
+                **budget,
+            )
+            anchors_x, anchors_y, anchors_idx = alphashape.anchors(refined_index, *search_args, **budget)
+            excess = alphashape.envelope_excess(max_index, data["flux"], data["wavelengths"], anchors_x, anchors_y)
+            if excess > config.coarse_tolerance:
+                logger.debug("Coarse search is {:.2%} below the maxima, running the full search", excess)
+                anchors_x = None
+        if anchors_x is None:
+            anchors_x, anchors_y, anchors_idx = alphashape.anchors(max_index, *search_args, **budget)
+    except BudgetExceeded as e:
+        # Flag the order and use the rolling max as continuum, instead of stalling the worker
+        logger.warning(f"{e}; falling back to the rolling max continuum")
+        s1 = data["s1"]
+        return {"anchors_x": s1[0].tolist(), "anchors_y": s1[1].tolist(), "anchors_idx": [], "fallback": True}
+    return {"anchors_x": anchors_x, "anchors_y": anchors_y, "anchors_idx": anchors_idx, "fallback": False}
+
+
+@pipeline.register_backend("outliers")
+def _outliers_stage(data: dict[str, Any], config: SNTConfig) -> dict[str, Any]:
+    if data["fallback"]:
+        # the rolling max is used as it is
+        return {key: data[key] for key in ("anchors_x", "anchors_y", "anchors_idx")}
+
+    # the smooth functions change the lists in place
+    anchors_x, anchors_y, anchors_idx = list(data["anchors_x"]), list(data["anchors_y"]), list(data["anchors_idx"])
+    smooth.remove_peaks(anchors_y, anchors_x, anchors_idx, config.niter_peaks_remove)
+    smooth.remove_close(anchors_y, anchors_x)
+    if config.use_denoise:
+        smooth.denoise(anchors_y, anchors_idx, data["flux"], config.denoising_distance)
+    return {"anchors_x": anchors_x, "anchors_y": anchors_y, "anchors_idx": anchors_idx}
+
+
+@pipeline.register_backend("continuum")
+def _continuum_stage(data: dict[str, Any], config: SNTConfig) -> dict[str, Any]:
+    continuum = interpolators.evaluate(data["anchors_x"], data["anchors_y"], data["wavelengths"], config.interp)
+    return {"continuum": continuum}
+
+
+def load_anchors(path: str | Path) -> dict[str, list]:
+    """Load the anchors that normalize_spectra stores in the {fname}_anchors.csv file."""
+    with open(path) as file:
+        return json.load(file)
+
+
+def warm_start_row(wavelengths, spectra, FWHM, config: SNTConfig, reference_x, reference_y, doppler_shift=0.0):
+    """Normalize one order by re-measuring the flux at the anchors of a reference epoch.
+
+    The reference anchors are Doppler shifted and their flux is re-measured as the maximum of the preprocessed flux
+    within max_vicinity pixels. If the continuum kept its shape, the ratio between the new and the reference fluxes
+    is constant. When the median absolute deviation of the (normalized) ratio is above warm_start_threshold, the
+    order is normalized from scratch.
+
+    Args:
+        wavelengths: Wavelengths of the order
+        spectra: Flux of the order
+        FWHM: FWHM, in km/s
+        config (SNTConfig): SNT configuration
+        reference_x: Wavelength of the anchors of the reference epoch
+        reference_y: Flux of the anchors of the reference epoch
+        doppler_shift (float, optional): Velocity, in km/s, of this epoch with respect to the reference.
+            Defaults to 0.0.
+
+    Returns:
+        tuple: Continuum and fit metrics of the order
+
+    """
+    preprocessed = preprocess_row(wavelengths, spectra, FWHM, config)
+    fit_metrics = _warm_start_fit(preprocessed, config, reference_x, reference_y, doppler_shift)
+    continuum = evaluate_continuum(wavelengths, fit_metrics["anchors_x"], fit_metrics["anchors_y"], config)
+    return continuum.astype(config.dtype, copy=False), fit_metrics
+
+
+def _warm_start_fit(preprocessed: tuple, config: SNTConfig, reference_x, reference_y, doppler_shift):
+    # the output of preprocess_row, or of the batch (which also has the maxima)
+    wavelengths_clip, spectra_clip = np.asarray(preprocessed[0]), preprocessed[1]
+
+    anchors_x = np.asarray(reference_x) * (1 + doppler_shift / (constant.c / 1000))
+    reference_y = np.asarray(reference_y)
+    inside = (anchors_x >= wavelengths_clip[0]) & (anchors_x <= wavelengths_clip[-1])
+    anchors_x = anchors_x[inside]
+    reference_y = reference_y[inside]
+
+    residual = np.inf
+    if anchors_x.size > 1:
+        half_width = max(1, config.max_vicinity // 2)
+        windows = sliding_window_view(np.pad(spectra_clip, half_width, mode="edge"), 2 * half_width + 1)
+        anchors_y = windows[np.searchsorted(wavelengths_clip, anchors_x)].max(axis=1)
+        ratio = anchors_y / reference_y
+        residual = float(np.median(np.abs(ratio / np.median(ratio) - 1)))
+
+    if residual > config.warm_start_threshold:
+        fit_metrics = fit_row(*preprocessed, config=config)
+    else:
+        fit_metrics = {
+            "anchors_x": anchors_x.tolist(),
+            "anchors_y": anchors_y.tolist(),
+            "max_pos": [],
+            "max_ys": [],
+            "step_y": [],
+            "step_x": [],
+            "ps": [],
+            "fallback": False,
+        }
+    fit_metrics["warm_start"] = residual <= config.warm_start_threshold
+    fit_metrics["warm_start_residual"] = residual
+    return fit_metrics
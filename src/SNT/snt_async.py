@@ -0,0 +1,112 @@
+"""Asyncio interface, to normalize spectra from within an event loop without blocking it.
+
+The blocking work of each frame (the dispatch of the orders, the evaluation of the continuum and the disk writes) runs
+in a worker thread, while the orders themselves go to an executor (by default, a process pool that is shared by all
+frames of a batch).
+"""
+
+from __future__ import annotations
+
+import asyncio
+from functools import partial
+from typing import Any, AsyncIterable, Iterable
+
+from SNT.executors import ProcessPool, SupportsSubmit, pool_size
+from SNT.snt import normalize_spectra
+from SNT.utils.SNT_configs import build_SNT_config
+
+
+async def anormalize_spectra(
+    wavelengths,
+    spectra,
+    header,
+    output_path,
+    user_config: dict[str, Any] | None = None,
+    executor: SupportsSubmit | None = None,
+    **kwargs,
+):
+    """Async version of :py:func:`SNT.normalize_spectra`, which accepts the same arguments.
+
+    Returns:
+        The same as normalize_spectra
+
+    """
+    return await asyncio.get_running_loop().run_in_executor(
+        None,
+        partial(normalize_spectra, wavelengths, spectra, header, output_path, user_config, executor=executor, **kwargs),
+    )
+
+
+async def anormalize_batch(
+    frames: Iterable[dict[str, Any]] | AsyncIterable[dict[str, Any]],
+    output_path,
+    user_config: dict[str, Any] | None = None,
+    executor: SupportsSubmit | None = None,
+    max_in_flight: int = 2,
+    **kwargs,
+) -> list:
+    """Normalize many frames concurrently, sharing one executor between them.
+
+    At most max_in_flight frames are processed at any time and the next frame is only requested (from the iterable)
+    once one of them is done, so that a fast producer can't pile up frames in memory.
+
+    Args:
+        frames (Iterable[dict[str, Any]] | AsyncIterable[dict[str, Any]]): Arguments of normalize_spectra that
+            change between frames (e.g. wavelengths, spectra, header and fname)
+        output_path: Folder in which the SNT_data folder (with the data products) will be created
+        user_config (dict[str, Any] | None, optional): Values that will override the default configuration.
+            Defaults to None.
+        executor (SupportsSubmit | None, optional): Executor used to run the orders. If None, a process pool is
+            created (and shared by all frames) when parallel_orders is True. If it is "auto", each frame picks
+            its own number of workers. Defaults to None.
+        max_in_flight (int, optional): Max. number of frames processed at once. Defaults to 2.
+        **kwargs: Other arguments of normalize_spectra, shared by all frames
+
+    Returns:
+        list: Output of normalize_spectra for each frame, in the same order as the frames
+
+    """
+    config = build_SNT_config(user_config)
+    if executor is None and config.parallel_orders is True:
+        pool = ProcessPool(pool_size(config.Ncores))
+        try:
+            return await anormalize_batch(frames, output_path, user_config, pool, max_in_flight, **kwargs)
+        finally:
+            # all orders are finished (or timed out) by now, unless the batch failed or was cancelled, in which case
+            # there is no point in waiting for them. This also stops any worker that is stuck in an order
+            await asyncio.get_running_loop().run_in_executor(None, pool.terminate)
+
+    slots = asyncio.Semaphore(max_in_flight)
+
+    async def run_frame(frame: dict[str, Any]):
+        try:
+            return await anormalize_spectra(
+                output_path=output_path, user_config=user_config, executor=executor, **kwargs, **frame
+            )
+        finally:
+            slots.release()
+
+    frames = _as_async_iterable(frames)
+    tasks = []
+    try:
+        while True:
+            # wait for a free slot before requesting the next frame
+            await slots.acquire()
+            try:
+                frame = await frames.__anext__()
+            except StopAsyncIteration:
+                break
+            tasks.append(asyncio.create_task(run_frame(frame)))
+        return await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def _as_async_iterable(frames):
+    if hasattr(frames, "__aiter__"):
+        async for frame in frames:
+            yield frame
+    else:
+        for frame in frames:
+            yield frame
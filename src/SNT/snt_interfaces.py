@@ -1,7 +1,21 @@
+from __future__ import annotations
+
+from typing import Any, Iterator
+
+from SNT.executors import ProcessPool, SupportsSubmit, pool_size
+from SNT.masks import SpectralMask
 from SNT.snt import normalize_spectra
+from SNT.utils.SNT_configs import build_SNT_config
 
 
-def normalize_sBART_object(frame, output_path, user_configs, store_to_disk=True):
+def normalize_sBART_object(
+    frame,
+    output_path,
+    user_configs,
+    store_to_disk=True,
+    executor: SupportsSubmit | None = None,
+    mask: SpectralMask | None = None,
+):
     wave, flux, _, _ = frame.get_data_from_full_spectrum()
 
     return normalize_spectra(
@@ -13,4 +27,62 @@ def normalize_sBART_object(frame, output_path, user_configs, store_to_disk=True)
         store_to_disk=store_to_disk,
         output_path=output_path,
         user_config=user_configs,
+        executor=executor,
+        mask=mask,
     )
+
+
+def normalize_sBART_frames(
+    frames,
+    output_path,
+    user_configs: dict[str, Any] | None,
+    store_to_disk: bool = True,
+    executor: SupportsSubmit | None = None,
+    attribute: str = "continuum",
+    mask: SpectralMask | None = None,
+) -> list:
+    """Normalize many sBART frames, sharing one pool of workers between all of them.
+
+    The frames are processed one at a time and their data is only fetched when the frame is normalized, so that
+    only one frame is held in memory (besides the continua). The orders of each frame are spread over the workers.
+
+    Args:
+        frames: Either a sBART DataClass, in which case all of its valid frames are normalized, or an iterable of
+            frames
+        output_path: Folder in which the SNT_data folder (with the data products) will be created
+        user_configs (dict[str, Any] | None): Values that will override the default configuration
+        store_to_disk (bool, optional): Store the data products to disk. Defaults to True.
+        executor (SupportsSubmit | None, optional): Executor used to run the orders. If None, a process pool is
+            created (and shared by all frames) when parallel_orders is True. If it is "auto", each frame picks
+            its own number of workers. Defaults to None.
+        attribute (str, optional): Name of the frame attribute in which the continuum is stored. Defaults to
+            "continuum".
+        mask (SpectralMask | None, optional): Regions ignored in all frames. The compiled mask is reused by the
+            frames that share the same wavelength grid. Defaults to None.
+
+    Returns:
+        list: Continuum of each frame
+
+    """
+    config = build_SNT_config(user_configs)
+    if executor is None and config.parallel_orders is True:
+        with ProcessPool(pool_size(config.Ncores)) as pool:
+            return normalize_sBART_frames(frames, output_path, user_configs, store_to_disk, pool, attribute, mask)
+
+    continua = []
+    for frame in _iterate_frames(frames):
+        continuum = normalize_sBART_object(
+            frame, output_path, user_configs, store_to_disk, executor=executor, mask=mask
+        )
+        setattr(frame, attribute, continuum)
+        continua.append(continuum)
+    return continua
+
+
+def _iterate_frames(frames) -> Iterator:
+    if hasattr(frames, "get_frame_by_ID"):
+        # sBART DataClass, the frames are only requested when needed
+        for frame_ID in frames.get_valid_frameIDs():
+            yield frames.get_frame_by_ID(frame_ID)
+    else:
+        yield from frames
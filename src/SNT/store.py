@@ -0,0 +1,151 @@
+"""Indexed on-disk store of the normalized orders, with random access to each (frame, order) pair.
+
+The store is a folder with two append-only files:
+
+- data.bin: raw bytes of the arrays of all orders, one after the other
+- index.jsonl: one line per order, with the frame, the order and the position, dtype and shape of each array
+
+An order is read with a single seek into the data file, without touching the other orders. The index line is only
+written after the data, so readers never see partial orders. Writers hold an exclusive lock (flock) on the store
+while appending, so that many processes can write to the same store (e.g. one per night). The lock relies on the
+:py:mod:`fcntl` module and is not available on Windows, where only one writer should be used.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Iterator
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+_DATA_FILE = "data.bin"
+_INDEX_FILE = "index.jsonl"
+_LOCK_FILE = "lock"
+
+
+class OrderStore:
+    """Append-only store of the normalized orders of many frames.
+
+    Writing the orders of one frame::
+
+        store = OrderStore("SNT_night")
+        store.append_frame("frame_1", {"wavelengths": wavelengths, "continuum": continuum})
+
+    and reading back one order::
+
+        continuum = store.read("frame_1", order=10)["continuum"]
+
+    If the same (frame, order) pair is written more than once, the last entry is used.
+    """
+
+    def __init__(self, path: str | Path) -> None:
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        (self.path / _DATA_FILE).touch()
+        (self.path / _INDEX_FILE).touch()
+
+        self._index: dict[tuple[str, int], dict[str, list]] = {}
+        self._index_position = 0
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        with open(self.path / _LOCK_FILE, mode="a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def append_frame(self, frame: str, arrays: dict[str, Any]) -> int:
+        """Store all orders of one frame.
+
+        Args:
+            frame (str): Name of the frame
+            arrays (dict[str, Any]): Arrays to store, indexed by their name. Either 2D arrays (one row per order) or
+                lists with the array of each order (e.g. the anchors)
+
+        Returns:
+            int: Number of bytes written to the data file
+
+        """
+        n_orders = len(next(iter(arrays.values())))
+        entries = []
+        chunks = []
+        with self._locked(), open(self.path / _DATA_FILE, mode="ab") as data_file:
+            offset = data_file.seek(0, os.SEEK_END)
+            for order in range(n_orders):
+                entry = {"frame": frame, "order": order, "arrays": {}}
+                for name, values in arrays.items():
+                    values = np.ascontiguousarray(values[order])
+                    entry["arrays"][name] = [offset, values.dtype.str, list(values.shape)]
+                    chunks.append(values.tobytes())
+                    offset += values.nbytes
+                entries.append(json.dumps(entry) + "\n")
+
+            data_file.writelines(chunks)
+            data_file.flush()
+            os.fsync(data_file.fileno())
+            # the index is only updated once the data is on disk
+            with open(self.path / _INDEX_FILE, mode="a") as index_file:
+                index_file.writelines(entries)
+        return sum(len(chunk) for chunk in chunks)
+
+    def _refresh_index(self) -> None:
+        # only the lines added since the last refresh are parsed
+        with open(self.path / _INDEX_FILE, mode="rb") as index_file:
+            index_file.seek(self._index_position)
+            for line in index_file:
+                if not line.endswith(b"\n"):
+                    # line that is still being written
+                    break
+                entry = json.loads(line)
+                self._index[(entry["frame"], entry["order"])] = entry["arrays"]
+                self._index_position += len(line)
+
+    def frames(self) -> list[str]:
+        """Names of the stored frames, in the order in which they were written."""
+        self._refresh_index()
+        return list(dict.fromkeys(frame for frame, _ in self._index))
+
+    def __contains__(self, key: tuple[str, int]) -> bool:
+        self._refresh_index()
+        return key in self._index
+
+    def read(self, frame: str, order: int, names: list[str] | None = None) -> dict[str, np.ndarray]:
+        """Read the arrays of one order of one frame.
+
+        Args:
+            frame (str): Name of the frame
+            order (int): Index of the order
+            names (list[str] | None, optional): Arrays that are read. Defaults to None, reading all of them.
+
+        Returns:
+            dict[str, np.ndarray]: Arrays of the order, indexed by their name
+
+        Raises:
+            KeyError: If the order is not in the store
+
+        """
+        self._refresh_index()
+        entry = self._index[(frame, order)]
+        arrays = {}
+        with open(self.path / _DATA_FILE, mode="rb") as data_file:
+            for name in entry if names is None else names:
+                offset, dtype, shape = entry[name]
+                data_file.seek(offset)
+                arrays[name] = np.fromfile(data_file, dtype=np.dtype(dtype), count=int(np.prod(shape))).reshape(shape)
+        return arrays
+
+    def read_order(self, order: int, name: str = "continuum") -> dict[str, np.ndarray]:
+        """Read one array (e.g. the continuum) of one order, from all frames that were stored."""
+        return {frame: self.read(frame, order, [name])[name] for frame in self.frames() if (frame, order) in self}
@@ -1,14 +1,23 @@
 from __future__ import annotations
 
+from copy import copy
+from dataclasses import dataclass, fields
+from functools import lru_cache
 from typing import Any
 
+import numpy as np
+
+from SNT.pipeline import STAGE_NAMES, STAGES, RegisteredBackends
 from SNT.utils.configs import ConfigHolder, UserParam
 from SNT.utils.parameter_validators import (
     BooleanValue,
     IntegerValue,
+    ListValue,
     NumericValue,
     Positive_Value_Constraint,
+    ValueFromDtype,
     ValueFromList,
+    ValueInInterval,
 )
 
 _default_params = {
@@ -87,14 +96,98 @@ _default_params = {
     "parallel_orders": UserParam(
         name="parallel_orders",
         default_value=False,
-        constraints=BooleanValue,
-        description="Run spectral orders in parallel",
+        constraints=BooleanValue | ValueFromList(["auto"]),
+        description="Run spectral orders in parallel (auto: only if a probe order shows that a process pool pays off)",
     ),
     "Ncores": UserParam(
         name="Ncores",
         default_value=1,
-        constraints=Positive_Value_Constraint,
-        description="Number of cores to use, if runnung in parallel mode",
+        constraints=(IntegerValue + ValueInInterval([1, np.inf], include_edges=True)) | ValueFromList(["auto"]),
+        description="Number of cores to use, if running in parallel mode (auto: all the available cores). Upper bound of the auto parallel mode",
+    ),
+    "adaptive_windows": UserParam(
+        name="adaptive_windows",
+        default_value=False,
+        constraints=BooleanValue,
+        description="scale the sigma clip and savgol windows of each order with its sampling of the FWHM",
+    ),
+    "coarse_anchor_search": UserParam(
+        name="coarse_anchor_search",
+        default_value=False,
+        constraints=BooleanValue,
+        description="find the anchors over the rolling maximum of the spectra and only refine the maxima close to them",
+    ),
+    "coarse_refine_window": UserParam(
+        name="coarse_refine_window",
+        default_value=10,
+        constraints=Positive_Value_Constraint + NumericValue,
+        description="distance (in units of the FWHM) to the coarse anchors in which maxima are used in the final search",
+    ),
+    "coarse_tolerance": UserParam(
+        name="coarse_tolerance",
+        default_value=0.01,
+        constraints=Positive_Value_Constraint + NumericValue,
+        description="max. relative height of the maxima above the continuum of the coarse-to-fine search, before it is replaced by the full search",
+    ),
+    "dtype": UserParam(
+        name="dtype",
+        default_value="float64",
+        constraints=ValueFromList(["float64", "float32"]),
+        description="floating point precision of the flux and continuum (the wavelengths are always float64)",
+    ),
+    "warm_start_threshold": UserParam(
+        name="warm_start_threshold",
+        default_value=0.01,
+        constraints=Positive_Value_Constraint + NumericValue,
+        description="max. deviation of the anchor flux ratio (to the reference epoch) to re-use the reference anchors",
+    ),
+    "continuum_output": UserParam(
+        name="continuum_output",
+        default_value="dense",
+        constraints=ValueFromList(["dense", "model"]),
+        description="return (and store) the dense continuum or a lightweight model (the anchors) of each order",
+    ),
+    "max_anchor_iterations": UserParam(
+        name="max_anchor_iterations",
+        default_value=0,
+        constraints=Positive_Value_Constraint + IntegerValue,
+        description="max. number of alpha shape steps per order, before falling back to the rolling max (0 for no limit)",
+    ),
+    "order_time_budget": UserParam(
+        name="order_time_budget",
+        default_value=0,
+        constraints=Positive_Value_Constraint + NumericValue,
+        description="max. time (seconds) of the alpha shape search per order, before falling back to the rolling max (0 for no limit)",
+    ),
+    "order_timeout": UserParam(
+        name="order_timeout",
+        default_value=0,
+        constraints=Positive_Value_Constraint + NumericValue,
+        description="max. time (seconds) that one order can run in the parallel mode, before being stopped and flagged as failed (0 for no limit)",
+    ),
+    "batch_preprocessing": UserParam(
+        name="batch_preprocessing",
+        default_value=False,
+        constraints=BooleanValue,
+        description="clean and smooth all orders at once (as a 2D array), leaving only the alpha shape for each order",
+    ),
+    "stage_backends": UserParam(
+        name="stage_backends",
+        default_value={},
+        constraints=ValueFromDtype((dict, list, tuple)) + RegisteredBackends(),
+        description="backend used by each pipeline stage, e.g. {'smooth': 'my_filter'} (default backend for the others)",
+    ),
+    "skip_stages": UserParam(
+        name="skip_stages",
+        default_value=(),
+        constraints=ListValue + ValueFromList([stage.name for stage in STAGES.values() if stage.skippable]),
+        description="pipeline stages that are skipped (only the ones that update their inputs, e.g. smooth)",
+    ),
+    "cached_stages": UserParam(
+        name="cached_stages",
+        default_value=(),
+        constraints=ListValue + ValueFromList(STAGE_NAMES),
+        description="pipeline stages whose outputs are cached in memory and reused by later runs with the same inputs",
     ),
     "run_plot_generation": UserParam(
         name="run_plot_generation",
@@ -105,17 +198,104 @@ _default_params = {
 }
 
 
+@dataclass(frozen=True)
+class SNTConfig:
+    """Immutable (and hashable) snapshot of a validated SNT configuration.
+
+    Values can be accessed either as attributes or through their names, i.e. ``config.nu`` or ``config["nu"]``. The
+    collections are stored as tuples, e.g. the stage_backends are (stage, backend) pairs.
+    """
+
+    remove_n_first: int
+    radius_min: int
+    radius_max: int
+    max_vicinity: int
+    stretching: int
+    use_RIC: bool
+    interp: str
+    use_denoise: bool
+    usefilter: bool
+    nu: float
+    niter_peaks_remove: int
+    denoising_distance: int
+    parallel_orders: bool | str
+    Ncores: int | str
+    adaptive_windows: bool
+    coarse_anchor_search: bool
+    coarse_refine_window: float
+    coarse_tolerance: float
+    dtype: str
+    warm_start_threshold: float
+    continuum_output: str
+    max_anchor_iterations: int
+    order_time_budget: float
+    order_timeout: float
+    batch_preprocessing: bool
+    stage_backends: tuple[tuple[str, str], ...]
+    skip_stages: tuple[str, ...]
+    cached_stages: tuple[str, ...]
+    run_plot_generation: bool
+
+    def __getitem__(self, key: str) -> Any:
+        try:
+            return getattr(self, key)
+        except AttributeError as e:
+            raise KeyError(key) from e
+
+    def as_dict(self) -> dict[str, Any]:
+        """Plain dictionary with the configuration values."""
+        return {field.name: getattr(self, field.name) for field in fields(self)}
+
+
 def construct_SNT_configs(user_configs: dict[str, Any] | None = None) -> ConfigHolder:
     """Construct the SNT config object, with the relevant parameters.
 
+    The parameters are copied from the defaults, so that the user values do not leak into later calls.
+
     Args:
-        user_configs (dict[str, Any] | None, optional): _description_. Defaults to None.
+        user_configs (dict[str, Any] | None, optional): Values that will override the defaults. Defaults to None.
 
     Returns:
         ConfigHolder: ConfigHolder object
 
     """
-    internal_configs = ConfigHolder(parameters=_default_params)
+    internal_configs = ConfigHolder(parameters={name: copy(param) for name, param in _default_params.items()})
     user_configs = {} if user_configs is None else user_configs
     internal_configs.update_values_from_dict(user_configs)
     return internal_configs
+
+
+def build_SNT_config(user_configs: dict[str, Any] | None = None) -> SNTConfig:
+    """Build the validated (and immutable) snapshot of the SNT configuration.
+
+    The snapshots are memoized, so that repeated calls with the same user values skip the validation layer.
+
+    Args:
+        user_configs (dict[str, Any] | None, optional): Values that will override the defaults. Defaults to None.
+
+    Returns:
+        SNTConfig: Configuration snapshot
+
+    """
+    user_configs = {} if user_configs is None else user_configs
+    # The type is part of the key, as True == 1 would otherwise skip the validation of the dtype
+    try:
+        key = frozenset((name, type(value), value) for name, value in user_configs.items())
+    except TypeError:
+        # unhashable values can't be memoized
+        return _snapshot_SNT_config(user_configs)
+    return _cached_SNT_config(key)
+
+
+@lru_cache(maxsize=128)
+def _cached_SNT_config(key: frozenset) -> SNTConfig:
+    return _snapshot_SNT_config({name: value for name, _, value in key})
+
+
+def _snapshot_SNT_config(user_configs: dict[str, Any]) -> SNTConfig:
+    values = construct_SNT_configs(user_configs).get_all_current_values()
+    # the collections are frozen, to keep the snapshot hashable
+    values["stage_backends"] = tuple(sorted(dict(values["stage_backends"]).items()))
+    values["skip_stages"] = tuple(values["skip_stages"])
+    values["cached_stages"] = tuple(values["cached_stages"])
+    return SNTConfig(**values)
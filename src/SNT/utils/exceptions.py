@@ -4,3 +4,7 @@ class InternalError(Exception):
 
 class InvalidConfiguration(Exception):
     pass
+
+
+class BudgetExceeded(Exception):
+    pass
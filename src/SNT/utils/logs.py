@@ -0,0 +1,91 @@
+"""Logging of SNT, through loguru, with the frame and the order of each record in its extra context.
+
+The orders that run in a process pool send their records to the parent process through a queue, where they are
+logged again, so that all records reach the sinks of the parent (instead of each worker writing to its own copy of
+them). Records below the level of the sinks are dropped by loguru before any formatting, so the calls inside
+per-point loops pass their values as arguments (``logger.debug("x: {}", x)``) instead of using f-strings.
+"""
+
+from __future__ import annotations
+
+import sys
+import threading
+from functools import partial
+from typing import Any
+
+from loguru import logger
+
+FORMAT = (
+    "<green>{time:YYYY-MM-DD HH:mm:ss.SSS}</green> | <level>{level: <8}</level> | "
+    "frame={extra[frame]} order={extra[order]} | "
+    "<cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>"
+)
+
+# Min. level of the records that the pool workers send to the parent, set by configure_logging. By default, the debug
+# records are dropped in the workers, as loguru's default sink would otherwise make them format and send all of them
+_worker_level: str | int = "INFO"
+
+
+def configure_logging(level: str | int = "INFO", sink: Any = sys.stderr, **kwargs) -> int:
+    """Replace the loguru sinks by a single one, which shows the frame and order of each record.
+
+    Args:
+        level (str | int, optional): Min. level of the records that are logged, also used in the workers of the
+            process pools. Defaults to "INFO".
+        sink (Any, optional): Destination of the records (any loguru sink). Defaults to sys.stderr.
+        **kwargs: Other arguments of logger.add (e.g. a custom format)
+
+    Returns:
+        int: Identifier of the sink, which can be given to logger.remove
+
+    """
+    global _worker_level
+    logger.remove()
+    logger.configure(extra={"frame": None, "order": None})
+    _worker_level = level
+    kwargs.setdefault("format", FORMAT)
+    return logger.add(sink, level=level, **kwargs)
+
+
+def worker_log_level() -> str | int:
+    """Min. level of the records that the pool workers send to the parent."""
+    return _worker_level
+
+
+def init_worker_logging(queue, level: str | int) -> None:
+    """Initializer of the pool workers, which replaces their sinks by the queue to the parent process."""
+    logger.remove()
+    logger.add(partial(_put_record, queue), level=level, format="{message}")
+
+
+def _put_record(queue, message) -> None:
+    record = message.record
+    queue.put(
+        (
+            record["level"].name,
+            # the message, followed by the traceback (if any)
+            str(message).rstrip("\n"),
+            record["name"],
+            record["function"],
+            record["line"],
+            record["process"].id,
+            dict(record["extra"]),
+        )
+    )
+
+
+def forward_worker_logs(queue) -> threading.Thread:
+    """Start a thread that logs the records that the workers put in the queue, until it receives None."""
+
+    def forward() -> None:
+        while (item := queue.get()) is not None:
+            level, text, name, function, line, process, extra = item
+            # keep the origin of the record, instead of this function
+            origin = {"name": name, "function": function, "line": line}
+            logger.patch(lambda record, origin=origin: record.update(origin)).bind(**extra, worker=process).log(
+                level, text
+            )
+
+    thread = threading.Thread(target=forward, name="SNT-worker-logs", daemon=True)
+    thread.start()
+    return thread
@@ -5,7 +5,6 @@ Each implements a different condition, that can then be applied to the values th
 
 from __future__ import annotations
 
-from copy import deepcopy
 from pathlib import Path
 from typing import Any, Iterable, NoReturn
 
@@ -24,7 +23,7 @@ class Constraint:
     def __add__(self, other: Constraint) -> Constraint:
         new_const = Constraint(self.constraint_text)
         # ensure that we don't propagate changes to all existing constraints
-        new_const._constraint_list = deepcopy(self._constraint_list)
+        new_const._constraint_list = list(self._constraint_list)
         new_const._constraint_list.append(other._evaluate)
         new_const.constraint_text += " and " + other.constraint_text
 
@@ -33,6 +32,22 @@ class Constraint:
     def __radd__(self, other: Constraint) -> Constraint:
         return self.__add__(other)
 
+    def __or__(self, other: Constraint) -> Constraint:
+        new_const = Constraint(f"({self.constraint_text}) or ({other.constraint_text})")
+
+        def evaluate_either(param_name: str, value: Any) -> None:
+            try:
+                self.check_if_value_meets_constraint(param_name, value)
+            except InvalidConfiguration:
+                try:
+                    other.check_if_value_meets_constraint(param_name, value)
+                except InvalidConfiguration as e:
+                    msg = f"Config ({param_name}) value {value} does not meet: {new_const.constraint_text}"
+                    raise InvalidConfiguration(msg) from e
+
+        new_const._constraint_list = [evaluate_either]
+        return new_const
+
     def check_if_value_meets_constraint(self, param_name: str, value: Any) -> None:
         """Loop through all constraints set for this value.
 
@@ -97,6 +112,8 @@ class ValueFromDtype(Constraint):
     def __init__(self, dtype_list: tuple[type, ...]):
         """Check if value is from any of the provided dtypes.
 
+        Booleans are only accepted if bool is one of the dtypes, even though they are also integers.
+
         Args:
             dtype_list (tuple[type, ...]): Possible data types
 
@@ -111,7 +128,8 @@ class ValueFromDtype(Constraint):
             raise InternalError(msg)
 
     def _evaluate(self, param_name: str, value: Any):
-        if not isinstance(value, self.valid_dtypes):
+        is_bool = isinstance(value, (bool, np.bool_))
+        if not isinstance(value, self.valid_dtypes) or (is_bool and bool not in self.valid_dtypes):
             msg = (
                 f"Config ({param_name}) value ({value}) not from the valid dtypes: {type(value)} vs {self.valid_dtypes}"
             )
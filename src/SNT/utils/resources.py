@@ -0,0 +1,116 @@
+"""Accounting of the resources (time, memory and disk) used to normalize one frame.
+
+The measurements are taken from within the processes (the parent and the workers), so that they are not distorted by
+an external profiler. The peak memory relies on the :py:mod:`resource` module and is not available on Windows.
+"""
+
+from __future__ import annotations
+
+import sys
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any
+
+try:
+    import resource
+except ImportError:  # pragma: no cover
+    resource = None
+
+
+def peak_rss() -> int | None:
+    """Peak resident set size of the current process, in bytes (None if it can't be measured)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class Stopwatch:
+    """Wall and CPU time (of the current process) since its creation."""
+
+    def __init__(self) -> None:
+        self._wall_start = time.perf_counter()
+        self._cpu_start = time.process_time()
+
+    @property
+    def wall_time(self) -> float:
+        return time.perf_counter() - self._wall_start
+
+    @property
+    def cpu_time(self) -> float:
+        return time.process_time() - self._cpu_start
+
+
+@dataclass
+class ResourceReport:
+    """Resources used to normalize one frame.
+
+    Attributes:
+        wall_time: Wall time of the full normalization, in seconds
+        cpu_time: CPU time of the parent process, in seconds
+        orders_cpu_time: CPU time spent fitting the orders (in the parent or in the workers), in seconds
+        parent_peak_rss: Peak memory of the parent process, in bytes
+        worker_peak_rss: Largest peak memory of the processes that fitted the orders, in bytes
+        artifacts: Size, in bytes, of each data product written to disk
+        maxima_per_order: Number of maxima found in each order
+        anchors_per_order: Number of anchors of each order
+        workers: Number of processes used to fit the orders (None if they were sent to an external executor)
+
+    """
+
+    wall_time: float
+    cpu_time: float
+    orders_cpu_time: float
+    parent_peak_rss: int | None
+    worker_peak_rss: int | None
+    artifacts: dict[str, int] = field(default_factory=dict)
+    maxima_per_order: list[int] = field(default_factory=list)
+    anchors_per_order: list[int] = field(default_factory=list)
+    workers: int | None = None
+
+    @classmethod
+    def from_byproducts(
+        cls, stopwatch: Stopwatch, byproducts: dict[str, list], artifacts: dict[str, Path | int]
+    ) -> ResourceReport:
+        """Build the report of a frame, from the per-order measurements stored in the byproducts.
+
+        Args:
+            stopwatch (Stopwatch): Started at the beginning of the normalization
+            byproducts (dict[str, list]): Byproducts of the fit, with one entry per order
+            artifacts (dict[str, Path | int]): Data products written to disk, either their path or the number of
+                bytes written (e.g. appended to a shared file)
+
+        """
+        worker_peaks = [peak for peak in byproducts.get("peak_rss", []) if peak is not None]
+        return cls(
+            wall_time=stopwatch.wall_time,
+            cpu_time=stopwatch.cpu_time,
+            orders_cpu_time=sum(cpu for cpu in byproducts.get("cpu_time", []) if cpu is not None),
+            parent_peak_rss=peak_rss(),
+            worker_peak_rss=max(worker_peaks) if worker_peaks else None,
+            artifacts={
+                name: artifact if isinstance(artifact, int) else artifact.stat().st_size
+                for name, artifact in artifacts.items()
+            },
+            maxima_per_order=[len(values) for values in byproducts["max_pos"]],
+            anchors_per_order=[len(values) for values in byproducts["anchors_x"]],
+            workers=max((n for n in byproducts.get("workers", []) if n is not None), default=None),
+        )
+
+    def as_dict(self) -> dict[str, Any]:
+        return asdict(self)
+
+    def summary(self) -> str:
+        def to_MB(n_bytes: int | None) -> str:  # noqa: N802
+            return "n/a" if n_bytes is None else f"{n_bytes / 1024**2:.1f} MB"
+
+        lines = [
+            f"Wall time: {self.wall_time:.2f} s; CPU time: {self.cpu_time:.2f} s (parent), "
+            f"{self.orders_cpu_time:.2f} s (orders); workers: {self.workers or 'n/a'}",
+            f"Peak RSS: {to_MB(self.parent_peak_rss)} (parent), {to_MB(self.worker_peak_rss)} (workers)",
+            f"Maxima: {sum(self.maxima_per_order)}; anchors: {sum(self.anchors_per_order)}",
+        ]
+        lines.extend(f"{name}: {to_MB(size)}" for name, size in self.artifacts.items())
+        return "\n".join(lines)
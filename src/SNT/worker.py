@@ -0,0 +1,30 @@
+"""Command line entry point of the workers of a :py:class:`SNT.executors.FileQueueExecutor`::
+
+    python -m SNT.worker <queue_dir>
+
+It lives outside of :py:mod:`SNT.executors`, which is imported with the package, so that running it as the main
+module doesn't import the executors twice.
+"""
+
+import argparse
+from pathlib import Path
+
+from SNT.executors import HEARTBEAT_INTERVAL, run_worker
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Start a SNT worker attached to a folder-based queue")
+    parser.add_argument("queue_dir", type=Path, help="Folder that holds the queue")
+    parser.add_argument("--poll-interval", type=float, default=0.05, help="Seconds between checks for new tasks")
+    parser.add_argument(
+        "--heartbeat-interval",
+        type=float,
+        default=HEARTBEAT_INTERVAL,
+        help="Seconds between the updates of the running task",
+    )
+    args = parser.parse_args()
+    run_worker(args.queue_dir, poll_interval=args.poll_interval, heartbeat_interval=args.heartbeat_interval)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+import time
+
+import numpy as np
+import pytest
+
+from SNT.pipeline import register_backend
+
+
+@register_backend("smooth", "stuck")
+def stuck_smooth(data, config):
+    """Backend of an order that never finishes (e.g. to test the timeouts)."""
+    time.sleep(600)
+
+
+def make_synthetic_spectra(
+    n_orders: int = 2, n_pixels: int = 4000, seed: int = 0, velocity: float = 0.0, scale: float = 1.0
+):
+    """Echelle-like spectra: a smooth continuum with absorption lines and gaussian noise.
+
+    The lines can be Doppler shifted by a velocity (in km/s) and the flux multiplied by a scale factor.
+    """
+    rng = np.random.default_rng(seed)
+    wavelengths = []
+    spectra = []
+    for order in range(n_orders):
+        wave = np.linspace(5000 + 80 * order, 5100 + 80 * order, n_pixels)
+        rest_wave = wave / (1 + velocity / 299792.458)
+        flux = scale * 1000 * (1 + 0.3 * np.sin((wave - wave[0]) / 30))
+        for center in rng.uniform(wave[0], wave[-1], 100):
+            flux *= 1 - 0.5 * np.exp(-0.5 * ((rest_wave - center) / 0.05) ** 2)
+        flux += rng.normal(0, 5, n_pixels)
+        wavelengths.append(wave)
+        spectra.append(flux)
+    return np.array(wavelengths), np.array(spectra)
+
+
+@pytest.fixture(scope="session")
+def synthetic_spectra():
+    return make_synthetic_spectra()
+
+
+class StubFrame:
+    """Minimal stand-in for a sBART Frame, which counts how many times its data was requested."""
+
+    def __init__(self, fname: str, seed: int = 0, FWHM: float = 7) -> None:  # noqa: N803
+        self.fname = fname
+        self.seed = seed
+        self.FWHM = FWHM
+        self.data_requests = 0
+
+    def get_data_from_full_spectrum(self):
+        self.data_requests += 1
+        wavelengths, spectra = make_synthetic_spectra(seed=self.seed)
+        return wavelengths, spectra, np.ones_like(spectra), np.zeros(spectra.shape, dtype=bool)
+
+    def get_KW_value(self, KW: str):  # noqa: N802, N803
+        return {"FWHM": self.FWHM}[KW]
+
+
+class StubDataClass:
+    """Minimal stand-in for a sBART DataClass, which only builds its frames when they are requested."""
+
+    def __init__(self, n_frames: int) -> None:
+        self.n_frames = n_frames
+        self.frames = {}
+
+    def get_valid_frameIDs(self):  # noqa: N802
+        return list(range(self.n_frames))
+
+    def get_frame_by_ID(self, frame_ID: int) -> StubFrame:  # noqa: N802, N803
+        self.frames[frame_ID] = StubFrame(fname=f"frame_{frame_ID}", seed=frame_ID)
+        return self.frames[frame_ID]
@@ -0,0 +1,304 @@
+"""Side by side comparison of the frozen reference kernels with the ones shipped in SNT.
+
+Each kernel is run on the intermediate products of a corpus of spectra (synthetic ones and the ones stored in
+tests/data), checking that the outputs agree and measuring the speedup. The full normalization is checked against
+the golden anchors, stored in tests/data, which were produced by the original implementation of SNT (before any of
+the kernels were optimized).
+
+The float32 spectra of the corpus are compared with the precision of float32 (GOLDEN_RTOL). The original
+implementation kept their flux (and anchors) in float32, while the default (float64) compute mode now casts the input
+to float64 before the fit, so their anchors differ by a few parts in 1e8.
+
+Print the speedup of each kernel with::
+
+    python tests/kernel_harness.py
+
+the number of anchors found per second by the alpha shape with::
+
+    python tests/kernel_harness.py --anchors-rate
+
+and, only after an intentional change of the results, replace the golden anchors by the output of the current
+implementation with::
+
+    python tests/kernel_harness.py --update-golden
+
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Callable
+
+import numpy as np
+import reference_kernels as reference
+from conftest import make_synthetic_spectra
+from scipy.signal import find_peaks
+
+from SNT import alphashape, batch, normalize_spectra, penalty, smooth
+from SNT.snt import CLIP_WINDOW, preprocess_row
+from SNT.utils.SNT_configs import build_SNT_config
+
+DATA_DIR = Path(__file__).parent / "data"
+GOLDEN_PATH = DATA_DIR / "golden_anchors.json"
+GOLDEN_CONFIGS = {"linear": {}, "cubic": {"interp": "cubic"}}
+# Relative tolerance of the comparison with the golden anchors, for float64 and float32 spectra
+GOLDEN_RTOL = {np.dtype(np.float64): 1e-12, np.dtype(np.float32): float(np.finfo(np.float32).eps)}
+FWHM = 7
+
+
+def _gapped_spectra():
+    wavelengths, spectra = make_synthetic_spectra(n_orders=1, n_pixels=8000, seed=3)
+    spectra[0, 3000:5000] = 0
+    return wavelengths, spectra
+
+
+@lru_cache(maxsize=None)
+def corpus() -> dict[str, tuple[np.ndarray, np.ndarray]]:
+    """Spectra used to compare the implementations, indexed by their name."""
+    spectra = {
+        "synthetic": make_synthetic_spectra(n_orders=2),
+        "low_snr": make_synthetic_spectra(n_orders=1, seed=1, scale=0.1),
+        "shifted": make_synthetic_spectra(n_orders=1, seed=2, velocity=30),
+        "gapped": _gapped_spectra(),
+    }
+    for path in sorted(DATA_DIR.glob("spectrum_*.npz")):
+        with np.load(path) as stored:
+            spectra[path.stem] = (stored["wavelengths"], stored["spectra"])
+    return spectra
+
+
+@lru_cache(maxsize=None)
+def stages(name: str) -> dict[str, Any]:
+    """Inputs of the kernels, from the first order of one spectrum of the corpus."""
+    wavelengths, spectra = corpus()[name]
+    config = build_SNT_config()
+    valid = spectra[0] != 0
+
+    wavelengths_clip, spectra_clip, min_lambda, FWHM_WL = preprocess_row(wavelengths[0], spectra[0], FWHM, config)
+    s1 = penalty.rolling_max(spectra_clip, wavelengths_clip, FWHM_WL * 40)
+    s2 = penalty.rolling_max(spectra_clip, wavelengths_clip, FWHM_WL * 400)
+    ps = penalty.penalty(s1, s2, wavelengths_clip)
+    step_y, step_x = penalty.step_transform(ps, wavelengths_clip, config.radius_max / 4)
+    max_index, _ = find_peaks(spectra_clip, height=0, distance=config.max_vicinity)
+    return {
+        "raw_flux": spectra[0][valid],
+        "raw_wavelengths": wavelengths[0][valid],
+        "wavelengths": wavelengths_clip,
+        "spectra": spectra_clip,
+        "FWHM_WL": FWHM_WL,
+        "s1": s1,
+        "s2": s2,
+        "anchors_args": (
+            max_index,
+            spectra_clip,
+            wavelengths_clip,
+            step_y,
+            step_x,
+            min_lambda,
+            config.radius_min,
+            config.radius_max,
+            config.nu,
+            config.use_RIC,
+            config.stretching,
+        ),
+    }
+
+
+@dataclass
+class KernelCase:
+    """One kernel, in its reference and candidate implementations.
+
+    Both callables receive the stages of one spectrum and return the kernel output.
+    """
+
+    name: str
+    reference: Callable[[dict[str, Any]], Any]
+    candidate: Callable[[dict[str, Any]], Any]
+    rtol: float = 0
+    atol: float = 0
+
+
+@dataclass
+class KernelReport:
+    kernel: str
+    spectrum: str
+    max_difference: float
+    reference_time: float
+    candidate_time: float
+    passed: bool
+
+    @property
+    def speedup(self) -> float:
+        return self.reference_time / self.candidate_time
+
+
+def _batch_sigma_clip(stage: dict[str, Any]):
+    flux, wavelengths = stage["raw_flux"][np.newaxis], stage["raw_wavelengths"][np.newaxis]
+    flux, wavelengths, valid = batch.rolling_sigma_clip(flux, wavelengths, np.ones(flux.shape, dtype=bool), CLIP_WINDOW)
+    return flux[valid], wavelengths[valid]
+
+
+def _reference_rolling_max(stage: dict[str, Any]):
+    s1 = reference.rolling_max(stage["spectra"], stage["wavelengths"], stage["FWHM_WL"] * 40)
+    return s1.x, s1.y
+
+
+def _reference_penalty(stage: dict[str, Any]):
+    def as_interpolator(points):
+        return reference.interpolate.interp1d(*points, bounds_error=False, fill_value="nan", assume_sorted=False)
+
+    return reference.penalty(as_interpolator(stage["s1"]), as_interpolator(stage["s2"]), stage["wavelengths"])
+
+
+KERNELS = [
+    KernelCase(
+        "smooth.rolling_sigma_clip",
+        lambda stage: reference.rolling_sigma_clip(stage["raw_flux"], stage["raw_wavelengths"], CLIP_WINDOW),
+        lambda stage: smooth.rolling_sigma_clip(stage["raw_flux"], stage["raw_wavelengths"], CLIP_WINDOW),
+    ),
+    KernelCase(
+        "batch.rolling_sigma_clip",
+        lambda stage: reference.rolling_sigma_clip(stage["raw_flux"], stage["raw_wavelengths"], CLIP_WINDOW),
+        _batch_sigma_clip,
+    ),
+    KernelCase(
+        "penalty.rolling_max",
+        _reference_rolling_max,
+        lambda stage: penalty.rolling_max(stage["spectra"], stage["wavelengths"], stage["FWHM_WL"] * 40),
+    ),
+    KernelCase(
+        "penalty.penalty",
+        _reference_penalty,
+        lambda stage: penalty.penalty(stage["s1"], stage["s2"], stage["wavelengths"]),
+        rtol=1e-12,
+    ),
+    KernelCase(
+        "alphashape.anchors",
+        lambda stage: reference.anchors(*stage["anchors_args"]),
+        lambda stage: alphashape.anchors(*stage["anchors_args"]),
+    ),
+]
+
+
+def _as_arrays(output) -> list[np.ndarray]:
+    if isinstance(output, tuple):
+        return [np.asarray(values, dtype=np.float64) for values in output]
+    return [np.asarray(output, dtype=np.float64)]
+
+
+def _best_time(fn: Callable, stage: dict[str, Any], repeats: int) -> tuple[Any, float]:
+    best = np.inf
+    for _ in range(repeats):
+        start = time.perf_counter()
+        output = fn(stage)
+        best = min(best, time.perf_counter() - start)
+    return output, best
+
+
+def run_case(case: KernelCase, spectrum: str, repeats: int = 1) -> KernelReport:
+    """Run both implementations of a kernel on one spectrum of the corpus and compare them."""
+    stage = stages(spectrum)
+    reference_output, reference_time = _best_time(case.reference, stage, repeats)
+    candidate_output, candidate_time = _best_time(case.candidate, stage, repeats)
+
+    reference_arrays = _as_arrays(reference_output)
+    candidate_arrays = _as_arrays(candidate_output)
+    passed = len(reference_arrays) == len(candidate_arrays) and all(
+        expected.shape == actual.shape and np.allclose(actual, expected, rtol=case.rtol, atol=case.atol, equal_nan=True)
+        for expected, actual in zip(reference_arrays, candidate_arrays)
+    )
+    max_difference = max(
+        (
+            float(np.nanmax(np.abs(actual - expected), initial=0))
+            for expected, actual in zip(reference_arrays, candidate_arrays)
+            if expected.shape == actual.shape
+        ),
+        default=np.inf,
+    )
+    return KernelReport(case.name, spectrum, max_difference, reference_time, candidate_time, passed)
+
+
+def anchors_rate(spectrum: str, implementation: Callable = alphashape.anchors, repeats: int = 3) -> float:
+    """Number of anchors found per second, for the first order of one spectrum of the corpus."""
+    anchors_args = stages(spectrum)["anchors_args"]
+    best = np.inf
+    for _ in range(repeats):
+        start = time.perf_counter()
+        _, _, anchors_index = implementation(*anchors_args)
+        best = min(best, time.perf_counter() - start)
+    return len(anchors_index) / best
+
+
+def normalize_corpus_spectrum(spectrum: str, config_name: str) -> tuple[np.ndarray, dict[str, list]]:
+    """Continuum and byproducts of the current implementation, for one spectrum and golden configuration."""
+    wavelengths, spectra = corpus()[spectrum]
+    return normalize_spectra(
+        wavelengths,
+        spectra,
+        header={},
+        output_path=".",
+        user_config={"run_plot_generation": False, **GOLDEN_CONFIGS[config_name]},
+        FWHM_override=FWHM,
+        store_to_disk=False,
+        return_byproducts=True,
+    )
+
+
+def load_golden() -> dict[str, dict[str, dict[str, list]]]:
+    with open(GOLDEN_PATH) as file:
+        return json.load(file)
+
+
+def golden_rtol(spectrum: str) -> float:
+    """Relative tolerance of the comparison with the golden anchors, which depends on the precision of the spectrum."""
+    return GOLDEN_RTOL[corpus()[spectrum][1].dtype]
+
+
+def update_golden() -> None:
+    """Replace the golden anchors by the output of the current implementation."""
+    golden = {}
+    for spectrum in corpus():
+        golden[spectrum] = {}
+        for config_name in GOLDEN_CONFIGS:
+            _, byproducts = normalize_corpus_spectrum(spectrum, config_name)
+            golden[spectrum][config_name] = {key: byproducts[key] for key in ("anchors_x", "anchors_y")}
+    with open(GOLDEN_PATH, mode="w") as file:
+        json.dump(golden, file)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare the SNT kernels against the reference implementation")
+    parser.add_argument("--repeats", type=int, default=3, help="Runs of each kernel, the best time is kept")
+    parser.add_argument("--update-golden", action="store_true", help="Regenerate the golden anchors")
+    parser.add_argument("--anchors-rate", action="store_true", help="Measure the anchors found per second")
+    args = parser.parse_args()
+
+    if args.update_golden:
+        update_golden()
+        return
+
+    if args.anchors_rate:
+        print(f"{'spectrum':<24}{'reference [1/s]':>16}{'current [1/s]':>16}")
+        for spectrum in corpus():
+            reference_rate = anchors_rate(spectrum, reference.anchors, args.repeats)
+            print(f"{spectrum:<24}{reference_rate:>16.0f}{anchors_rate(spectrum, repeats=args.repeats):>16.0f}")
+        return
+
+    print(f"{'kernel':<28}{'spectrum':<24}{'max diff':>10}{'ref [ms]':>10}{'new [ms]':>10}{'speedup':>9}  ok")
+    for case in KERNELS:
+        for spectrum in corpus():
+            report = run_case(case, spectrum, repeats=args.repeats)
+            print(
+                f"{report.kernel:<28}{report.spectrum:<24}{report.max_difference:>10.2e}"
+                f"{1e3 * report.reference_time:>10.2f}{1e3 * report.candidate_time:>10.2f}"
+                f"{report.speedup:>9.2f}  {'yes' if report.passed else 'NO'}"
+            )
+
+
+if __name__ == "__main__":
+    main()
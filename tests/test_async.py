@@ -0,0 +1,77 @@
+import asyncio
+import time
+
+import numpy as np
+
+from conftest import make_synthetic_spectra
+from SNT import anormalize_batch, anormalize_spectra, normalize_spectra
+
+CONFIGS = {"run_plot_generation": False}
+
+
+def test_anormalize_spectra(synthetic_spectra, tmp_path) -> None:
+    wavelengths, spectra = synthetic_spectra
+    kwargs = dict(header={}, output_path=tmp_path, user_config=CONFIGS, FWHM_override=7, store_to_disk=False)
+
+    async def main():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.001)
+
+        ticking = asyncio.create_task(ticker())
+        continuum = await anormalize_spectra(wavelengths, spectra, **kwargs)
+        ticking.cancel()
+        return continuum, ticks
+
+    continuum, ticks = asyncio.run(main())
+    # the event loop kept running while the spectra were normalized
+    assert ticks > 10
+    np.testing.assert_array_equal(continuum, normalize_spectra(wavelengths, spectra, **kwargs))
+
+
+def test_anormalize_batch_backpressure(tmp_path) -> None:
+    max_in_flight = 2
+    finished_when_requested = []
+
+    async def frames():
+        for seed in range(5):
+            # the frames are only stored to disk once they are finished
+            finished_when_requested.append(len(list(tmp_path.glob("SNT_data/*_continuum.txt"))))
+            wavelengths, spectra = make_synthetic_spectra(n_orders=1, seed=seed)
+            yield {"wavelengths": wavelengths, "spectra": spectra, "header": {}, "fname": f"frame_{seed}"}
+
+    configs = {**CONFIGS, "parallel_orders": True, "Ncores": 2}
+    continua = asyncio.run(anormalize_batch(frames(), tmp_path, configs, max_in_flight=max_in_flight, FWHM_override=7))
+
+    for requested, finished in enumerate(finished_when_requested):
+        assert requested - finished <= max_in_flight
+    assert len(continua) == 5
+    for seed, continuum in enumerate(continua):
+        wavelengths, spectra = make_synthetic_spectra(n_orders=1, seed=seed)
+        expected = normalize_spectra(wavelengths, spectra, {}, tmp_path, CONFIGS, FWHM_override=7, store_to_disk=False)
+        np.testing.assert_array_equal(continuum, expected)
+
+
+def test_anormalize_batch_timeout(tmp_path) -> None:
+    configs = {
+        **CONFIGS,
+        "parallel_orders": True,
+        "Ncores": 2,
+        "order_timeout": 0.5,
+        "stage_backends": {"smooth": "stuck"},
+    }
+    frames = []
+    for seed in range(2):
+        wavelengths, spectra = make_synthetic_spectra(n_orders=1, seed=seed)
+        frames.append({"wavelengths": wavelengths, "spectra": spectra, "header": {}, "fname": f"frame_{seed}"})
+
+    started = time.monotonic()
+    continua = asyncio.run(anormalize_batch(frames, tmp_path, configs, FWHM_override=7, store_to_disk=False))
+    # the stuck orders don't block the frames, nor the shutdown of the pool
+    assert time.monotonic() - started < 20
+    for continuum in continua:
+        assert np.isnan(continuum).all()
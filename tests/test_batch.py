@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+from scipy.signal import find_peaks
+
+from conftest import make_synthetic_spectra
+from SNT import batch, normalize_spectra
+from SNT.snt import preprocess_row
+from SNT.utils.SNT_configs import build_SNT_config
+
+
+def gapped_spectra():
+    wavelengths, spectra = make_synthetic_spectra(n_orders=3, seed=4)
+    spectra[1, 1000:2500] = 0
+    spectra[2, :] = 0
+    spectra[2, 100:105] = 1000
+    return wavelengths, spectra
+
+
+@pytest.mark.parametrize(
+    "user_config",
+    [{}, {"adaptive_windows": True}, {"dtype": "float32"}, {"usefilter": False}, {"remove_n_first": 37}],
+)
+def test_batch_matches_rows(user_config: dict) -> None:
+    config = build_SNT_config(user_config)
+    wavelengths, spectra = gapped_spectra()
+    spectra = spectra.astype(config.dtype)
+
+    preprocessed = batch.preprocess_orders(wavelengths, spectra, 7, config)
+    for row in range(len(spectra)):
+        try:
+            wavelengths_clip, spectra_clip, min_lambda, FWHM_WL = preprocess_row(wavelengths[row], spectra[row], 7, config)
+        except ValueError:
+            # e.g. too short for the savgol filter, left for the per-order path
+            assert preprocessed[row] is None
+            continue
+        batch_wavelengths, batch_spectra, batch_min_lambda, batch_FWHM_WL, max_index = preprocessed[row]
+        assert batch_wavelengths == list(wavelengths_clip)
+        np.testing.assert_array_equal(batch_spectra, spectra_clip)
+        assert batch_spectra.dtype == spectra_clip.dtype
+        assert (batch_min_lambda, batch_FWHM_WL) == (min_lambda, FWHM_WL)
+        np.testing.assert_array_equal(max_index, find_peaks(spectra_clip, height=0, distance=config.max_vicinity)[0])
+
+
+def test_find_maxima_plateaus() -> None:
+    rows = np.array([[0, 1, 1, 1, 0, 2, 0, 3, 0, np.nan], [0, 1, 0, 5, 0, 2, 0, 1, 0, 1]], dtype=float)
+    lengths = np.array([9, 10])
+    maxima = batch.find_maxima(rows, lengths, distance=3)
+    for row, length, max_index in zip(rows, lengths, maxima):
+        np.testing.assert_array_equal(max_index, find_peaks(row[:length], height=0, distance=3)[0])
+
+
+def test_batch_normalization(tmp_path) -> None:
+    wavelengths, spectra = gapped_spectra()
+    kwargs = dict(header={}, output_path=tmp_path, FWHM_override=7, store_to_disk=False, return_byproducts=True)
+
+    continuum, byproducts = normalize_spectra(wavelengths, spectra, user_config={"run_plot_generation": False}, **kwargs)
+    batch_continuum, batch_byproducts = normalize_spectra(
+        wavelengths, spectra, user_config={"run_plot_generation": False, "batch_preprocessing": True}, **kwargs
+    )
+    np.testing.assert_array_equal(batch_continuum, continuum)
+    assert batch_byproducts["error"] == byproducts["error"]
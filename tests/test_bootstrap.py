@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+from SNT import bootstrap_continuum, normalize_spectra, pipeline
+from SNT.bootstrap import der_snr_noise
+
+CONFIGS = {"run_plot_generation": False}
+MAXIMA_CALLS = []
+
+
+@pipeline.register_backend("maxima", "counting")
+def counting_maxima(data, config):
+    MAXIMA_CALLS.append(len(data["flux"]))
+    return pipeline.STAGES["maxima"].backends[pipeline.DEFAULT_BACKEND](data, config)
+
+
+def run_bootstrap(wavelengths, spectra, **kwargs):
+    return bootstrap_continuum(wavelengths, spectra, header={}, FWHM_override=7, **{"user_config": CONFIGS, **kwargs})
+
+
+def test_der_snr_noise() -> None:
+    generator = np.random.default_rng(0)
+    flux = 100 + np.sin(np.linspace(0, 10, 20_000)) + generator.normal(scale=0.5, size=20_000)
+    assert der_snr_noise(flux) == pytest.approx(0.5, rel=0.02)
+    assert der_snr_noise(flux[:3]) == 0
+
+
+def test_bootstrap_without_noise(synthetic_spectra, tmp_path) -> None:
+    wavelengths, spectra = synthetic_spectra
+    continuum = normalize_spectra(
+        wavelengths, spectra, header={}, output_path=tmp_path, user_config=CONFIGS, FWHM_override=7, store_to_disk=False
+    )
+    percentiles = run_bootstrap(wavelengths, spectra, n_samples=3, flux_errors=np.zeros_like(spectra))
+    assert percentiles.shape == (3, *spectra.shape)
+    for values in percentiles:
+        np.testing.assert_array_equal(values, continuum)
+
+
+def test_bootstrap_percentiles(synthetic_spectra) -> None:
+    wavelengths, spectra = synthetic_spectra
+    low, median, high = run_bootstrap(wavelengths, spectra, n_samples=20, seed=3)
+    valid = np.isfinite(median)
+    assert valid.mean() > 0.9
+    assert (low[valid] <= median[valid]).all()
+    assert (median[valid] <= high[valid]).all()
+    assert (high[valid] > low[valid]).any()
+
+    np.testing.assert_array_equal(run_bootstrap(wavelengths, spectra, n_samples=20, seed=3)[1], median)
+    parallel = run_bootstrap(
+        wavelengths, spectra, n_samples=20, seed=3, user_config={**CONFIGS, "parallel_orders": True, "Ncores": 2}
+    )
+    np.testing.assert_array_equal(parallel[1], median)
+
+
+def test_bootstrap_failed_order(synthetic_spectra) -> None:
+    wavelengths, spectra = synthetic_spectra
+    spectra = np.vstack([spectra, np.zeros_like(spectra[0])])
+    wavelengths = np.vstack([wavelengths, wavelengths[0]])
+    percentiles = run_bootstrap(wavelengths, spectra, n_samples=2, percentiles=[50])
+    assert percentiles.shape == (1, *spectra.shape)
+    assert np.isnan(percentiles[0, -1]).all()
+    assert not np.isnan(percentiles[0, :-1]).all(axis=1).any()
+
+
+def test_bootstrap_stage_backends(synthetic_spectra) -> None:
+    wavelengths, spectra = synthetic_spectra
+    MAXIMA_CALLS.clear()
+    default = run_bootstrap(wavelengths, spectra, n_samples=3, seed=0)
+    counting = run_bootstrap(
+        wavelengths, spectra, n_samples=3, seed=0, user_config={**CONFIGS, "stage_backends": {"maxima": "counting"}}
+    )
+    # the maxima are found once per order, through the configured backend
+    assert len(MAXIMA_CALLS) == len(spectra)
+    np.testing.assert_array_equal(counting, default)
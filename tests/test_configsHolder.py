@@ -1,4 +1,5 @@
 # # pylint=disable
+from dataclasses import FrozenInstanceError
 from typing import Any
 
 import pytest
@@ -6,6 +7,7 @@ import pytest
 from SNT.utils.configs import ConfigHolder, UserParam
 from SNT.utils.exceptions import InvalidConfiguration
 from SNT.utils.parameter_validators import predefined_constraints
+from SNT.utils.SNT_configs import build_SNT_config, construct_SNT_configs
 
 
 def test_Params() -> None:
@@ -60,3 +62,39 @@ def test_Holder_updates() -> None:
     assert holder.get_current_value("foo") == 10
     holder.update_value("foo", 30)
     assert holder.get_current_value("foo") == 30
+
+
+def test_SNT_configs_do_not_leak() -> None:
+    updated = construct_SNT_configs({"radius_min": 5})
+    assert updated["radius_min"] == 5
+    assert construct_SNT_configs()["radius_min"] == 20
+
+
+def test_SNT_config_snapshot() -> None:
+    config = build_SNT_config({"radius_min": 5})
+    assert config.radius_min == 5
+    assert config["radius_min"] == 5
+    assert build_SNT_config({"radius_min": 5}) is config
+    assert build_SNT_config().radius_min == 20
+
+    with pytest.raises(FrozenInstanceError):
+        config.radius_min = 10
+    hash(config)
+
+
+@pytest.mark.parametrize(
+    "user_configs",
+    [
+        {"radius_min": -5},
+        {"use_RIC": 1},
+        {"radius_min": 5.0},
+        {"Ncores": 2.5},
+        {"Ncores": 0},
+        {"Ncores": True},
+        {"parallel_orders": "yes"},
+    ],
+)
+def test_SNT_config_snapshot_validation(user_configs: dict) -> None:
+    build_SNT_config({"use_RIC": True, "radius_min": 5, "Ncores": "auto", "parallel_orders": "auto"})
+    with pytest.raises(InvalidConfiguration):
+        build_SNT_config(user_configs)
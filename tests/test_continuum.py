@@ -0,0 +1,40 @@
+import numpy as np
+
+from SNT import ContinuumModel, normalize_spectra
+from SNT.continuum import load_models
+
+
+def test_model_evaluation() -> None:
+    model = ContinuumModel([5000, 5050, 5100], [1, 2, 1], "linear")
+    assert model.wavelength_range == (5000, 5100)
+    np.testing.assert_allclose(model([5000, 5025, 5075]), [1, 1.5, 1.5])
+    assert np.isnan(model([4999])[0])
+
+    copy = ContinuumModel.from_dict(model.to_dict())
+    np.testing.assert_array_equal(copy.anchors_x, model.anchors_x)
+    assert copy.interp_type == model.interp_type
+
+
+def test_model_without_anchors() -> None:
+    # e.g. an order that failed or timed out
+    model = ContinuumModel([], [], "linear")
+    assert np.isnan(model.wavelength_range).all()
+    assert np.isnan(model([5000, 5050])).all()
+
+
+def test_model_output(synthetic_spectra, tmp_path) -> None:
+    wavelengths, spectra = synthetic_spectra
+    kwargs = dict(header={}, output_path=tmp_path, FWHM_override=7, fname="frame")
+
+    dense = normalize_spectra(wavelengths, spectra, user_config={"run_plot_generation": False}, **kwargs)
+    models = normalize_spectra(
+        wavelengths, spectra, user_config={"run_plot_generation": False, "continuum_output": "model"}, **kwargs
+    )
+    assert len(models) == wavelengths.shape[0]
+    for row, model in enumerate(models):
+        np.testing.assert_array_equal(model(wavelengths[row]), dense[row])
+
+    stored_models = load_models(tmp_path / "SNT_data" / "frame_continuum_models.json")
+    # on a different (finer) grid
+    fine_grid = np.linspace(wavelengths[0, 0], wavelengths[0, -1], 3 * wavelengths.shape[1])
+    np.testing.assert_array_equal(stored_models[0](fine_grid), models[0](fine_grid))
@@ -0,0 +1,323 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from SNT import normalize_spectra
+from SNT import snt
+from SNT.executors import (
+    FileQueueExecutor,
+    ProcessPool,
+    available_cores,
+    choose_workers,
+    dispatch,
+    pool_size,
+    run_worker,
+)
+from SNT.snt import estimate_order_cost
+
+CONFIGS = {"run_plot_generation": False}
+
+
+@pytest.fixture
+def file_executor(tmp_path):
+    executor = FileQueueExecutor(tmp_path / "queue", n_workers=2, poll_interval=0.01)
+    yield executor
+    executor.shutdown()
+
+
+def test_FileQueueExecutor_results(file_executor) -> None:
+    assert list(file_executor.map(pow, [2, 3, 4], [3, 2, 1])) == [8, 9, 4]
+
+
+def test_FileQueueExecutor_exceptions(file_executor) -> None:
+    with pytest.raises(ValueError):
+        file_executor.submit(int, "not a number").result()
+
+
+def test_FileQueueExecutor_after_shutdown(tmp_path) -> None:
+    executor = FileQueueExecutor(tmp_path / "queue", n_workers=1, poll_interval=0.01)
+    executor.shutdown()
+    with pytest.raises(RuntimeError):
+        executor.submit(pow, 2, 2)
+
+
+def test_FileQueueExecutor_cancelled_tasks(tmp_path) -> None:
+    # without workers, the tasks stay in the queue
+    executor = FileQueueExecutor(tmp_path / "queue", n_workers=0, poll_interval=0.01)
+    claimed = executor.submit(pow, 2, 3)
+    (task_path,) = (tmp_path / "queue" / "pending").glob("*.task")
+    # claimed by a (remote) worker that never answers
+    os.rename(task_path, tmp_path / "queue" / "running" / task_path.name)
+    executor.abort(claimed)
+
+    cancelled = executor.submit(pow, 2, 2)
+    assert cancelled.cancel()
+
+    started = time.monotonic()
+    executor.shutdown()
+    assert time.monotonic() - started < 5
+    assert not list((tmp_path / "queue" / "pending").glob("*.task"))
+
+
+def test_FileQueueExecutor_requeues_stale_tasks(tmp_path) -> None:
+    queue_dir = tmp_path / "queue"
+    executor = FileQueueExecutor(queue_dir, n_workers=0, poll_interval=0.01, lease_time=0.2)
+    future = executor.submit(pow, 2, 3)
+    (task_path,) = (queue_dir / "pending").glob("*.task")
+    # claimed by a worker that crashed
+    os.rename(task_path, queue_dir / "running" / task_path.name)
+    os.utime(queue_dir / "running" / task_path.name)
+
+    worker = threading.Thread(target=run_worker, args=(queue_dir, 0.01), daemon=True)
+    worker.start()
+    try:
+        assert future.result(timeout=10) == 8
+    finally:
+        executor.shutdown()
+        worker.join()
+
+
+def test_FileQueueExecutor_timeout(tmp_path) -> None:
+    executor = FileQueueExecutor(tmp_path / "queue", n_workers=1, poll_interval=0.01)
+    try:
+        # the quick units wait for the only worker, which is stuck in the first unit for a while
+        results, errors = dispatch(executor, time.sleep, [(1.5,), (0,), (0,)], timeout=1)
+    finally:
+        executor.shutdown()
+    assert list(errors) == [0]
+    assert results[1:] == [None, None]
+
+
+def test_worker_command(tmp_path) -> None:
+    executor = FileQueueExecutor(tmp_path / "queue", n_workers=0, poll_interval=0.01)
+    worker = subprocess.Popen(
+        [sys.executable, "-W", "error::RuntimeWarning", "-m", "SNT.worker", str(tmp_path / "queue")],
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    try:
+        assert executor.submit(pow, 2, 3).result(timeout=30) == 8
+    finally:
+        executor.shutdown()
+        _, stderr = worker.communicate(timeout=30)
+    assert worker.returncode == 0
+    assert "RuntimeWarning" not in stderr
+
+
+def test_normalization_with_executor(synthetic_spectra, file_executor, tmp_path) -> None:
+    wavelengths, spectra = synthetic_spectra
+    kwargs = dict(header={}, output_path=tmp_path, user_config=CONFIGS, FWHM_override=7, store_to_disk=False)
+
+    serial = normalize_spectra(wavelengths, spectra, **kwargs)
+    distributed = normalize_spectra(wavelengths, spectra, executor=file_executor, **kwargs)
+    np.testing.assert_array_equal(serial, distributed)
+
+
+def test_dispatch_isolates_failures() -> None:
+    with ProcessPool(2) as pool:
+        results, errors = dispatch(pool, int, [("1",), ("not a number",), ("3",)])
+    assert results == [1, None, 3]
+    assert list(errors) == [1]
+    assert isinstance(errors[1], ValueError)
+
+
+def test_dispatch_timeout() -> None:
+    pool = ProcessPool(2)
+    try:
+        results, errors = dispatch(pool, time.sleep, [(0,), (30,), (0,)], max_in_flight=2, timeout=0.5)
+    finally:
+        pool.terminate()
+    assert list(errors) == [1]
+    assert isinstance(errors[1], TimeoutError)
+
+
+@pytest.mark.parametrize("max_in_flight", [None, 1])
+def test_dispatch_timeout_of_queued_units(max_in_flight: int | None) -> None:
+    # the stuck unit holds the only worker, until it is replaced
+    pool = ProcessPool(1)
+    try:
+        results, errors = dispatch(
+            pool, time.sleep, [(30,), (0.3,), (0.3,), (0.3,)], max_in_flight=max_in_flight, timeout=1
+        )
+    finally:
+        pool.terminate()
+    assert list(errors) == [0]
+    assert isinstance(errors[0], TimeoutError)
+
+
+def test_ProcessPool_abort() -> None:
+    # the pool is closed without waiting for the stuck task
+    with ProcessPool(1) as pool:
+        stuck = pool.submit(time.sleep, 30)
+        while not stuck.running():
+            time.sleep(0.01)
+        pool.abort(stuck)
+        assert pool.submit(pow, 2, 3).result(timeout=10) == 8
+
+
+def test_ProcessPool_shutdown_cancel_futures() -> None:
+    pool = ProcessPool(1)
+    running = pool.submit(time.sleep, 30)
+    pending = pool.submit(pow, 2, 3)
+    while not running.running():
+        time.sleep(0.01)
+    pool.shutdown(cancel_futures=True)
+    assert pending.cancelled()
+    with pytest.raises(CancelledError):
+        running.result(timeout=1)
+
+
+@pytest.mark.parametrize("parallel", [False, True])
+def test_failed_order(synthetic_spectra, tmp_path, parallel: bool) -> None:
+    wavelengths, spectra = synthetic_spectra
+    spectra = np.vstack([spectra, np.zeros_like(spectra[0])])
+    wavelengths = np.vstack([wavelengths, wavelengths[0]])
+    configs = {**CONFIGS, "parallel_orders": parallel, "Ncores": 2}
+
+    continuum, byproducts = normalize_spectra(
+        wavelengths,
+        spectra,
+        header={},
+        output_path=tmp_path,
+        user_config=configs,
+        FWHM_override=7,
+        store_to_disk=False,
+        return_byproducts=True,
+    )
+    assert np.isnan(continuum[-1]).all()
+    assert not np.isnan(continuum[:-1]).all(axis=1).any()
+    assert byproducts["error"][:-1] == [None, None]
+    assert "ValueError" in byproducts["error"][-1]
+
+
+def test_retry_failed_orders(synthetic_spectra, tmp_path) -> None:
+    wavelengths, spectra = synthetic_spectra
+    kwargs = dict(header={}, output_path=tmp_path, FWHM_override=7, store_to_disk=False, return_byproducts=True)
+    configs = {**CONFIGS, "parallel_orders": True, "Ncores": 2, "order_timeout": 1e-3}
+
+    continuum, byproducts = normalize_spectra(wavelengths, spectra, user_config=configs, **kwargs)
+    assert np.isnan(continuum).all()
+    assert all("TimeoutError" in error for error in byproducts["error"])
+
+    continuum, byproducts = normalize_spectra(
+        wavelengths, spectra, user_config=configs, retry_config={"order_timeout": 0}, **kwargs
+    )
+    serial = normalize_spectra(wavelengths, spectra, user_config=CONFIGS, **kwargs)[0]
+    np.testing.assert_array_equal(continuum, serial)
+    assert byproducts["retried"] == [True, True]
+    assert byproducts["error"] == [None, None]
+
+
+class RecordingExecutor(ThreadPoolExecutor):
+    def __init__(self) -> None:
+        super().__init__(max_workers=1)
+        self.submitted = []
+
+    def submit(self, fn, /, *args, **kwargs):
+        self.submitted.append(args)
+        return super().submit(fn, *args, **kwargs)
+
+
+def test_dispatch_most_expensive_first() -> None:
+    with RecordingExecutor() as executor:
+        results, errors = dispatch(executor, abs, [(-1,), (-2,), (-3,)], max_in_flight=1, costs=[1, 3, 2])
+    assert results == [1, 2, 3]
+    assert not errors
+    assert executor.submitted == [(-2,), (-3,), (-1,)]
+
+
+def test_estimate_order_cost() -> None:
+    rng = np.random.default_rng(0)
+    smooth = np.ones(1000)
+    noisy = 1 + 0.01 * rng.standard_normal(1000)
+    assert estimate_order_cost(noisy) > estimate_order_cost(smooth)
+    assert estimate_order_cost(np.concatenate([smooth, np.zeros(500)])) == estimate_order_cost(smooth)
+    assert estimate_order_cost(np.ones(2000)) > estimate_order_cost(smooth)
+
+
+def test_choose_workers() -> None:
+    # the pool doesn't pay off for small frames
+    assert choose_workers(0.05, n_units=50, max_workers=8, startup_time=0.1) == 1
+    assert choose_workers(100, n_units=50, max_workers=1, startup_time=0.1) == 1
+    # bounded by the cores, the units and the startup cost of each worker
+    assert choose_workers(100, n_units=50, max_workers=8, startup_time=0.1) == 8
+    assert choose_workers(100, n_units=3, max_workers=8, startup_time=0.1) == 3
+    assert choose_workers(1.6, n_units=50, max_workers=8, startup_time=0.1) == 4
+
+    assert pool_size("auto") == available_cores() >= 1
+    assert pool_size(3) == 3
+
+
+@pytest.mark.parametrize("n_workers", [1, 2])
+def test_auto_parallel_orders(synthetic_spectra, tmp_path, monkeypatch, n_workers: int) -> None:
+    wavelengths, spectra = synthetic_spectra
+    spectra = np.vstack([spectra, np.zeros_like(spectra[0])])
+    wavelengths = np.vstack([wavelengths, wavelengths[0]])
+    kwargs = dict(header={}, output_path=tmp_path, FWHM_override=7, store_to_disk=False, return_byproducts=True)
+    serial, serial_byproducts = normalize_spectra(wavelengths, spectra, user_config=CONFIGS, **kwargs)
+    assert serial_byproducts["resources"]["workers"] == 1
+
+    # the choice depends on the machine, so it is forced here
+    probes = []
+
+    def choose(serial_time, n_units, max_workers):
+        probes.append((n_units, max_workers))
+        return n_workers
+
+    monkeypatch.setattr(snt, "choose_workers", choose)
+    configs = {**CONFIGS, "parallel_orders": "auto", "Ncores": "auto"}
+    continuum, byproducts = normalize_spectra(wavelengths, spectra, user_config=configs, **kwargs)
+    assert probes == [(len(spectra) - 1, available_cores())]
+    np.testing.assert_array_equal(continuum, serial)
+    assert byproducts["workers"] == [n_workers] * len(spectra)
+    assert byproducts["resources"]["workers"] == n_workers
+    assert byproducts["error"][:-1] == [None, None]
+    assert "ValueError" in byproducts["error"][-1]
+
+
+def test_auto_parallel_orders_timeout(synthetic_spectra, tmp_path) -> None:
+    # the stuck probe order is stopped, and the other orders are also run with the timeout
+    wavelengths, spectra = synthetic_spectra
+    spectra = np.vstack([spectra, spectra[0]])
+    wavelengths = np.vstack([wavelengths, wavelengths[0]])
+    configs = {**CONFIGS, "parallel_orders": "auto", "order_timeout": 2, "stage_backends": {"smooth": "stuck"}}
+    continuum, byproducts = normalize_spectra(
+        wavelengths,
+        spectra,
+        header={},
+        output_path=tmp_path,
+        user_config=configs,
+        FWHM_override=7,
+        store_to_disk=False,
+        return_byproducts=True,
+    )
+    assert np.isnan(continuum).all()
+    assert all("TimeoutError" in error for error in byproducts["error"])
+    assert byproducts["workers"] == [available_cores()] * len(spectra)
+
+
+def test_all_cores(synthetic_spectra, tmp_path, monkeypatch) -> None:
+    # Ncores="auto" is a number of workers, only parallel_orders="auto" runs the probe order
+    def choose(serial_time, n_units, max_workers):
+        raise AssertionError("The probe order should not run")
+
+    monkeypatch.setattr(snt, "choose_workers", choose)
+    wavelengths, spectra = synthetic_spectra
+    configs = {**CONFIGS, "parallel_orders": True, "Ncores": "auto"}
+    _, byproducts = normalize_spectra(
+        wavelengths,
+        spectra,
+        header={},
+        output_path=tmp_path,
+        user_config=configs,
+        FWHM_override=7,
+        store_to_disk=False,
+        return_byproducts=True,
+    )
+    assert byproducts["workers"] == [available_cores()] * len(spectra)
@@ -0,0 +1,49 @@
+import time
+
+import numpy as np
+import pytest
+
+from conftest import StubDataClass, StubFrame
+from SNT import normalize_sBART_frames, normalize_sBART_object
+
+CONFIGS = {"run_plot_generation": False}
+
+
+@pytest.mark.parametrize("parallel", [False, True])
+def test_sBART_frames(tmp_path, parallel: bool) -> None:
+    configs = {**CONFIGS, "parallel_orders": parallel, "Ncores": 2}
+    frames = [StubFrame("first", seed=0), StubFrame("second", seed=1)]
+
+    continua = normalize_sBART_frames(frames, tmp_path, configs, store_to_disk=False)
+    for frame, continuum in zip(frames, continua):
+        assert frame.data_requests == 1
+        assert frame.continuum is continuum
+        expected = normalize_sBART_object(StubFrame(frame.fname, seed=frame.seed), tmp_path, CONFIGS, False)
+        np.testing.assert_array_equal(continuum, expected)
+
+
+def test_sBART_DataClass(tmp_path) -> None:
+    data = StubDataClass(n_frames=2)
+    continua = normalize_sBART_frames(data, tmp_path, CONFIGS, store_to_disk=True, attribute="SNT_continuum")
+    assert len(continua) == 2
+    for frame_ID, frame in data.frames.items():
+        assert frame.SNT_continuum is continua[frame_ID]
+        assert (tmp_path / "SNT_data" / f"frame_{frame_ID}_continuum.txt").exists()
+
+
+def test_sBART_frames_timeout(tmp_path) -> None:
+    configs = {
+        **CONFIGS,
+        "parallel_orders": True,
+        "Ncores": 2,
+        "order_timeout": 0.5,
+        "stage_backends": {"smooth": "stuck"},
+    }
+    frames = [StubFrame("first", seed=0), StubFrame("second", seed=1)]
+
+    started = time.monotonic()
+    continua = normalize_sBART_frames(frames, tmp_path, configs, store_to_disk=False)
+    # the stuck workers are replaced, instead of blocking the next frame and the shutdown of the pool
+    assert time.monotonic() - started < 20
+    for continuum in continua:
+        assert np.isnan(continuum).all()
@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+from scipy.interpolate import CubicSpline, interp1d
+
+from SNT import interpolators
+
+
+@pytest.mark.parametrize("n_anchors", [2, 3, 4, 5, 50])
+def test_cubic_spline(n_anchors: int) -> None:
+    rng = np.random.default_rng(n_anchors)
+    xs = np.sort(rng.uniform(5000, 5100, n_anchors))
+    ys = rng.normal(1000, 50, n_anchors)
+    wavelengths = np.linspace(4990, 5110, 2000)
+
+    expected = CubicSpline(xs, ys, bc_type="not-a-knot")(wavelengths)
+    np.testing.assert_allclose(interpolators.evaluate(xs, ys, wavelengths, "cubic"), expected, rtol=1e-10)
+
+
+def test_linear() -> None:
+    rng = np.random.default_rng(0)
+    xs = np.sort(rng.uniform(5000, 5100, 30))
+    ys = rng.normal(1000, 50, 30)
+    wavelengths = np.linspace(4990, 5110, 2000)
+
+    expected = interp1d(xs, ys, bounds_error=False, fill_value="nan")(wavelengths)
+    np.testing.assert_array_equal(interpolators.evaluate(xs, ys, wavelengths, "linear"), expected)
+
+
+def test_evaluate_orders() -> None:
+    wavelengths = np.array([np.linspace(5000, 5100, 500), np.linspace(5100, 5200, 500)])
+    anchors_x = [[5000, 5050, 5100], [5100, 5120, 5150, 5200]]
+    anchors_y = [[1, 2, 1], [3, 4, 5, 6]]
+
+    continuum = interpolators.evaluate_orders(anchors_x, anchors_y, wavelengths, "linear")
+    for row in range(2):
+        np.testing.assert_array_equal(continuum[row], np.interp(wavelengths[row], anchors_x[row], anchors_y[row]))
+
+
+def test_unknown_interpolation() -> None:
+    with pytest.raises(NotImplementedError):
+        interpolators.evaluate([1, 2], [1, 2], [1.5], "quadratic")
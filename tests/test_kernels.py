@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+from kernel_harness import (
+    GOLDEN_CONFIGS,
+    KERNELS,
+    anchors_rate,
+    corpus,
+    golden_rtol,
+    load_golden,
+    normalize_corpus_spectrum,
+    run_case,
+)
+from reference_kernels import interpolate
+
+from SNT.utils.SNT_configs import build_SNT_config
+
+
+@pytest.mark.parametrize("spectrum", list(corpus()))
+@pytest.mark.parametrize("case", KERNELS, ids=lambda case: case.name)
+def test_kernel_matches_reference(case, spectrum: str, record_property) -> None:
+    report = run_case(case, spectrum)
+    record_property("speedup", report.speedup)
+    assert report.passed, f"{case.name} differs from the reference by {report.max_difference} on {spectrum}"
+
+
+@pytest.mark.parametrize("config_name", list(GOLDEN_CONFIGS))
+@pytest.mark.parametrize("spectrum", list(corpus()))
+def test_golden_continuum(spectrum: str, config_name: str) -> None:
+    golden = load_golden()[spectrum][config_name]
+    rtol = golden_rtol(spectrum)
+    continuum, byproducts = normalize_corpus_spectrum(spectrum, config_name)
+    for key in ("anchors_x", "anchors_y"):
+        for expected, actual in zip(golden[key], byproducts[key]):
+            np.testing.assert_allclose(actual, expected, rtol=rtol)
+
+    wavelengths, _ = corpus()[spectrum]
+    interp_type = build_SNT_config(GOLDEN_CONFIGS[config_name]).interp
+    for row, (anchors_x, anchors_y) in enumerate(zip(golden["anchors_x"], golden["anchors_y"])):
+        if interp_type == "cubic":
+            expected = interpolate.CubicSpline(anchors_x, anchors_y, bc_type="not-a-knot")(wavelengths[row])
+        else:
+            expected = np.interp(wavelengths[row], anchors_x, anchors_y, left=np.nan, right=np.nan)
+        # the cubic spline amplifies the differences of the anchors between them
+        np.testing.assert_allclose(continuum[row], expected, rtol=max(10 * rtol, 1e-10))
+
+
+def test_anchors_rate() -> None:
+    assert anchors_rate("synthetic", repeats=1) > 0
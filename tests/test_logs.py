@@ -0,0 +1,79 @@
+import os
+import sys
+
+import pytest
+from loguru import logger
+
+from SNT import configure_logging, normalize_spectra, smooth
+from SNT.executors import ProcessPool
+from SNT.utils import logs
+
+
+@pytest.fixture
+def records(monkeypatch):
+    monkeypatch.setattr(logs, "_worker_level", logs._worker_level)
+    captured = []
+    yield captured
+    logger.remove()
+    logger.configure(extra={})
+    logger.add(sys.stderr)
+
+
+class CountingFloat(float):
+    formatted = 0
+
+    def __format__(self, format_spec: str) -> str:
+        CountingFloat.formatted += 1
+        return super().__format__(format_spec)
+
+
+@pytest.mark.parametrize("level", ["DEBUG", "INFO"])
+def test_level_gate(records, level: str) -> None:
+    configure_logging(level, sink=records.append)
+    CountingFloat.formatted = 0
+    anchors_x = [CountingFloat(value) for value in [0, 1, 2, 2.01, 3, 4, 5]]
+    anchors_y = [1.0] * len(anchors_x)
+    smooth.remove_close(anchors_y, anchors_x)
+
+    assert len(anchors_x) == 6
+    assert CountingFloat.formatted == (level == "DEBUG")
+    assert len(records) == (level == "DEBUG")
+
+
+def test_worker_logs_are_forwarded(synthetic_spectra, tmp_path, records) -> None:
+    configure_logging("INFO", sink=records.append)
+    wavelengths, spectra = synthetic_spectra
+    normalize_spectra(
+        wavelengths,
+        spectra,
+        header={},
+        output_path=tmp_path,
+        user_config={"run_plot_generation": False, "parallel_orders": True, "Ncores": 2, "max_anchor_iterations": 1},
+        FWHM_override=7,
+        store_to_disk=False,
+        fname="frame_1",
+    )
+
+    fallbacks = [message.record for message in records if "falling back" in message.record["message"]]
+    assert sorted(record["extra"]["order"] for record in fallbacks) == list(range(len(spectra)))
+    for record in fallbacks:
+        assert record["extra"]["frame"] == "frame_1"
+        assert record["extra"]["worker"] != os.getpid()
+        assert record["name"] == "SNT.snt"
+        assert "frame=frame_1 order=" in str(next(message for message in records if message.record is record))
+    # the records of the parent also have the frame
+    assert all(message.record["extra"]["frame"] == "frame_1" for message in records)
+    assert not any(message.record["level"].name == "DEBUG" for message in records)
+
+
+def log_messages() -> None:
+    logger.debug("debug from a worker")
+    logger.info("info from a worker")
+
+
+def test_default_worker_level(records) -> None:
+    # without configure_logging, the workers don't send their debug records
+    logger.add(records.append, level="DEBUG")
+    with ProcessPool(1) as pool:
+        pool.submit(log_messages).result()
+    assert [message.record["message"] for message in records] == ["info from a worker"]
@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from SNT import SpectralMask, normalize_spectra
+
+CONFIGS = {"run_plot_generation": False}
+
+
+def test_intervals() -> None:
+    mask = SpectralMask(intervals=[(5010, 5005), (5008, 5012), (5050, 5051)])
+    np.testing.assert_array_equal(mask.starts, [5005, 5050])
+    np.testing.assert_array_equal(mask.ends, [5012, 5051])
+
+    wavelengths = np.array([[5000, 5005, 5010, 5012, 5013, 5050.5, 5060]])
+    np.testing.assert_array_equal(mask.compile(wavelengths), [[True, False, False, False, True, False, True]])
+
+
+def test_pixel_mask() -> None:
+    wavelengths = np.linspace(5000, 5100, 20).reshape(2, 10)
+    pixel_mask = np.zeros(wavelengths.shape, dtype=bool)
+    pixel_mask[1, :3] = True
+    mask = SpectralMask(intervals=[(5000, 5010)], pixel_mask=pixel_mask)
+
+    valid = mask.compile(wavelengths)
+    assert not valid[0, :2].any()
+    assert valid[0, 2:].all()
+    assert not valid[1, :3].any()
+    assert valid[1, 3:].all()
+
+    with pytest.raises(ValueError):
+        mask.compile(wavelengths[:1])
+
+
+def test_compiled_mask_cache() -> None:
+    mask = SpectralMask(intervals=[(5000, 5010)], cache_size=1)
+    wavelengths = np.linspace(5000, 5100, 100)
+    assert mask.compile(wavelengths) is mask.compile(wavelengths.copy())
+    first = mask.compile(wavelengths)
+    mask.compile(wavelengths + 1)
+    assert mask.compile(wavelengths) is not first
+
+
+def test_from_file(tmp_path) -> None:
+    path = tmp_path / "tellurics.txt"
+    path.write_text("# start end depth\n5000 5001 0.3\n5002 5003 0.1\n")
+    mask = SpectralMask.from_file(path)
+    np.testing.assert_array_equal(mask.starts, [5000, 5002])
+
+
+def test_masked_normalization(synthetic_spectra, tmp_path) -> None:
+    wavelengths, spectra = synthetic_spectra
+    kwargs = dict(header={}, output_path=tmp_path, user_config=CONFIGS, FWHM_override=7, store_to_disk=False)
+    interval = (wavelengths[0, 1000], wavelengths[0, 1500])
+
+    continuum, byproducts = normalize_spectra(wavelengths, spectra, mask=[interval], return_byproducts=True, **kwargs)
+    anchors_x = np.asarray(byproducts["anchors_x"][0])
+    assert not ((anchors_x >= interval[0]) & (anchors_x <= interval[1])).any()
+    assert np.isfinite(continuum[0, 1000:1500]).all()
+
+    zeroed = spectra.copy()
+    zeroed[0, 1000:1501] = 0
+    np.testing.assert_array_equal(continuum, normalize_spectra(wavelengths, zeroed, **kwargs))
+
+    pixel_mask = np.zeros(spectra.shape, dtype=bool)
+    pixel_mask[0, 1000:1501] = True
+    np.testing.assert_array_equal(continuum, normalize_spectra(wavelengths, spectra, mask=pixel_mask, **kwargs))
@@ -0,0 +1,227 @@
+import numpy as np
+import pytest
+
+from conftest import make_synthetic_spectra
+from SNT import normalize_spectra, penalty
+from SNT.snt import CLIP_WINDOW, SAVGOL_WINDOW, load_anchors, normalize_row, order_windows, warm_start_row
+from SNT.utils.SNT_configs import build_SNT_config
+
+
+def run_normalization(wavelengths, spectra, tmp_path, **user_config):
+    user_config.setdefault("run_plot_generation", False)
+    return normalize_spectra(
+        wavelengths,
+        spectra,
+        header={},
+        output_path=tmp_path,
+        user_config=user_config,
+        FWHM_override=7,
+        store_to_disk=False,
+    )
+
+
+def test_fixed_windows() -> None:
+    wavelengths = np.linspace(5000, 5100, 4000)
+    FWHM_WL, clip_window, savgol_window = order_windows(wavelengths, FWHM=7)
+    assert FWHM_WL == pytest.approx(5000 * 7 / 299792.458)
+    assert (clip_window, savgol_window) == (CLIP_WINDOW, SAVGOL_WINDOW)
+
+
+@pytest.mark.parametrize("n_pixels", [1000, 4000, 20000])
+def test_adaptive_windows(n_pixels: int) -> None:
+    wavelengths = np.linspace(5000, 5100, n_pixels)
+    _, clip_window, savgol_window = order_windows(wavelengths, FWHM=7, adaptive=True)
+    _, finer_clip_window, finer_savgol_window = order_windows(
+        np.linspace(5000, 5100, 2 * n_pixels), FWHM=7, adaptive=True
+    )
+    assert savgol_window % 2 == 1
+    assert finer_clip_window >= clip_window
+    assert finer_savgol_window >= savgol_window
+
+
+def test_adaptive_windows_continuum(synthetic_spectra, tmp_path) -> None:
+    wavelengths, spectra = synthetic_spectra
+    reference = run_normalization(wavelengths, spectra, tmp_path)
+    adaptive = run_normalization(wavelengths, spectra, tmp_path, adaptive_windows=True)
+    assert np.nanmedian(np.abs(adaptive / reference - 1)) < 0.02
+
+
+def test_coarse_anchor_search(synthetic_spectra, tmp_path) -> None:
+    wavelengths, spectra = synthetic_spectra
+    reference = run_normalization(wavelengths, spectra, tmp_path)
+    coarse = run_normalization(wavelengths, spectra, tmp_path, coarse_anchor_search=True)
+    assert np.nanmax(np.abs(coarse / reference - 1)) < 0.03
+    np.testing.assert_array_equal(np.isnan(coarse), np.isnan(reference))
+
+    # the coarse continuum is further than this from the maxima, so the full search is used instead
+    strict = run_normalization(wavelengths, spectra, tmp_path, coarse_anchor_search=True, coarse_tolerance=1e-4)
+    np.testing.assert_array_equal(strict, reference)
+
+
+def test_float32_mode(synthetic_spectra, tmp_path) -> None:
+    wavelengths, spectra = synthetic_spectra
+    reference = run_normalization(wavelengths, spectra, tmp_path)
+    single = run_normalization(wavelengths, spectra.astype(np.float32), tmp_path, dtype="float32")
+    assert single.dtype == np.float32
+    assert np.nanmax(np.abs(single / reference - 1)) < 1e-3
+
+
+def test_float32_mode_storage(synthetic_spectra, tmp_path) -> None:
+    wavelengths, spectra = synthetic_spectra
+    normalize_spectra(
+        wavelengths,
+        spectra,
+        header={},
+        output_path=tmp_path,
+        user_config={"dtype": "float32", "run_plot_generation": False},
+        FWHM_override=7,
+        fname="single",
+    )
+    assert (tmp_path / "SNT_data" / "single_anchors.csv").exists()
+
+
+def test_warm_start(synthetic_spectra, tmp_path) -> None:
+    wavelengths, spectra = synthetic_spectra
+    normalize_spectra(
+        wavelengths,
+        spectra,
+        header={},
+        output_path=tmp_path,
+        user_config={"run_plot_generation": False},
+        FWHM_override=7,
+        fname="reference",
+    )
+    anchors_path = tmp_path / "SNT_data" / "reference_anchors.csv"
+
+    new_wavelengths, new_spectra = make_synthetic_spectra(velocity=5, scale=0.8)
+    full = run_normalization(new_wavelengths, new_spectra, tmp_path)
+    warm = normalize_spectra(
+        new_wavelengths,
+        new_spectra,
+        header={},
+        output_path=tmp_path,
+        user_config={"run_plot_generation": False},
+        FWHM_override=7,
+        store_to_disk=False,
+        reference_anchors=anchors_path,
+        doppler_shift=5,
+    )
+    assert np.nanmedian(np.abs(warm / full - 1)) < 0.005
+
+    reference = load_anchors(anchors_path)
+    config = build_SNT_config()
+    _, fit_metrics = warm_start_row(
+        new_wavelengths[0], new_spectra[0], 7, config, reference["anchors_x"][0], reference["anchors_y"][0], 5
+    )
+    assert fit_metrics["warm_start"]
+
+    # the shape of the continuum changed, the order must be normalized from scratch
+    tilted_spectra = new_spectra[0] * np.linspace(1, 1.5, new_spectra.shape[1])
+    _, fit_metrics = warm_start_row(
+        new_wavelengths[0], tilted_spectra, 7, config, reference["anchors_x"][0], reference["anchors_y"][0], 5
+    )
+    assert not fit_metrics["warm_start"]
+    assert len(fit_metrics["max_pos"]) > 0
+
+
+def test_rolling_max_with_gaps() -> None:
+    xs = np.concatenate([np.linspace(0, 10, 200), np.linspace(500, 510, 200)])
+    ys = np.random.default_rng(0).normal(size=xs.size)
+
+    indices = penalty.rolling_max_indices(ys, xs, 0.5)
+    edges = np.arange(0, 520, 0.5)
+    # one maximum for each (non-empty) window, ignoring the last point (as in rolling_max)
+    expected = [
+        start + np.argmax(ys[start:stop])
+        for start, stop in zip(np.searchsorted(xs[:-1], edges), np.searchsorted(xs[:-1], edges + 0.5))
+        if stop > start
+    ]
+    assert indices == expected
+
+
+def test_gapped_order(tmp_path) -> None:
+    wavelengths, spectra = make_synthetic_spectra(n_orders=1, n_pixels=8000)
+    spectra[0, 1500:6500] = 0
+    continuum = run_normalization(wavelengths, spectra, tmp_path)
+    assert np.isfinite(continuum[0, 1000]) and np.isfinite(continuum[0, 7000])
+
+
+@pytest.mark.parametrize("budget", [{"max_anchor_iterations": 1}, {"order_time_budget": 1e-9}])
+def test_anchor_budgets(synthetic_spectra, budget: dict) -> None:
+    wavelengths, spectra = synthetic_spectra
+    continuum, fit_metrics = normalize_row(wavelengths[0], spectra[0], 7, config=build_SNT_config(budget))
+    assert fit_metrics["fallback"]
+    assert np.count_nonzero(np.isfinite(continuum)) > 0.9 * continuum.size
+
+    _, fit_metrics = normalize_row(wavelengths[0], spectra[0], 7, config=build_SNT_config())
+    assert not fit_metrics["fallback"]
+
+
+def test_resource_report(synthetic_spectra, tmp_path) -> None:
+    wavelengths, spectra = synthetic_spectra
+    _, byproducts = normalize_spectra(
+        wavelengths,
+        spectra,
+        header={},
+        output_path=tmp_path,
+        user_config={"run_plot_generation": False},
+        FWHM_override=7,
+        fname="frame",
+        return_byproducts=True,
+    )
+    report = byproducts["resources"]
+    assert report["wall_time"] > 0
+    assert report["orders_cpu_time"] > 0
+    assert report["parent_peak_rss"] > 0
+    assert report["worker_peak_rss"] > 0
+    assert report["anchors_per_order"] == [len(anchors) for anchors in byproducts["anchors_x"]]
+    assert report["maxima_per_order"] == [len(maxima) for maxima in byproducts["max_pos"]]
+    assert report["artifacts"] == {
+        "anchors": (tmp_path / "SNT_data" / "frame_anchors.csv").stat().st_size,
+        "continuum": (tmp_path / "SNT_data" / "frame_continuum.txt").stat().st_size,
+    }
+    assert len(byproducts["cpu_time"]) == len(spectra)
+
+
+@pytest.mark.parametrize("batch_preprocessing", [True, False])
+def test_warm_start_batch(synthetic_spectra, tmp_path, batch_preprocessing) -> None:
+    wavelengths, spectra = synthetic_spectra
+    normalize_spectra(
+        wavelengths,
+        spectra,
+        header={},
+        output_path=tmp_path,
+        user_config={"run_plot_generation": False},
+        FWHM_override=7,
+        fname="reference",
+    )
+    anchors_path = tmp_path / "SNT_data" / "reference_anchors.csv"
+
+    # the last order must fall back to the full fit, from the same preprocessed arrays
+    new_wavelengths, new_spectra = make_synthetic_spectra(velocity=5, scale=0.8)
+    new_spectra[-1] *= np.linspace(1, 1.5, new_spectra.shape[1])
+    warm = normalize_spectra(
+        new_wavelengths,
+        new_spectra,
+        header={},
+        output_path=tmp_path,
+        user_config={"run_plot_generation": False, "batch_preprocessing": batch_preprocessing},
+        FWHM_override=7,
+        store_to_disk=False,
+        reference_anchors=anchors_path,
+        doppler_shift=5,
+    )
+
+    reference = load_anchors(anchors_path)
+    config = build_SNT_config()
+    for order in range(new_spectra.shape[0]):
+        continuum, _ = warm_start_row(
+            new_wavelengths[order],
+            new_spectra[order],
+            7,
+            config,
+            reference["anchors_x"][order],
+            reference["anchors_y"][order],
+            5,
+        )
+        np.testing.assert_allclose(warm[order], continuum, rtol=1e-12)
@@ -95,6 +95,26 @@ def test_sum_of_conds(test_input: Any, include_edges: bool, expectation: Abstrac
         validator.check_if_value_meets_constraint("foo", test_input)
 
 
+@pytest.mark.parametrize(
+    "test_input,expectation",
+    [
+        (2, nullcontext()),
+        ("auto", nullcontext()),
+        (0, pytest.raises(InvalidConfiguration)),
+        (2.5, pytest.raises(InvalidConfiguration)),
+        (True, pytest.raises(InvalidConfiguration)),
+        ("all", pytest.raises(InvalidConfiguration)),
+    ],
+)
+def test_either_cond(test_input: Any, expectation: AbstractContextManager) -> None:
+    with expectation as e:
+        validator = (
+            parameter_validators.ValueFromDtype((int,))
+            + parameter_validators.ValueInInterval(interval=(1, 5), include_edges=True)
+        ) | parameter_validators.ValueFromList(["auto"])
+        validator.check_if_value_meets_constraint("foo", test_input)
+
+
 @pytest.mark.parametrize(
     "test_input,expectation",
     [
@@ -0,0 +1,100 @@
+import numpy as np
+import pytest
+
+from SNT import normalize_spectra, pipeline
+from SNT.snt import _smooth_stage
+from SNT.utils.exceptions import InvalidConfiguration
+from SNT.utils.SNT_configs import build_SNT_config
+
+CONFIGS = {"run_plot_generation": False}
+CALLS = []
+
+
+@pipeline.register_backend("smooth", "counting")
+def counting_smooth(data, config):
+    CALLS.append(len(data["flux"]))
+    return _smooth_stage(data, config)
+
+
+@pipeline.register_backend("smooth", "identity")
+def identity_smooth(data, config):
+    return {"flux": data["flux"]}
+
+
+@pipeline.register_backend("continuum", "flat")
+def flat_continuum(data, config):
+    return {"continuum": np.ones_like(data["wavelengths"])}
+
+
+def run_normalization(wavelengths, spectra, tmp_path, **user_config):
+    return normalize_spectra(
+        wavelengths,
+        spectra,
+        header={},
+        output_path=tmp_path,
+        user_config={**CONFIGS, **user_config},
+        FWHM_override=7,
+        store_to_disk=False,
+    )
+
+
+def test_default_backends() -> None:
+    for stage in pipeline.STAGES.values():
+        assert pipeline.DEFAULT_BACKEND in stage.backends
+    assert [name for name, stage in pipeline.STAGES.items() if stage.skippable] == ["sigma_clip", "smooth", "outliers"]
+    with pytest.raises(KeyError):
+        pipeline.register_backend("not_a_stage")
+
+
+def test_stage_backends(synthetic_spectra, tmp_path) -> None:
+    wavelengths, spectra = synthetic_spectra
+    default = run_normalization(wavelengths, spectra, tmp_path)
+    counting = run_normalization(wavelengths, spectra, tmp_path, stage_backends={"smooth": "counting"})
+    np.testing.assert_array_equal(counting, default)
+
+    unfiltered = run_normalization(wavelengths, spectra, tmp_path, usefilter=False)
+    assert not np.array_equal(unfiltered, default, equal_nan=True)
+    for user_config in [{"stage_backends": {"smooth": "identity"}}, {"skip_stages": ["smooth"]}]:
+        np.testing.assert_array_equal(run_normalization(wavelengths, spectra, tmp_path, **user_config), unfiltered)
+        # the batch only replaces the default stages
+        batched = run_normalization(wavelengths, spectra, tmp_path, batch_preprocessing=True, **user_config)
+        np.testing.assert_array_equal(batched, unfiltered)
+
+    # the continuum of all orders is only evaluated at once with the default backend
+    flat = run_normalization(wavelengths, spectra, tmp_path, stage_backends={"continuum": "flat"})
+    np.testing.assert_array_equal(flat, np.ones_like(spectra))
+
+
+def test_invalid_stages(synthetic_spectra, tmp_path) -> None:
+    wavelengths, spectra = synthetic_spectra
+    with pytest.raises(InvalidConfiguration):
+        build_SNT_config({"skip_stages": ["anchors"]})
+    with pytest.raises(InvalidConfiguration):
+        build_SNT_config({"cached_stages": ["not_a_stage"]})
+    with pytest.raises(InvalidConfiguration):
+        build_SNT_config({"stage_backends": {"not_a_stage": "default"}})
+    with pytest.raises(InvalidConfiguration):
+        build_SNT_config({"stage_backends": [("smooth", "identity", "extra")]})
+
+    # checked before any order runs
+    with pytest.raises(InvalidConfiguration):
+        run_normalization(wavelengths, spectra, tmp_path, stage_backends={"smooth": "not_a_backend"})
+
+
+def test_cached_stages(synthetic_spectra, tmp_path) -> None:
+    wavelengths, spectra = synthetic_spectra
+    pipeline.clear_cache()
+    CALLS.clear()
+    user_config = {"stage_backends": {"smooth": "counting"}, "cached_stages": ["smooth"]}
+    first = run_normalization(wavelengths, spectra, tmp_path, **user_config)
+    assert len(CALLS) == len(spectra)
+
+    # the smoothed flux doesn't depend on the alpha shape radius
+    second = run_normalization(wavelengths, spectra, tmp_path, radius_min=25, **user_config)
+    assert len(CALLS) == len(spectra)
+    np.testing.assert_array_equal(second, run_normalization(wavelengths, spectra, tmp_path, radius_min=25))
+
+    np.testing.assert_array_equal(run_normalization(wavelengths, spectra, tmp_path, **user_config), first)
+    pipeline.clear_cache()
+    run_normalization(wavelengths, spectra, tmp_path, **user_config)
+    assert len(CALLS) == 2 * len(spectra)
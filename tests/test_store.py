@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+from SNT import OrderStore, normalize_spectra
+from SNT.executors import ProcessPool
+
+CONFIGS = {"run_plot_generation": False}
+
+
+def _frame_arrays(seed: int, n_orders: int = 3) -> dict:
+    generator = np.random.default_rng(seed)
+    return {
+        "continuum": generator.normal(size=(n_orders, 50)),
+        "anchors_x": [generator.normal(size=order + 2) for order in range(n_orders)],
+    }
+
+
+def _write_frame(path, seed: int) -> int:
+    return OrderStore(path).append_frame(f"frame_{seed}", _frame_arrays(seed))
+
+
+def test_round_trip(tmp_path) -> None:
+    store = OrderStore(tmp_path / "store")
+    arrays = _frame_arrays(0)
+    n_bytes = store.append_frame("frame_0", arrays)
+    assert n_bytes == arrays["continuum"].nbytes + sum(values.nbytes for values in arrays["anchors_x"])
+
+    # a new reader, with an empty index
+    store = OrderStore(tmp_path / "store")
+    assert store.frames() == ["frame_0"]
+    assert ("frame_0", 2) in store and ("frame_0", 3) not in store
+    for order in range(3):
+        stored = store.read("frame_0", order)
+        assert np.array_equal(stored["continuum"], arrays["continuum"][order])
+        assert np.array_equal(stored["anchors_x"], arrays["anchors_x"][order])
+    assert list(store.read("frame_0", 1, names=["anchors_x"])) == ["anchors_x"]
+    with pytest.raises(KeyError):
+        store.read("frame_1", 0)
+
+
+def test_last_entry_is_used(tmp_path) -> None:
+    store = OrderStore(tmp_path)
+    store.append_frame("frame", _frame_arrays(0))
+    store.append_frame("frame", _frame_arrays(1))
+    assert store.frames() == ["frame"]
+    assert np.array_equal(store.read("frame", 0)["continuum"], _frame_arrays(1)["continuum"][0])
+
+
+def test_partial_index_line(tmp_path) -> None:
+    store = OrderStore(tmp_path)
+    store.append_frame("frame", _frame_arrays(0))
+    with open(tmp_path / "index.jsonl", mode="a") as index_file:
+        index_file.write('{"frame": "other", "ord')
+    assert OrderStore(tmp_path).frames() == ["frame"]
+
+
+def test_concurrent_writers(tmp_path) -> None:
+    seeds = list(range(6))
+    with ProcessPool(3) as pool:
+        sizes = list(pool.map(_write_frame, [tmp_path] * len(seeds), seeds))
+    assert sum(sizes) == (tmp_path / "data.bin").stat().st_size
+
+    store = OrderStore(tmp_path)
+    assert sorted(store.frames()) == [f"frame_{seed}" for seed in seeds]
+    for seed in seeds:
+        assert np.array_equal(store.read(f"frame_{seed}", 1)["anchors_x"], _frame_arrays(seed)["anchors_x"][1])
+    assert len(store.read_order(0)) == len(seeds)
+
+
+def test_normalization_with_store(synthetic_spectra, tmp_path) -> None:
+    wavelengths, spectra = synthetic_spectra
+    kwargs = dict(header={}, output_path=tmp_path, user_config=CONFIGS, FWHM_override=7, fname="frame")
+    continuum, byproducts = normalize_spectra(
+        wavelengths, spectra, order_store=tmp_path / "store", return_byproducts=True, **kwargs
+    )
+    assert not (tmp_path / "SNT_data" / "frame_continuum.txt").exists()
+    assert byproducts["resources"]["artifacts"]["order_store"] > 0
+
+    store = OrderStore(tmp_path / "store")
+    for order in range(spectra.shape[0]):
+        stored = store.read("frame", order)
+        assert np.array_equal(stored["continuum"], continuum[order], equal_nan=True)
+        assert np.array_equal(stored["wavelengths"], wavelengths[order])
+        assert np.array_equal(stored["anchors_x"], byproducts["anchors_x"][order])